@@ -0,0 +1,131 @@
+"""Cold-start benchmark of the main handler against the fixture events.
+
+Every sample runs in a fresh interpreter. It measures the handler import, the first invocation and a warm
+invocation, and whether boto3 got imported. Filtered events (regional ALB, HALT_PROCESSING) run without AWS.
+Applied events run against moto. moto imports boto3 before the handler does, so their first invocation does
+not include the boto3 import; `message_processing import` shows what the old eager import cost. The poller's
+initial delay is disabled so the wait on moto's instant INSYNC does not hide the cold start.
+
+    python benchmarks/bench_cold_start.py --runs 5
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+FIXTURES = os.path.join(ROOT, "tests", "test-files")
+
+# (label, fixture, extra environment, needs AWS)
+SCENARIOS = [
+    ("regional alb (filtered)", "eventbridge.regional.alb.event.json", {}, False),
+    ("halt processing (filtered)", "eventbridge.create.event.json", {"HALT_PROCESSING": "1"}, False),
+    ("create (applied)", "eventbridge.create.event.json", {}, True),
+    ("delete (applied)", "eventbridge.delete.event.json", {}, True),
+]
+
+
+class _Context:
+    """Lambda context with the full 900 seconds left."""
+    invoked_function_arn = "arn:aws:lambda:us-east-1:111111111111:function:bench"
+
+    def get_remaining_time_in_millis(self):
+        return 900000
+
+
+def _child(fixture: str, needs_aws: bool, module: str = None):
+    """Measure one cold start in this fresh interpreter and print it as JSON."""
+    sys.path.insert(0, os.path.join(ROOT, "src"))
+    os.environ.update({
+        "AWS_ACCESS_KEY_ID": "bench",
+        "AWS_SECRET_ACCESS_KEY": "bench",
+        "AWS_DEFAULT_REGION": "us-east-1",
+        "ASSUME_ROLE_ARN": "arn:aws:iam::111111111111:role/bench",
+        "COMPANY_DOMAIN_FILTER": "api.test.io",
+        "CHANGE_POLL_INITIAL_DELAY_SECONDS": "0",
+    })
+    if module is not None:
+        start = time.perf_counter()
+        __import__(module)
+        print(json.dumps({"import_ms": (time.perf_counter() - start) * 1000}))
+        return
+    if needs_aws:
+        import uuid
+
+        import boto3
+        import moto
+
+        moto.mock_route53().start()
+        moto.mock_sts().start()
+        zone = boto3.client("route53").create_hosted_zone(Name="api.test.io", CallerReference=str(uuid.uuid4()))
+        os.environ["DEST_HOSTED_ZONE_ID"] = zone["HostedZone"]["Id"].replace("/hostedzone/", "")
+    with open(os.path.join(FIXTURES, fixture)) as json_file:
+        event = json.load(json_file)
+
+    start = time.perf_counter()
+    import handler
+    imported = time.perf_counter()
+    handler.lambda_handler(json.loads(json.dumps(event)), _Context())
+    first = time.perf_counter()
+    handler.lambda_handler(json.loads(json.dumps(event)), _Context())
+    warm = time.perf_counter()
+    print(json.dumps({
+        "import_ms": (imported - start) * 1000,
+        "first_invocation_ms": (first - imported) * 1000,
+        "warm_invocation_ms": (warm - first) * 1000,
+        "boto3_loaded": "boto3" in sys.modules,
+        "message_processing_loaded": "message_processing" in sys.modules,
+    }))
+
+
+def _run_child(args: list, environment: dict) -> dict:
+    """Run one sample in a fresh interpreter and return its measurements."""
+    completed = subprocess.run([sys.executable, os.path.abspath(__file__), "--child"] + args,
+                               env={**os.environ, **environment},
+                               capture_output=True,
+                               text=True,
+                               check=True)
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def _median(samples: list, key: str) -> float:
+    """Return the median of a measurement over the samples."""
+    return round(statistics.median(sample[key] for sample in samples), 2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="fresh interpreters per scenario, medians are reported")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--fixture", help=argparse.SUPPRESS)
+    parser.add_argument("--needs-aws", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--module", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        _child(args.fixture, args.needs_aws, args.module)
+        return
+
+    results = []
+    for module in ["handler", "message_processing"]:
+        samples = [_run_child(["--module", module], {}) for _ in range(args.runs)]
+        results.append({"scenario": f"{module} import", "import_ms": _median(samples, "import_ms")})
+    for label, fixture, environment, needs_aws in SCENARIOS:
+        child_args = ["--fixture", fixture] + (["--needs-aws"] if needs_aws else [])
+        samples = [_run_child(child_args, environment) for _ in range(args.runs)]
+        results.append({
+            "scenario": label,
+            "import_ms": _median(samples, "import_ms"),
+            "first_invocation_ms": _median(samples, "first_invocation_ms"),
+            "warm_invocation_ms": _median(samples, "warm_invocation_ms"),
+            "boto3_loaded": samples[0]["boto3_loaded"],
+            "message_processing_loaded": samples[0]["message_processing_loaded"],
+        })
+    for result in results:
+        print(json.dumps(result))
+
+
+if __name__ == "__main__":
+    main()
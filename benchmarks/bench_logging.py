@@ -0,0 +1,97 @@
+"""Logging overhead of the change loop with LOG_MODE=verbose, the full event per change, against LOG_MODE=structured.
+
+Runs filter_event_changes, where every change is logged, over synthetic CloudTrail events with a formatting log
+handler writing to a byte counter, and reports the time and bytes logged per event of each mode as JSON.
+
+    python benchmarks/bench_logging.py --events 500 --changes-per-event 20 --output logging.json
+"""
+import argparse
+import io
+import json
+import logging
+import os
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.join(ROOT, "src"))
+sys.path.insert(0, ROOT)
+
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+
+import message_processing  # noqa: E402
+from benchmarks.cloudtrail_events import generate_events  # noqa: E402
+
+MODES = ("verbose", "structured")
+
+
+class _ByteCounter(io.TextIOBase):
+    """Stream counting the characters written to it."""
+    def __init__(self):
+        self.chars = 0
+
+    def write(self, text):
+        self.chars += len(text)
+        return len(text)
+
+
+def run_mode(mode: str, events: list, repeat: int) -> dict:
+    """Run the events through filter_event_changes in one log mode and return the best of repeat runs."""
+    os.environ["LOG_MODE"] = mode
+    counter = _ByteCounter()
+    log_handler = logging.StreamHandler(counter)
+    log_handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(message)s"))
+    root = logging.getLogger()
+    root.addHandler(log_handler)
+    try:
+        best = None
+        for _ in range(repeat):
+            counter.chars = 0
+            started = time.perf_counter()
+            for event in events:
+                message_processing.filter_event_changes(event, {})
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+            logged_chars = counter.chars
+    finally:
+        root.removeHandler(log_handler)
+    return {
+        "ms_per_event": round(best / len(events) * 1000, 4),
+        "log_bytes_per_event": round(logged_chars / len(events)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", type=int, default=500)
+    parser.add_argument("--changes-per-event", type=int, default=20)
+    parser.add_argument("--match-rate", type=float, default=0.9, help="share of names under --domain")
+    parser.add_argument("--domain", default="api.test.io")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="write the result JSON to this file")
+    args = parser.parse_args()
+
+    os.environ["COMPANY_DOMAIN_FILTER"] = args.domain
+    os.environ.setdefault("DEST_HOSTED_ZONE_ID", "ZBENCH")
+    logging.getLogger().setLevel(logging.INFO)
+    events = list(
+        generate_events(args.events, changes_per_event=args.changes_per_event, match_rate=args.match_rate,
+                        domain=args.domain, seed=args.seed))
+
+    result = {
+        "parameters": {key: value for key, value in vars(args).items() if key != "output"},
+        "modes": {mode: run_mode(mode, events, args.repeat) for mode in MODES},
+    }
+    verbose, structured = result["modes"]["verbose"], result["modes"]["structured"]
+    result["speedup"] = round(verbose["ms_per_event"] / structured["ms_per_event"], 1)
+    result["log_bytes_reduction"] = round(verbose["log_bytes_per_event"] / structured["log_bytes_per_event"], 1)
+    output = json.dumps(result, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w") as output_file:
+            output_file.write(output + "\n")
+
+
+if __name__ == "__main__":
+    main()
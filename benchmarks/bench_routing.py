@@ -0,0 +1,83 @@
+"""Micro-benchmark of routing lookups against thousands of domain suffixes.
+
+Compares the reversed-label trie with the per suffix endswith scan it replaces.
+
+    python benchmarks/bench_routing.py --suffixes 5000 --lookups 100000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+import routing  # noqa: E402
+
+
+def build_suffixes(count: int):
+    """Return count distinct company domain suffixes, some nested under others."""
+    suffixes = [f"api{i}.company{i % 50}.io" for i in range(count)]
+    suffixes += [f"company{i}.io" for i in range(50)]
+    return suffixes
+
+
+def build_names(suffixes, count: int, miss_rate: float):
+    """Return record names, miss_rate of them outside every suffix."""
+    rng = random.Random(42)
+    names = []
+    for i in range(count):
+        if rng.random() < miss_rate:
+            names.append(f"svc{i}.not-routed.example.com.")
+        else:
+            names.append(f"svc{i}.{rng.choice(suffixes)}.")
+    return names
+
+
+def linear_route(suffixes, name: str):
+    """The endswith scan, keeping the longest matching suffix."""
+    match = None
+    for suffix in suffixes:
+        if (name.endswith(suffix) or name.endswith(f"{suffix}.")) and (match is None or len(suffix) > len(match)):
+            match = suffix
+    return match
+
+
+def timed(func, names):
+    """Return the seconds to route every name."""
+    start = time.perf_counter()
+    for name in names:
+        func(name)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--suffixes", type=int, default=5000)
+    parser.add_argument("--lookups", type=int, default=100000)
+    parser.add_argument("--linear-lookups", type=int, default=2000, help="the scan is slow, it routes fewer names")
+    parser.add_argument("--miss-rate", type=float, default=0.2)
+    args = parser.parse_args()
+
+    suffixes = build_suffixes(args.suffixes)
+    names = build_names(suffixes, args.lookups, args.miss_rate)
+
+    start = time.perf_counter()
+    table = routing.RoutingTable({suffix: routing.Destination(f"ZONE{i}") for i, suffix in enumerate(suffixes)})
+    build_seconds = time.perf_counter() - start
+
+    trie_seconds = timed(table.route, names)
+    linear_names = names[:args.linear_lookups]
+    linear_seconds = timed(lambda name: linear_route(suffixes, name), linear_names)
+
+    trie_us = trie_seconds / len(names) * 1e6
+    linear_us = linear_seconds / len(linear_names) * 1e6
+    print(f"suffixes: {len(suffixes)}")
+    print(f"trie build: {build_seconds * 1000:.1f} ms")
+    print(f"trie lookup: {trie_us:.2f} us/name over {len(names)} names")
+    print(f"endswith scan: {linear_us:.2f} us/name over {len(linear_names)} names")
+    print(f"speedup: {linear_us / trie_us:.0f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+"""Throughput benchmark of lambda_handler against synthetic CloudTrail events and the fake Route53 backend.
+
+Reports events/sec, Route53 API calls per event, p50/p99 handler latency and peak memory as JSON. Save the result of
+each commit with --output and pass an earlier one to --compare to see the regressions.
+
+    python benchmarks/bench_throughput.py --events 2000 --changes-per-event 5 --mix CREATE=0.6,DELETE=0.2,UPSERT=0.2 \\
+        --match-rate 0.8 --set-identifier-rate 0.1 --output throughput.json
+
+The fake answers on a fake clock by default, so only the processing path, logging included, is measured.
+--latency-ms and --insync-after-seconds make it take real time per call, and --rate-limit keeps the production
+request rate. Peak memory is the process peak RSS, --trace-memory adds the tracemalloc peak of the run at the cost
+of a much slower run.
+"""
+import argparse
+import json
+import logging
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.join(ROOT, "src"))
+sys.path.insert(0, ROOT)
+
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+os.environ.setdefault("ASSUME_ROLE_ARN", "arn:aws:iam::111111111111:role/bench")
+
+import handler  # noqa: E402
+import idempotency  # noqa: E402
+import ratelimit  # noqa: E402
+from benchmarks.cloudtrail_events import generate_events  # noqa: E402
+from tests.fake_route53 import FakeClock, FakeRoute53, RealClock, fake_aws  # noqa: E402
+
+
+class _Context:
+    """Lambda context with the full 900 seconds left."""
+    invoked_function_arn = "arn:aws:lambda:us-east-1:111111111111:function:bench"
+
+    def get_remaining_time_in_millis(self):
+        return 900000
+
+
+def parse_mix(mix: str) -> dict:
+    """Parse CREATE=0.6,DELETE=0.2,UPSERT=0.2 into action weights."""
+    return {action.strip().upper(): float(weight) for action, weight in (part.split("=") for part in mix.split(","))}
+
+
+def percentile(values: list, fraction: float) -> float:
+    """Return the nearest rank percentile of the values."""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(fraction * len(ordered))) - 1))]
+
+
+def git_commit() -> str:
+    """Return the commit the benchmark ran on, empty outside of a git checkout."""
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def run(args) -> dict:
+    """Run the events through lambda_handler and return the measurements."""
+    real_time = args.latency_ms > 0 or args.insync_after_seconds > 0 or args.rate_limit
+    clock = RealClock() if real_time else FakeClock()
+    route53 = FakeRoute53(clock=clock,
+                          latency_seconds=args.latency_ms / 1000,
+                          insync_after_seconds=args.insync_after_seconds,
+                          throttle_rate=args.throttle_rate,
+                          seed=args.seed)
+    os.environ["COMPANY_DOMAIN_FILTER"] = args.domain
+    os.environ["DEST_HOSTED_ZONE_ID"] = route53.create_hosted_zone(args.domain)
+    if not args.rate_limit:
+        ratelimit.route53_bucket = ratelimit.TokenBucket(rate=1e9, capacity=1e9)
+    idempotency.clear_cache()
+    events = list(
+        generate_events(args.events,
+                        changes_per_event=args.changes_per_event,
+                        action_mix=parse_mix(args.mix),
+                        match_rate=args.match_rate,
+                        set_identifier_rate=args.set_identifier_rate,
+                        domain=args.domain,
+                        names=args.names,
+                        seed=args.seed))
+
+    latencies = []
+    errors = 0
+    if args.trace_memory:
+        tracemalloc.start()
+    started = time.perf_counter()
+    with fake_aws(route53, clock=None if real_time else clock):
+        for event in events:
+            event_started = time.perf_counter()
+            try:
+                handler.lambda_handler(event, _Context())
+            except Exception:
+                errors += 1
+            latencies.append((time.perf_counter() - event_started) * 1000)
+    elapsed = time.perf_counter() - started
+    traced_peak_bytes = None
+    if args.trace_memory:
+        _, traced_peak_bytes = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    calls_by_operation = {}
+    for entry in route53.request_log:
+        calls_by_operation[entry["operation"]] = calls_by_operation.get(entry["operation"], 0) + 1
+    return {
+        "commit": git_commit(),
+        "parameters": {key: value for key, value in vars(args).items() if key not in ("output", "compare")},
+        "events": len(events),
+        "errors": errors,
+        "seconds": round(elapsed, 3),
+        "events_per_sec": round(len(events) / elapsed, 1),
+        "route53_calls_per_event": round(len(route53.request_log) / len(events), 3),
+        "route53_calls": calls_by_operation,
+        "latency_ms": {
+            "p50": round(statistics.median(latencies), 3),
+            "p99": round(percentile(latencies, 0.99), 3),
+            "max": round(max(latencies), 3),
+        },
+        # ru_maxrss is in kilobytes on Linux
+        "peak_memory_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 2),
+        "traced_peak_memory_mb": None if traced_peak_bytes is None else round(traced_peak_bytes / 1024 / 1024, 2),
+    }
+
+
+def compare(result: dict, baseline: dict) -> dict:
+    """Return the relative change of the headline numbers against a baseline result."""
+    def change(new, old):
+        return round((new - old) / old * 100, 1) if old else None
+
+    return {
+        "baseline_commit": baseline.get("commit"),
+        "events_per_sec_pct": change(result["events_per_sec"], baseline["events_per_sec"]),
+        "route53_calls_per_event_pct": change(result["route53_calls_per_event"], baseline["route53_calls_per_event"]),
+        "p50_pct": change(result["latency_ms"]["p50"], baseline["latency_ms"]["p50"]),
+        "p99_pct": change(result["latency_ms"]["p99"], baseline["latency_ms"]["p99"]),
+        "peak_memory_pct": change(result["peak_memory_mb"], baseline["peak_memory_mb"]),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", type=int, default=1000)
+    parser.add_argument("--changes-per-event", type=int, default=1)
+    parser.add_argument("--mix", default="CREATE=0.6,DELETE=0.2,UPSERT=0.2", help="action weights")
+    parser.add_argument("--match-rate", type=float, default=0.9, help="share of names under --domain")
+    parser.add_argument("--set-identifier-rate", type=float, default=0.05, help="share of non-Simple changes")
+    parser.add_argument("--domain", default="api.test.io")
+    parser.add_argument("--names", type=int, default=500, help="distinct record names per domain")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="real latency of every Route53 call")
+    parser.add_argument("--insync-after-seconds", type=float, default=0.0)
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="share of calls failing with Throttling")
+    parser.add_argument("--rate-limit", action="store_true", help="keep the production Route53 request rate")
+    parser.add_argument("--trace-memory", action="store_true", help="also report the tracemalloc peak")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="write the result JSON to this file")
+    parser.add_argument("--compare", help="baseline result JSON to compare with")
+    args = parser.parse_args()
+
+    # the Lambda runtime formats every INFO record, the benchmark pays for that too but writes them nowhere
+    with open(os.devnull, "w") as devnull:
+        log_handler = logging.StreamHandler(devnull)
+        log_handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(message)s"))
+        logging.getLogger().addHandler(log_handler)
+        logging.getLogger().setLevel(logging.INFO)
+        result = run(args)
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            result["comparison"] = compare(result, json.load(baseline_file))
+    output = json.dumps(result, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w") as output_file:
+            output_file.write(output + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""Synthetic ChangeResourceRecordSets CloudTrail events, shaped like the EventBridge fixtures in tests/test-files."""
+import copy
+import datetime
+import json
+import os
+import random
+import uuid
+from typing import Dict, Iterator
+
+FIXTURE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "tests", "test-files",
+                       "eventbridge.create.event.json")
+START_TIME = datetime.datetime(2022, 10, 31, 18, 0, 0, tzinfo=datetime.timezone.utc)
+
+
+def generate_events(
+    count: int,
+    changes_per_event: int = 1,
+    action_mix: Dict[str, float] = None,
+    match_rate: float = 1.0,
+    set_identifier_rate: float = 0.0,
+    domain: str = "api.test.io",
+    names: int = 500,
+    seed: int = 42,
+) -> Iterator[dict]:
+    """Yield count events of changes_per_event alias changes each.
+
+    action_mix weighs CREATE/DELETE/UPSERT, match_rate is the share of names under domain and set_identifier_rate
+    the share of changes with a non-Simple setIdentifier. Names are drawn from a pool of names per domain, so later
+    events update and delete records created by earlier ones.
+    """
+    rng = random.Random(seed)
+    action_mix = action_mix or {"CREATE": 1.0}
+    actions, weights = zip(*action_mix.items())
+    with open(FIXTURE) as json_file:
+        template = json.load(json_file)
+    change_template = template["detail"]["requestParameters"]["changeBatch"]["changes"][0]
+    for index in range(count):
+        event = copy.deepcopy(template)
+        event_time = (START_TIME + datetime.timedelta(seconds=index)).strftime("%Y-%m-%dT%H:%M:%SZ")
+        event["id"] = str(uuid.UUID(int=rng.getrandbits(128)))
+        event["time"] = event_time
+        event["detail"]["eventID"] = str(uuid.UUID(int=rng.getrandbits(128)))
+        event["detail"]["eventTime"] = event_time
+        changes = []
+        for _ in range(changes_per_event):
+            change = copy.deepcopy(change_template)
+            change["action"] = rng.choices(actions, weights)[0]
+            name_domain = domain if rng.random() < match_rate else "other.example.com"
+            change["resourceRecordSet"]["name"] = f"svc{rng.randrange(names)}.{name_domain}."
+            if rng.random() < set_identifier_rate:
+                change["resourceRecordSet"]["setIdentifier"] = "alb-us-east-1"
+                change["resourceRecordSet"]["region"] = "us-east-1"
+            changes.append(change)
+        event["detail"]["requestParameters"]["changeBatch"]["changes"] = changes
+        yield event
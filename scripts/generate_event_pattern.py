@@ -0,0 +1,40 @@
+"""Print the EventBridge pattern of the routing configuration, for the RouteChangeEventPattern parameter.
+
+The routes are read like the Lambda reads them, from DOMAIN_ROUTES or COMPANY_DOMAIN_FILTER/DEST_HOSTED_ZONE_ID, or
+from --domain-routes/--company-domain-filter.
+
+    python scripts/generate_event_pattern.py --company-domain-filter api.business.io
+"""
+import argparse
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+import event_pattern  # noqa: E402
+import routing  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--domain-routes", help="DOMAIN_ROUTES JSON object")
+    parser.add_argument("--company-domain-filter", help="COMPANY_DOMAIN_FILTER domain")
+    parser.add_argument("--exclude-set-identifiers", action="store_true",
+                        help="also drop non-Simple setIdentifier events, exact only for single change events, "
+                        "not for SYNC_ROUTING_POLICIES")
+    parser.add_argument("--indent", type=int, help="pretty print, the parameter value is compact by default")
+    args = parser.parse_args()
+
+    if args.domain_routes:
+        routing_table = routing.RoutingTable(routing.parse_routes(args.domain_routes))
+    elif args.company_domain_filter:
+        routing_table = routing.RoutingTable({args.company_domain_filter: routing.Destination(hosted_zone_id="")})
+    else:
+        routing_table = routing.get_routing_table()
+    pattern = event_pattern.build_event_pattern(routing_table, exclude_set_identifiers=args.exclude_set_identifiers)
+    print(json.dumps(pattern, indent=args.indent, separators=None if args.indent else (",", ":")))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,267 @@
+"""Replay archived CloudTrail logs into the destination hosted zones.
+
+Streams the gzipped CloudTrail log files of a directory or an S3 prefix, keeps the Route53 ChangeResourceRecordSets
+records process_message would sync, collapses them to the final state of every record by eventTime and applies that
+state in batched writes.
+
+    python src/backfill.py s3://cloudtrail-bucket/AWSLogs/111111111111/CloudTrail/us-east-1/2022/10/ --dry-run
+"""
+import argparse
+import gzip
+import io
+import json
+import logging
+import os
+import sys
+from typing import Dict, Iterator, List, TextIO, Tuple
+
+import boto3
+
+import _utils
+import event_filter
+import message_processing
+import record_change
+import record_versions
+import routing
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+BACKFILL_READ_CHARS = int(os.environ.get("BACKFILL_READ_CHARS", "65536"))
+BACKFILL_BATCH_RECORDS = int(os.environ.get("BACKFILL_BATCH_RECORDS", "1000"))
+
+_decoder = json.JSONDecoder()
+
+
+def iter_log_records(stream: TextIO, read_chars: int = None) -> Iterator[dict]:
+    """Yield the records of a CloudTrail log file, {"Records": [...]}, decoding one record at a time.
+
+    Only the record being decoded is buffered, so memory is bounded by the largest record instead of the file.
+    """
+    read_chars = read_chars or BACKFILL_READ_CHARS
+    buffer = ""
+    position = 0
+    eof = False
+
+    def fill() -> bool:
+        nonlocal buffer, position, eof
+        if eof:
+            return False
+        chunk = stream.read(read_chars)
+        if not chunk:
+            eof = True
+            return False
+        buffer = buffer[position:] + chunk
+        position = 0
+        return True
+
+    # find the opening bracket of the Records array
+    while True:
+        start = buffer.find('"Records"', position)
+        bracket = buffer.find("[", start) if start >= 0 else -1
+        if bracket >= 0:
+            position = bracket + 1
+            break
+        if not fill():
+            return
+    while True:
+        while position < len(buffer) and buffer[position] in " \t\r\n,":
+            position += 1
+        if position == len(buffer):
+            if not fill():
+                raise ValueError("CloudTrail log file ends inside the Records array")
+            continue
+        if buffer[position] == "]":
+            return
+        try:
+            record, end = _decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            # the record continues in the next chunk
+            if not fill():
+                raise
+            continue
+        position = end
+        yield record
+
+
+def _local_files(directory: str) -> Iterator[Tuple[str, TextIO]]:
+    """Yield the path and text stream of every CloudTrail log file under a directory, in path order."""
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        for file_name in sorted(files):
+            path = os.path.join(root, file_name)
+            if file_name.endswith(".json.gz"):
+                with gzip.open(path, "rt") as log_file:
+                    yield path, log_file
+            elif file_name.endswith(".json"):
+                with open(path) as log_file:
+                    yield path, log_file
+
+
+def _s3_files(url: str) -> Iterator[Tuple[str, TextIO]]:
+    """Yield the key and text stream of every CloudTrail log file under an s3://bucket/prefix, streamed from S3."""
+    bucket, _, prefix = url[len("s3://"):].partition("/")
+    s3_client = boto3.client("s3")
+    for page in s3_client.get_paginator("list_objects_v2").paginate(Bucket=bucket, Prefix=prefix):
+        for s3_object in page.get("Contents", []):
+            key = s3_object["Key"]
+            if not key.endswith((".json.gz", ".json")):
+                continue
+            body = s3_client.get_object(Bucket=bucket, Key=key)["Body"]
+            raw = gzip.GzipFile(fileobj=body) if key.endswith(".gz") else body
+            with io.TextIOWrapper(raw, encoding="utf-8") as log_file:
+                yield key, log_file
+
+
+def iter_log_files(source: str) -> Iterator[Tuple[str, TextIO]]:
+    """Yield the CloudTrail log files of a local directory or an s3:// prefix."""
+    if source.startswith("s3://"):
+        return _s3_files(source)
+    return _local_files(source)
+
+
+def is_change_record(record: dict) -> bool:
+    """Return whether a CloudTrail record is a successful Route53 ChangeResourceRecordSets call."""
+    return (record.get("eventSource") == "route53.amazonaws.com"
+            and record.get("eventName") == "ChangeResourceRecordSets" and "errorCode" not in record)
+
+
+def _synced_changes(event_change: dict) -> List[Tuple[str, dict]]:
+    """Return the destination zone and change of every destination a CloudTrail change is synced to."""
+    recordset_changes = event_change["resourceRecordSet"]
+    skip_reason = event_filter.recordset_skip_reason(recordset_changes["name"], recordset_changes.get("setIdentifier"))
+    if skip_reason is not None:
+        logger.debug(skip_reason)
+        return []
+    try:
+        record = record_change.RecordChange.from_cloudtrail(event_change)
+    except record_change.UnsupportedRecordSet as ex:
+        logger.debug(f"Not replaying {ex}")
+        return []
+    destinations = routing.get_routing_table().route_all(recordset_changes["name"])
+    return [(destination.hosted_zone_id, record.to_api()) for destination in destinations]
+
+
+def _record_key(hosted_zone_id: str, change: dict) -> tuple:
+    """Return the (zone, record name, record type, set identifier) the changes of a record collapse on."""
+    return (hosted_zone_id, ) + record_change.record_key(change["ResourceRecordSet"])
+
+
+def collapse_records(records: Iterator[dict], stats: dict = None, start_time: str = None,
+                     end_time: str = None) -> Dict[tuple, tuple]:
+    """Collapse CloudTrail records to the last change per (zone, record name, record type, set identifier).
+
+    Changes are ordered by their version, the eventTime, so the files can be read in any order and only the last
+    change of every record is held. Changes made in the same second keep the order they are read in. Returns the
+    record key mapped to (version, change).
+    """
+    stats = stats if stats is not None else {}
+    final = {}
+    for record in records:
+        stats["records"] = stats.get("records", 0) + 1
+        if not is_change_record(record):
+            continue
+        event_time = record.get("eventTime", "")
+        if (start_time and event_time < start_time) or (end_time and event_time >= end_time):
+            continue
+        stats["events"] = stats.get("events", 0) + 1
+        for change_index, event_change in enumerate(record["requestParameters"]["changeBatch"]["changes"]):
+            synced = _synced_changes(event_change)
+            if not synced:
+                stats["skipped_changes"] = stats.get("skipped_changes", 0) + 1
+                continue
+            stats["changes"] = stats.get("changes", 0) + 1
+            version = record_versions.change_version({"detail": record}) or ""
+            for hosted_zone_id, change in synced:
+                key = _record_key(hosted_zone_id, change)
+                if key not in final or final[key][0] <= version:
+                    final[key] = (version, change)
+    return final
+
+
+def final_changes(final: Dict[tuple, tuple]) -> Iterator[Tuple[str, dict, str]]:
+    """Yield the destination zone, change and version bringing each record to its final state.
+
+    A record last created or updated may already exist in the destination, so it is upserted. The diff against the
+    destination zone drops the changes already in place.
+    """
+    for (hosted_zone_id, *_), (version, change) in sorted(final.items(), key=lambda item: item[1][0]):
+        if change["Action"] != message_processing.RecordSetChangeAction.delete:
+            change = {**change, "Action": message_processing.RecordSetChangeAction.upsert.value}
+        yield hosted_zone_id, change, version
+
+
+def apply_final_changes(changes: Iterator[Tuple[str, dict, str]], batch_records: int = None,
+                        failed_changes: List[dict] = None) -> int:
+    """Apply the changes in batches of batch_records through the process_message write path, returning the count.
+
+    Records changed later than the archive by the live event path are left alone.
+    """
+    batch_records = batch_records or BACKFILL_BATCH_RECORDS
+    applied = 0
+    batch = {}
+    batch_size = 0
+    for hosted_zone_id, change, version in changes:
+        recordset = change["ResourceRecordSet"]
+        if not record_versions.claim(hosted_zone_id, recordset["Name"], recordset["Type"], version or None,
+                                     set_identifier=record_change.record_key(recordset)[2]):
+            logger.info(f"Skipping {recordset['Name']}, it was changed after the replayed events")
+            continue
+        batch.setdefault(hosted_zone_id, []).append(change)
+        batch_size += 1
+        if batch_size >= batch_records:
+            message_processing.apply_routed_changes(batch, failed_changes=failed_changes)
+            applied += batch_size
+            batch = {}
+            batch_size = 0
+    if batch:
+        message_processing.apply_routed_changes(batch, failed_changes=failed_changes)
+        applied += batch_size
+    return applied
+
+
+def backfill(source: str, dry_run: bool = False, start_time: str = None, end_time: str = None,
+             batch_records: int = None) -> dict:
+    """Replay the CloudTrail log files of a directory or s3:// prefix, returning the counts of the run."""
+    if _utils.stop_processing():
+        raise RuntimeError("HALT_PROCESSING set, not replaying.")
+    stats = {"files": 0}
+
+    def records() -> Iterator[dict]:
+        for name, log_file in iter_log_files(source):
+            stats["files"] += 1
+            logger.info(f"Reading {name}")
+            yield from iter_log_records(log_file)
+
+    final = collapse_records(records(), stats, start_time=start_time, end_time=end_time)
+    counts = {}
+    for _, change, _ in final_changes(final):
+        counts[change["Action"]] = counts.get(change["Action"], 0) + 1
+    stats["final"] = counts
+    if dry_run:
+        return stats
+    failed_changes = []
+    stats["applied"] = apply_final_changes(final_changes(final), batch_records=batch_records,
+                                           failed_changes=failed_changes)
+    stats["failed"] = [change["ResourceRecordSet"]["Name"] for change in failed_changes]
+    return stats
+
+
+def main(argv: List[str] = None):
+    """Replay the CloudTrail log files of a directory or S3 prefix and print the stats."""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("source", help="directory or s3://bucket/prefix of CloudTrail log files")
+    parser.add_argument("--dry-run", action="store_true", help="only count the final changes")
+    parser.add_argument("--start-time", help="replay events from this eventTime, e.g. 2022-10-31T00:00:00Z")
+    parser.add_argument("--end-time", help="replay events before this eventTime")
+    parser.add_argument("--batch-records", type=int, default=BACKFILL_BATCH_RECORDS,
+                        help="record changes applied per write batch")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    result = backfill(args.source, dry_run=args.dry_run, start_time=args.start_time, end_time=args.end_time,
+                      batch_records=args.batch_records)
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
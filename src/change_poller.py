@@ -0,0 +1,66 @@
+"""Poll many Route53 change ids together until they are all INSYNC."""
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+import boto3
+
+import ratelimit
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+INSYNC = "INSYNC"
+
+CHANGE_POLL_INITIAL_DELAY_SECONDS = float(os.environ.get("CHANGE_POLL_INITIAL_DELAY_SECONDS", "2"))
+CHANGE_POLL_MAX_DELAY_SECONDS = float(os.environ.get("CHANGE_POLL_MAX_DELAY_SECONDS", "30"))
+CHANGE_POLL_BACKOFF = float(os.environ.get("CHANGE_POLL_BACKOFF", "1.5"))
+# the resource_record_sets_changed waiter gave up after 20 x 30 seconds
+CHANGE_POLL_TIMEOUT_SECONDS = float(os.environ.get("CHANGE_POLL_TIMEOUT_SECONDS", "600"))
+CHANGE_POLL_DEADLINE_MARGIN_MS = int(os.environ.get("CHANGE_POLL_DEADLINE_MARGIN_MS", "10000"))
+CHANGE_POLL_WORKERS = int(os.environ.get("CHANGE_POLL_WORKERS", "4"))
+
+_sleep = time.sleep  # replaced in unit tests
+
+
+def remaining_time_ms(context) -> float:
+    """Return the milliseconds left in the invocation, infinite when run without a Lambda context."""
+    get_remaining_time_in_millis = getattr(context, "get_remaining_time_in_millis", None)
+    if get_remaining_time_in_millis is None:
+        return float("inf")
+    return get_remaining_time_in_millis()
+
+
+def _get_status(route53_client: boto3.client, change_id: str) -> str:
+    """Return the status of a single change."""
+    return ratelimit.call(route53_client.get_change, Id=change_id)["ChangeInfo"]["Status"]
+
+
+def poll_changes(route53_client: boto3.client, change_ids: List[str], context=None) -> Dict[str, str]:
+    """Poll the change ids concurrently with a short initial delay and growing backoff.
+
+    Returns as soon as every change is INSYNC, or with the last seen statuses when CHANGE_POLL_TIMEOUT_SECONDS
+    passed or the invocation would not have CHANGE_POLL_DEADLINE_MARGIN_MS left after the next delay.
+    """
+    statuses = {change_id: "PENDING" for change_id in change_ids}
+    started = time.monotonic()
+    delay = CHANGE_POLL_INITIAL_DELAY_SECONDS
+    polls = 0
+    while True:
+        pending = [change_id for change_id, status in statuses.items() if status != INSYNC]
+        if not pending:
+            logger.info(f"{len(statuses)} changes INSYNC after {time.monotonic() - started:.1f} seconds, {polls} polls")
+            return statuses
+        if (time.monotonic() - started + delay > CHANGE_POLL_TIMEOUT_SECONDS
+                or remaining_time_ms(context) - delay * 1000 < CHANGE_POLL_DEADLINE_MARGIN_MS):
+            logger.warning(f"Stopped polling with {len(pending)} changes still pending {pending}")
+            return statuses
+        _sleep(delay)
+        with ThreadPoolExecutor(max_workers=min(CHANGE_POLL_WORKERS, len(pending))) as executor:
+            for change_id, status in zip(pending, executor.map(lambda change_id: _get_status(route53_client, change_id),
+                                                               pending)):
+                statuses[change_id] = status
+        polls += 1
+        delay = min(CHANGE_POLL_MAX_DELAY_SECONDS, delay * CHANGE_POLL_BACKOFF)
@@ -0,0 +1,100 @@
+"""Track pending Route53 changes so the handler does not block on propagation."""
+import logging
+import os
+import time
+from typing import List
+
+from boto3.dynamodb.conditions import Attr
+
+import metrics
+import ratelimit
+import sts
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+PENDING = "PENDING"
+INSYNC = "INSYNC"
+
+
+def is_async_wait() -> bool:
+    """Return whether changes are recorded for the poller instead of waited on in the handler."""
+    return os.environ.get("WAIT_MODE", "blocking") == "async"
+
+
+def get_pending_changes_table():
+    """Return the DynamoDB table holding the pending change ids.
+
+    It is built once under the lock of the shared session, changes are tracked from the threads of the fanned out
+    destinations.
+    """
+    return sts.get_dynamodb_table(os.environ["PENDING_CHANGES_TABLE"])
+
+
+def track_change(change_id: str,
+                 hosted_zone_id: str,
+                 names: List[str],
+                 role_arn: str = None,
+                 submitted_at: float = None):
+    """Record a submitted change id as pending for the poller."""
+    role_arn = role_arn or sts.get_adler_cross_account_iam()
+    submitted_at = submitted_at or time.time()
+    ttl_seconds = int(os.environ.get("PENDING_CHANGES_TTL_SECONDS", "604800"))
+    get_pending_changes_table().put_item(
+        Item={
+            "change_id": change_id,
+            "hosted_zone_id": hosted_zone_id,
+            "role_arn": role_arn,
+            "names": names,
+            "change_status": PENDING,
+            "submitted_at": str(submitted_at),
+            "expires_at": int(submitted_at) + ttl_seconds,
+        })
+    logger.info(f"Tracking pending change {change_id} for {names}")
+
+
+def list_pending_changes() -> List[dict]:
+    """Return every change still pending propagation, the table only holds those once the poller removed INSYNC ones."""
+    table = get_pending_changes_table()
+    scan_kwargs = {"FilterExpression": Attr("change_status").eq(PENDING)}
+    items = []
+    while True:
+        response = table.scan(**scan_kwargs)
+        items.extend(response["Items"])
+        if "LastEvaluatedKey" not in response:
+            return items
+        scan_kwargs["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+
+
+def poll_pending_changes() -> dict:
+    """Check every pending change with get_change, removing INSYNC ones and alerting on stuck ones."""
+    stuck_seconds = int(os.environ.get("CHANGE_STUCK_SECONDS", "900"))
+    table = get_pending_changes_table()
+    summary = {INSYNC: [], PENDING: [], "stuck": []}
+    now = time.time()
+    for item in list_pending_changes():
+        route53_client = sts.get_route53_client(role_arn=item["role_arn"])
+        change_status = ratelimit.call(route53_client.get_change, Id=item["change_id"])["ChangeInfo"]["Status"]
+        elapsed = now - float(item["submitted_at"])
+        if change_status == INSYNC:
+            # only pending changes are kept, so every poll reads the changes it has to check and no more
+            table.delete_item(Key={"change_id": item["change_id"]})
+            metrics.put_metric("TimeToInsync", elapsed, unit="Seconds",
+                               dimensions={"DestinationHostedZoneId": item["hosted_zone_id"]})
+            summary[INSYNC].append(item["change_id"])
+        elif elapsed > stuck_seconds:
+            if not item.get("alerted", False):
+                # logged with the handler error prefix so the existing failure metric filter raises the alarm
+                logger.error(
+                    f"Lambda ERROR aws-route53-organization-recordset-registration: change {item['change_id']} "
+                    f"for {item['names']} is still {change_status} after {int(elapsed)} seconds")
+                table.update_item(
+                    Key={"change_id": item["change_id"]},
+                    UpdateExpression="SET alerted = :alerted",
+                    ExpressionAttributeValues={":alerted": True},
+                )
+            summary["stuck"].append(item["change_id"])
+        else:
+            summary[PENDING].append(item["change_id"])
+    logger.info(f"Polled pending changes {summary}")
+    return summary
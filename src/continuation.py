@@ -0,0 +1,77 @@
+"""Deadline-aware checkpoints handing the unfinished changes of an invocation to a continuation."""
+import json
+import logging
+import os
+from typing import Dict, List
+
+import boto3
+
+import change_poller
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# time left to hand the remaining changes off, no new destination is started with less
+CONTINUATION_MARGIN_MS = int(os.environ.get("CONTINUATION_MARGIN_MS", "30000"))
+CONTINUATION_MAX_ATTEMPTS = int(os.environ.get("CONTINUATION_MAX_ATTEMPTS", "10"))
+
+
+class Checkpoint:
+    """Changes an invocation finished, left pending in Route53 or deferred before its deadline."""
+    def __init__(self, context=None):
+        """Initialize an empty checkpoint of the invocation whose Lambda context tells the time left."""
+        self.context = context
+        self.completed = []
+        self.deferred = []
+        self.pending = {}  # change id -> (hosted zone id, record names, role arn)
+
+    def deadline_near(self) -> bool:
+        """Return whether the invocation is too close to its timeout to start more work."""
+        return change_poller.remaining_time_ms(self.context) < CONTINUATION_MARGIN_MS
+
+    @property
+    def interrupted(self) -> bool:
+        """Return whether there is work left for a continuation."""
+        return bool(self.deferred or self.pending)
+
+
+def completed_indexes(event: dict) -> set:
+    """Return the change indexes an earlier invocation of the event already submitted."""
+    return set(event.get("continuation", {}).get("completed", []))
+
+
+def pending_changes(event: dict) -> Dict[str, tuple]:
+    """Return the change ids an earlier invocation of the event left pending, with their zone, names and role."""
+    return {
+        pending["change_id"]: (pending["hosted_zone_id"], pending["names"], pending.get("role_arn"))
+        for pending in event.get("continuation", {}).get("pending", [])
+    }
+
+
+def continuation_event(event: dict, completed: List[int], checkpoint: Checkpoint) -> dict:
+    """Return the event to continue with, the original event and the checkpoint of the changes already done."""
+    previous = event.get("continuation", {})
+    return {
+        **event,
+        "continuation": {
+            "attempt": previous.get("attempt", 0) + 1,
+            "completed": sorted(completed_indexes(event) | set(completed)),
+            "pending": [{
+                "change_id": change_id,
+                "hosted_zone_id": hosted_zone_id,
+                "names": list(names),
+                "role_arn": role_arn,
+            } for change_id, (hosted_zone_id, names, role_arn) in checkpoint.pending.items()],
+        },
+    }
+
+
+def invoke_continuation(event: dict, context):
+    """Invoke the function asynchronously with the continuation event."""
+    attempt = event["continuation"]["attempt"]
+    if attempt > CONTINUATION_MAX_ATTEMPTS:
+        raise Exception(f"Giving up on event after {CONTINUATION_MAX_ATTEMPTS} continuations {event['continuation']}")
+    logger.warning(f"Deadline close, continuing in a new invocation, attempt {attempt} {event['continuation']}")
+    boto3.client("lambda").invoke(FunctionName=context.invoked_function_arn,
+                                  InvocationType="Event",
+                                  Payload=json.dumps(event).encode())
@@ -0,0 +1,46 @@
+"""Filter the CloudTrail changes of an event without loading boto3, so filtered events stay cheap."""
+import logging
+from typing import Optional
+
+import _utils
+import metrics
+import routing
+import runtime_config
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+
+def routing_policies_synced() -> bool:
+    """Return whether records with a routing policy, a setIdentifier other than Simple, are synced."""
+    return str(runtime_config.get("SYNC_ROUTING_POLICIES", "false")).lower() == "true"
+
+
+def recordset_skip_reason(recordset_name: str, set_identifier: str = None) -> Optional[str]:
+    """Return why a record set is not synced to a destination zone, None when it is."""
+    if routing.get_routing_table().route(recordset_name) is None:
+        return f"Not permforming any change because api endpoint is not {', '.join(routing.get_routing_table().routes)} {recordset_name}"
+    if set_identifier is not None and set_identifier != "Simple" and not routing_policies_synced():
+        return f"Not permforming any change because the setIdentifier is not Simple {recordset_name} {set_identifier}. Typically this is a regional ALB deployment the user needs to handle this!"
+    return None
+
+
+def filtered_status(event) -> Optional[dict]:
+    """Return the status of every change of an event none of whose changes is synced, None when one is."""
+    event_changes = event["detail"]["requestParameters"]["changeBatch"]["changes"]
+    if _utils.stop_processing():
+        logger.info("HALT_PROCESSING set, not starting jobs.")
+        for change in event_changes:
+            metrics.record("SkippedChanges", dimensions={"Action": change["action"], "Reason": "Halted"})
+        return {change["resourceRecordSet"]["name"]: False for change in event_changes}
+    return_status = {}
+    for change in event_changes:
+        recordset_changes = change["resourceRecordSet"]
+        skip_reason = recordset_skip_reason(recordset_changes["name"], recordset_changes.get("setIdentifier"))
+        if skip_reason is None:
+            return None
+        logger.warning(skip_reason)
+        return_status[recordset_changes["name"]] = False
+    for change in event_changes:
+        metrics.record("SkippedChanges", dimensions={"Action": change["action"], "Reason": "Filtered"})
+    return return_status
@@ -0,0 +1,52 @@
+"""Compile the routing configuration into the EventBridge pattern of the ChangeResourceRecordSets rule."""
+from typing import List
+
+import routing
+
+BASE_PATTERN = {
+    "source": ["aws.route53"],
+    "detail-type": ["AWS API Call via CloudTrail"],
+    "detail": {
+        "eventSource": ["route53.amazonaws.com"],
+        "eventName": ["ChangeResourceRecordSets"],
+    },
+}
+
+
+def name_filters(suffixes: List[str]) -> List[dict]:
+    """Return the filters matching a record name the routes cover, an empty list when a route covers every name.
+
+    Route matching is case insensitive on whole labels and ignores the trailing dot, so every suffix matches its
+    apex and its subdomains, with and without the dot.
+    """
+    filters = []
+    for suffix in sorted(suffixes):
+        suffix = suffix.rstrip(".").lower()
+        if not suffix:
+            return []
+        for name in (suffix, f"{suffix}."):
+            filters.append({"equals-ignore-case": name})
+            filters.append({"suffix": {"equals-ignore-case": f".{name}"}})
+    return filters
+
+
+def build_event_pattern(routing_table: routing.RoutingTable = None, exclude_set_identifiers: bool = False) -> dict:
+    """Return the event pattern matching the ChangeResourceRecordSets events with a change the routes cover.
+
+    EventBridge matches every field of a pattern against the values of all changes of an event independently.
+    The name filters therefore keep every event with one routed name. exclude_set_identifiers also drops events with
+    a non-Simple setIdentifier, which is only exact for events of one change: an event mixing a routed Simple change
+    with a non-Simple one is dropped as a whole, so it is off by default. It also drops the records that
+    SYNC_ROUTING_POLICIES syncs.
+    """
+    routing_table = routing_table or routing.get_routing_table()
+    record_set_pattern = {}
+    filters = name_filters(list(routing_table.routes))
+    if filters:
+        record_set_pattern["name"] = filters
+    if exclude_set_identifiers:
+        record_set_pattern["setIdentifier"] = [{"exists": False}, "Simple"]
+    pattern = {**BASE_PATTERN, "detail": dict(BASE_PATTERN["detail"])}
+    if record_set_pattern:
+        pattern["detail"]["requestParameters"] = {"changeBatch": {"changes": {"resourceRecordSet": record_set_pattern}}}
+    return pattern
@@ -5,25 +5,86 @@ import os
 import sys
 import traceback
 
-import message_processing
+import event_filter
+import metrics
+import structured_log
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
 
+def log_exception(event, e: Exception):
+    """Log the handler failure in the format the Lambda ERROR metric filter alarms on."""
+    structured_log.log_failed_event(logger, event)
+    logger.error(f"Lambda ERROR aws-route53-organization-recordset-registration: \n {e}")
+    traceback.print_exc(file=sys.stdout)
+    exception_type = e.__class__.__name__
+    exception_message = str(e)
+    api_exception_obj = {"isError": True, "type": exception_type, "message": exception_message}
+    logger.error(json.dumps(api_exception_obj))
+
+
 def lambda_handler(event, context):
-    """Lambda main handler."""
+    """Lambda main handler.
+
+    Events without a change to sync are answered before message_processing, and with it boto3, is imported. With
+    PLAN_MODE=true the event is planned and nothing is written.
+    """
     try:
+        return_status = event_filter.filtered_status(event)
+        if return_status is not None:
+            return return_status
+        if os.environ.get("PLAN_MODE", "false").lower() == "true":
+            import planner
+
+            return planner.plan_message(event, context)
+        import message_processing
+
         return message_processing.process_message(event, context)
     except Exception as e:
-        logger.info(event)
-        logger.error(f"Lambda ERROR aws-route53-organization-recordset-registration: \n {e}")
-        traceback.print_exc(file=sys.stdout)
-        exception_type = e.__class__.__name__
-        exception_message = str(e)
-        api_exception_obj = {"isError": True, "type": exception_type, "message": exception_message}
-        logger.error(json.dumps(api_exception_obj))
+        log_exception(event, e)
+        raise e
+    finally:
+        metrics.flush()
+
+
+def sqs_handler(event, context):
+    """Lambda handler for the SQS buffered intake, returns a partial batch response of the failed messages."""
+    try:
+        import message_processing
+
+        return message_processing.process_sqs_batch(event, context)
+    except Exception as e:
+        log_exception(event, e)
+        raise e
+    finally:
+        metrics.flush()
+
+
+def poller_handler(event, context):
+    """Lambda handler polling the pending Route53 changes recorded with WAIT_MODE=async."""
+    try:
+        import change_tracker
+
+        return change_tracker.poll_pending_changes()
+    except Exception as e:
+        log_exception(event, e)
+        raise e
+    finally:
+        metrics.flush()
+
+
+def reconcile_handler(event, context):
+    """Lambda handler reconciling whole source hosted zones into the destination hosted zone."""
+    try:
+        import reconcile
+
+        return reconcile.reconcile_message(event, context)
+    except Exception as e:
+        log_exception(event, e)
         raise e
+    finally:
+        metrics.flush()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,95 @@
+"""Idempotency store keyed on the CloudTrail event id and change index."""
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+import boto3
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+IDEMPOTENCY_TTL_SECONDS = int(os.environ.get("IDEMPOTENCY_TTL_SECONDS", "86400"))
+IDEMPOTENCY_CACHE_SIZE = int(os.environ.get("IDEMPOTENCY_CACHE_SIZE", "1024"))
+
+_cache_lock = threading.Lock()
+_cache = OrderedDict()
+_tables = {}
+
+
+def idempotency_key(event: dict, change_index: int) -> Optional[str]:
+    """Return the key of a change within an event, None when the event has no id to key on.
+
+    The CloudTrail eventID identifies the Route53 API call and is kept by every EventBridge redelivery, the
+    EventBridge id is the fallback.
+    """
+    event_id = event.get("detail", {}).get("eventID") or event.get("id")
+    if event_id is None:
+        return None
+    return f"{event_id}:{change_index}"
+
+
+def get_idempotency_table():
+    """Return the DynamoDB table backing the in-memory cache, None when IDEMPOTENCY_TABLE is not set.
+
+    The resource is built once per table, loading its model costs more than the lookups it serves.
+    """
+    table_name = os.environ.get("IDEMPOTENCY_TABLE")
+    if not table_name:
+        return None
+    table = _tables.get(table_name)
+    if table is None:
+        table = _tables[table_name] = boto3.resource("dynamodb").Table(table_name)
+    return table
+
+
+def _cache_put(key: str, status: bool, expires_at: int):
+    """Store the status in the LRU, evicting the least recently used entries."""
+    with _cache_lock:
+        _cache[key] = (status, expires_at)
+        _cache.move_to_end(key)
+        while len(_cache) > IDEMPOTENCY_CACHE_SIZE:
+            _cache.popitem(last=False)
+
+
+def get_status(key: Optional[str]) -> Optional[bool]:
+    """Return the cached status of an already completed change, None when it still has to be applied."""
+    if key is None:
+        return None
+    now = time.time()
+    with _cache_lock:
+        cached = _cache.get(key)
+        if cached is not None:
+            if cached[1] > now:
+                _cache.move_to_end(key)
+                return cached[0]
+            del _cache[key]
+    table = get_idempotency_table()
+    if table is None:
+        return None
+    item = table.get_item(Key={"idempotency_key": key}, ConsistentRead=True).get("Item")
+    # DynamoDB deletes expired items lazily, so the ttl is checked here as well
+    if item is None or int(item["expires_at"]) <= now:
+        return None
+    _cache_put(key, item["change_status"], int(item["expires_at"]))
+    return item["change_status"]
+
+
+def save_status(key: Optional[str], status: bool):
+    """Record a completed change so redeliveries of the event are short-circuited."""
+    if key is None:
+        return
+    expires_at = int(time.time()) + IDEMPOTENCY_TTL_SECONDS
+    _cache_put(key, status, expires_at)
+    table = get_idempotency_table()
+    if table is not None:
+        table.put_item(Item={"idempotency_key": key, "change_status": status, "expires_at": expires_at})
+
+
+def clear_cache():
+    """Drop the in-memory cache and the table resources."""
+    with _cache_lock:
+        _cache.clear()
+    _tables.clear()
@@ -2,16 +2,38 @@
 import json
 import logging
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor
 from enum import Enum
+from typing import Any, Callable, Dict, List, Optional
 
 import boto3
 
 import _utils
+import change_poller
+import change_tracker
+import continuation
+import event_filter
+import idempotency
+import metrics
+import ratelimit
+import record_change
+import record_versions
+import recordset_diff
+import routing
+import runtime_config
+import structured_log
 import sts
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
+# Route53 ChangeBatch limits, an UPSERT counts twice against both
+ROUTE53_MAX_BATCH_RECORDS = int(os.environ.get("ROUTE53_MAX_BATCH_RECORDS", "1000"))
+ROUTE53_MAX_BATCH_CHARS = int(os.environ.get("ROUTE53_MAX_BATCH_CHARS", "32000"))
+# destination zones a fanned out change is applied to at the same time
+FANOUT_WORKERS = int(os.environ.get("FANOUT_WORKERS", "4"))
+
 
 class RecordSetChangeAction(str, Enum):
     """Route53 record set change action."""
@@ -29,68 +51,114 @@ def print_event(event_message, event_type=None):
     logger.info("--------------------------------------------------")
 
 
-def change_resource_record_sets(
-    route53_client: boto3.client,
+def log_change(event, change_index: int, event_changes: dict):
+    """Log a change of the event, as one compact JSON line unless LOG_MODE=verbose asks for the whole event."""
+    if structured_log.is_verbose():
+        logger.info(f"Processing changes {json.dumps(event_changes, indent=4)}")
+        print_event(event, event_type="** RECORD SET CHANGE **")
+        return
+    structured_log.info(logger, "Processing change", **structured_log.change_fields(event, change_index, event_changes))
+
+
+def build_alias_change(
     change_action: RecordSetChangeAction,
     recordset_name: str,
     recordset_type: str,  # 'SOA'|'A'|'TXT'|'NS'|'CNAME'|'MX'|'NAPTR'|'PTR'|'SRV'|'SPF'|'AAAA'|'CAA'|'DS',
     alias_target_hosted_zone_id: str,
     alias_target_dns_name: str,
     alias_target_eval_target_health: bool = False,
+) -> dict:
+    """Build a single Route53 ChangeBatch change for an alias record."""
+    return {
+        "Action": RecordSetChangeAction(change_action).value,
+        "ResourceRecordSet": {
+            "Name": recordset_name,  # <url>.<domain>
+            "Type": recordset_type,
+            "AliasTarget": {
+                "HostedZoneId": alias_target_hosted_zone_id,
+                "DNSName": alias_target_dns_name,
+                "EvaluateTargetHealth": alias_target_eval_target_health,
+            },
+        },
+    }
+
+
+def change_resource_record_sets(
+    route53_client: boto3.client,
+    change_action: RecordSetChangeAction,
+    recordset_name: str,
+    recordset_type: str,  # 'SOA'|'A'|'TXT'|'NS'|'CNAME'|'MX'|'NAPTR'|'PTR'|'SRV'|'SPF'|'AAAA'|'CAA'|'DS',
+    alias_target_hosted_zone_id: str = None,
+    alias_target_dns_name: str = None,
+    alias_target_eval_target_health: bool = False,
     hosted_zone_id: str = "<insert default for company>",
+    record_set: record_change.RecordSet = None,
 ):
-    """Route53 change_resource_record_sets, created for unit testing."""
-    return route53_client.change_resource_record_sets(
-        HostedZoneId=hosted_zone_id,
-        ChangeBatch={
-            "Comment":
-            "Autogenerated from aws-route53-organization-recordset-registration for AWS Route53 recordsets.",
-            "Changes": [
-                {
-                    "Action": change_action,
-                    "ResourceRecordSet": {
-                        "Name": recordset_name,  # <url>.<domain>
-                        "Type": recordset_type,
-                        "AliasTarget": {
-                            "HostedZoneId": alias_target_hosted_zone_id, 
-                            "DNSName":
-                            alias_target_dns_name,  
-                            "EvaluateTargetHealth": alias_target_eval_target_health,
-                        },
-                    },
-                },
-            ],
-        },
+    """Route53 change_resource_record_sets, created for unit testing.
+
+    record_set is the record to write, an alias record of the alias_target arguments when not given.
+    """
+    if record_set is not None:
+        change = record_change.RecordChange(RecordSetChangeAction(change_action).value, record_set).to_api()
+    else:
+        change = build_alias_change(
+            change_action=change_action,
+            recordset_name=recordset_name,
+            recordset_type=recordset_type,
+            alias_target_hosted_zone_id=alias_target_hosted_zone_id,
+            alias_target_dns_name=alias_target_dns_name,
+            alias_target_eval_target_health=alias_target_eval_target_health,
+        )
+    return change_resource_record_sets_batch(
+        route53_client=route53_client,
+        changes=[change],
+        hosted_zone_id=hosted_zone_id,
     )
 
 
+def change_resource_record_sets_batch(
+    route53_client: boto3.client,
+    changes: List[dict],
+    hosted_zone_id: str = "<insert default for company>",
+):
+    """Route53 change_resource_record_sets for a whole ChangeBatch, created for unit testing."""
+    actions = {}
+    for change in changes:
+        action = RecordSetChangeAction(change["Action"]).value
+        actions[action] = actions.get(action, 0) + 1
+    for action, count in actions.items():
+        metrics.record("Changes", count, dimensions={"Action": action, "HostedZoneId": hosted_zone_id})
+    with metrics.span("Change", {"HostedZoneId": hosted_zone_id}):
+        return ratelimit.call(
+            route53_client.change_resource_record_sets,
+            HostedZoneId=hosted_zone_id,
+            ChangeBatch={
+                "Comment":
+                "Autogenerated from aws-route53-organization-recordset-registration for AWS Route53 recordsets.",
+                "Changes": changes,
+            },
+        )
+
+
 def list_change_recordset(
     route53_client: boto3.client,
     recordset_name: str,
     recordset_type: str,  # 'SOA'|'A'|'TXT'|'NS'|'CNAME'|'MX'|'NAPTR'|'PTR'|'SRV'|'SPF'|'AAAA'|'CAA'|'DS',
     max_items: str = "1",
     hosted_zone_id: str = "Z35UT56EKXRG2H",
+    set_identifier: Optional[str] = None,
 ):
     """List change record sets."""
-    return route53_client.list_resource_record_sets(
-        HostedZoneId=hosted_zone_id,
-        StartRecordName=recordset_name,
-        StartRecordType=recordset_type,
-        MaxItems=max_items,
-    )
-
-
-def wait_for_recordset_change(route53_client: boto3.client, change_id: str):
-    """Wait for."""
-    waiter = route53_client.get_waiter("resource_record_sets_changed")
-    # 30 seconds x 20 = 10 mins
-    waiter.wait(
-        Id=change_id,
-        WaiterConfig={
-            "Delay": 30,  # The amount of time in seconds to wait between attempts
-            "MaxAttempts": 20,  # The maximum number of attempts to be made
-        },
-    )
+    list_kwargs: Dict[str, Any] = {} if set_identifier is None else {"StartRecordIdentifier": set_identifier}
+    with metrics.span("List", {"HostedZoneId": hosted_zone_id}):
+        return ratelimit.call(
+            route53_client.list_resource_record_sets,
+            HostedZoneId=hosted_zone_id,
+            StartRecordName=recordset_name,
+            StartRecordType=recordset_type,
+            MaxItems=max_items,
+            **list_kwargs,
+        )
 
 
 def modify_route53_change_recordset(
@@ -98,29 +166,48 @@ def modify_route53_change_recordset(
     change_action: RecordSetChangeAction,
     recordset_name: str,
     recordset_type: str,  # 'SOA'|'A'|'TXT'|'NS'|'CNAME'|'MX'|'NAPTR'|'PTR'|'SRV'|'SPF'|'AAAA'|'CAA'|'DS',
-    alias_target_hosted_zone_id: str,
-    alias_target_dns_name: str,
+    alias_target_hosted_zone_id: str = None,
+    alias_target_dns_name: str = None,
     alias_target_eval_target_health: bool = False,
     hosted_zone_id: str = "<insert default for company>",
+    current_records: Dict[tuple, dict] = None,
+    record_set: record_change.RecordSet = None,
 ):
-    """Modify change recordset."""
+    """Modify change recordset.
+
+    record_set is the record to write, an alias record of the alias_target arguments when not given. current_records
+    is the index of the records already read from the zone, keyed on (normalized name, type, set identifier). A
+    DELETE looks the existing record up in it, and only lists the record when the index misses it.
+    """
     logger.info(f"Creating change recordset in {recordset_name}")
+    if record_set is None:
+        record_set = record_change.RecordSet(
+            name=recordset_name,
+            type=recordset_type,
+            alias_target=record_change.AliasTarget(alias_target_hosted_zone_id, alias_target_dns_name,
+                                                   alias_target_eval_target_health),
+        )
     try:
         if change_action == RecordSetChangeAction.delete:
-            existing_record_set = list_change_recordset(
-                route53_client=route53_client,
-                recordset_name=recordset_name,
-                recordset_type=recordset_type,
-                max_items="1",
-                hosted_zone_id=hosted_zone_id,
-            )["ResourceRecordSets"]
-            if len(existing_record_set) > 0:
-                existing_evaluate_target_health = existing_record_set[0]["AliasTarget"]["EvaluateTargetHealth"]
-                if existing_evaluate_target_health != alias_target_eval_target_health:
+            indexed = None if current_records is None else current_records.get(record_set.key())
+            if indexed is not None:
+                existing_record_set = [indexed]
+            else:
+                existing_record_set = list_change_recordset(
+                    route53_client=route53_client,
+                    recordset_name=recordset_name,
+                    recordset_type=recordset_type,
+                    max_items="1",
+                    hosted_zone_id=hosted_zone_id,
+                    set_identifier=record_set.set_identifier,
+                )["ResourceRecordSets"]
+            if len(existing_record_set) > 0 and record_change.record_key(existing_record_set[0]) == record_set.key():
+                existing = record_change.RecordSet.from_api(existing_record_set[0])
+                if existing != record_set and existing.same_target(record_set):
                     logger.warn(
-                        "Found existing record set but the EvaluateTargetHealth, this can happen when a user maunally creates the RecordSet. "
+                        "Found existing record set but the EvaluateTargetHealth or TTL differs, this can happen when a user maunally creates the RecordSet. "
                         + "The problem is that we cannot delete if this differs so changing first then deleting.")
-                    alias_target_eval_target_health = existing_evaluate_target_health
+                    record_set = existing
         response = change_resource_record_sets(
             route53_client=route53_client,
             change_action=change_action,
@@ -130,6 +217,7 @@ def modify_route53_change_recordset(
             alias_target_dns_name=alias_target_dns_name,
             alias_target_eval_target_health=alias_target_eval_target_health,
             hosted_zone_id=hosted_zone_id,
+            record_set=record_set,
         )
         return response
     except route53_client.exceptions.InvalidChangeBatch as ce:
@@ -154,67 +242,508 @@ def modify_route53_change_recordset(
                 alias_target_dns_name=alias_target_dns_name,
                 alias_target_eval_target_health=alias_target_eval_target_health,
                 hosted_zone_id=hosted_zone_id,
+                current_records=current_records,
+                record_set=record_set,
             )
         raise ce
 
 
-def process_message(event, context):
-    """Process the lambda event message."""
-    try:
-        # env = os.environ.get("ENVIRONMENT", None)
-        dest_hosted_zone_id = os.environ.get(
-            "DEST_HOSTED_ZONE_ID",
-            "<insert default hosted zone for domain>")  #  zone id - created for unit testing
-        company_domain_filter = os.environ.get("COMPANY_DOMAIN_FILTER", None)
-        [aid, sak, stok] = sts.get_sts_role_session()
-        dest_route53_client = boto3.client("route53",
-                                           aws_access_key_id=aid,
-                                           aws_secret_access_key=sak,
-                                           aws_session_token=stok)
-
-        event_details = event["detail"]["requestParameters"]
+def _change_weight(change: dict) -> tuple:
+    """Return the (ResourceRecord elements, value characters) a change counts against the batch limits."""
+    recordset = change["ResourceRecordSet"]
+    values = [record["Value"] for record in recordset.get("ResourceRecords", [])]
+    if "AliasTarget" in recordset:
+        values.append(recordset["AliasTarget"]["DNSName"])
+    multiplier = 2 if change["Action"] == RecordSetChangeAction.upsert else 1
+    return max(len(values), 1) * multiplier, sum(len(value) for value in values) * multiplier
 
-        return_status = {}
-        for event_changes in event_details["changeBatch"]["changes"]:
-            logger.info(f"Processing changes {json.dumps(event_changes, indent=4)}")
-            change_action = event_changes["action"]
-            recordset_changes = event_changes["resourceRecordSet"]
-
-            print_event(event, event_type="** RECORD SET CHANGE **")
-            # Force start will override all logic
-            if _utils.stop_processing():
-                logger.info("HALT_PROCESSING set, not starting jobs.")
-                return_status[recordset_changes["name"]] = False
-                continue
-            if company_domain_filter is not None and not recordset_changes["name"].endswith(company_domain_filter) and not recordset_changes["name"].endswith(
-                    f"{company_domain_filter}."):
-                logger.warning(
-                    f"Not permforming any change because api endpoint is not {company_domain_filter} {recordset_changes['name']}"
-                )
-                return_status[recordset_changes["name"]] = False
-                continue
-            if ("setIdentifier" in recordset_changes) and recordset_changes["setIdentifier"] != "Simple":
-                logger.warning(
-                    f"Not permforming any change because the setIdentifier is not Simple {recordset_changes['name']} {recordset_changes['setIdentifier']}. Typically this is a regional ALB deployment the user needs to handle this!"
-                )
-                return_status[recordset_changes["name"]] = False
-                continue
+
+def split_change_batch(changes: List[dict]) -> List[List[dict]]:
+    """Split changes into ChangeBatches within the Route53 per request limits, preserving order.
+
+    The limits can be lowered at runtime through the runtime configuration.
+    """
+    max_batch_records = runtime_config.get_int("ROUTE53_MAX_BATCH_RECORDS", ROUTE53_MAX_BATCH_RECORDS)
+    max_batch_chars = runtime_config.get_int("ROUTE53_MAX_BATCH_CHARS", ROUTE53_MAX_BATCH_CHARS)
+    batches = []
+    batch = []
+    batch_records = 0
+    batch_chars = 0
+    for change in changes:
+        records, chars = _change_weight(change)
+        if batch and (batch_records + records > max_batch_records or batch_chars + chars > max_batch_chars):
+            batches.append(batch)
+            batch = []
+            batch_records = 0
+            batch_chars = 0
+        batch.append(change)
+        batch_records += records
+        batch_chars += chars
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def submit_change_batch(
+    route53_client: boto3.client,
+    changes: List[dict],
+    hosted_zone_id: str = "<insert default for company>",
+    failed_changes: List[dict] = None,
+    current_records: Dict[tuple, dict] = None,
+) -> List[str]:
+    """Submit a ChangeBatch, bisecting it on InvalidChangeBatch so only the offending record is retried or skipped.
+
+    Returns the change ids that need to be waited on. When failed_changes is given the changes that could not be
+    applied are collected in it instead of raising. current_records is the prefetched index of the zone's records.
+    """
+    if len(changes) == 1:
+        # a single record falls back to the per record handling of known create/delete conflicts
+        recordset = changes[0]["ResourceRecordSet"]
+        try:
             response = modify_route53_change_recordset(
-                route53_client=dest_route53_client,
-                change_action=change_action,
-                recordset_name=recordset_changes["name"],
-                recordset_type=recordset_changes["type"],
-                alias_target_hosted_zone_id=recordset_changes["aliasTarget"]["hostedZoneId"],
-                alias_target_dns_name=recordset_changes["aliasTarget"]["dNSName"],
-                alias_target_eval_target_health=recordset_changes["aliasTarget"]["evaluateTargetHealth"],
-                hosted_zone_id=dest_hosted_zone_id, 
+                route53_client=route53_client,
+                change_action=changes[0]["Action"],
+                recordset_name=recordset["Name"],
+                recordset_type=recordset["Type"],
+                hosted_zone_id=hosted_zone_id,
+                current_records=current_records,
+                record_set=record_change.RecordSet.from_api(recordset),
             )
-            if response is not None:
-                wait_for_recordset_change(route53_client=dest_route53_client, change_id=response["ChangeInfo"]["Id"])
-                logger.info(
-                    "The change recordset finished completly, but that does not mean that DNS record is propogated to on-prem DNS servers."
-                )
+        except Exception as ex:
+            if failed_changes is None:
+                raise ex
+            logger.error(f"Unable to apply change to {recordset['Name']}: {ex}")
+            failed_changes.append(changes[0])
+            return []
+        return [] if response is None else [response["ChangeInfo"]["Id"]]
+    try:
+        response = change_resource_record_sets_batch(route53_client=route53_client,
+                                                     changes=changes,
+                                                     hosted_zone_id=hosted_zone_id)
+        return [response["ChangeInfo"]["Id"]]
+    except route53_client.exceptions.InvalidChangeBatch as ce:
+        logger.warning(f"ChangeBatch of {len(changes)} changes was rejected, bisecting to find the offending record: {ce}")
+        middle = len(changes) // 2
+        return [
+            change_id for half in (changes[:middle], changes[middle:])
+            for change_id in submit_change_batch(route53_client=route53_client,
+                                                 changes=half,
+                                                 hosted_zone_id=hosted_zone_id,
+                                                 failed_changes=failed_changes,
+                                                 current_records=current_records)
+        ]
+    except Exception as ex:
+        if failed_changes is None:
+            raise ex
+        logger.error(f"Unable to apply ChangeBatch of {len(changes)} changes: {ex}")
+        failed_changes.extend(changes)
+        return []
+
+
+def submit_changes(route53_client: boto3.client,
+                   changes_by_zone: Dict[str, List[dict]],
+                   failed_changes: List[dict] = None,
+                   current_by_zone: Dict[str, Dict[tuple, dict]] = None) -> Dict[str, tuple]:
+    """Submit one ChangeBatch per destination hosted zone, split at the Route53 limits.
+
+    Returns the submitted change ids mapped to their (hosted zone id, record names). current_by_zone holds the
+    records prefetched per zone, without it a single DELETE lists its record first.
+    """
+    change_ids = {}
+    for hosted_zone_id, changes in changes_by_zone.items():
+        current_records = None if current_by_zone is None else current_by_zone.get(hosted_zone_id, {})
+        for batch in split_change_batch(changes):
+            for change_id in submit_change_batch(route53_client=route53_client,
+                                                 changes=batch,
+                                                 hosted_zone_id=hosted_zone_id,
+                                                 failed_changes=failed_changes,
+                                                 current_records=current_records):
+                change_ids[change_id] = (hosted_zone_id, [change["ResourceRecordSet"]["Name"] for change in batch])
+    return change_ids
+
+
+def wait_for_changes(route53_client: boto3.client,
+                     change_ids: Dict[str, tuple],
+                     role_arn: str = None,
+                     context=None,
+                     checkpoint: continuation.Checkpoint = None):
+    """Wait for all submitted changes with one shared poller, or record them for the poller with WAIT_MODE=async.
+
+    Changes still pending when the poller gives up are handed to the pending changes table when there is one, to
+    the checkpoint of the invocation when given, otherwise the invocation fails like the waiter did.
+    """
+    if not change_ids:
+        return
+    if change_tracker.is_async_wait():
+        for change_id, (hosted_zone_id, names) in change_ids.items():
+            change_tracker.track_change(change_id=change_id, hosted_zone_id=hosted_zone_id, names=names,
+                                        role_arn=role_arn)
+        return
+    wait_started = time.perf_counter()
+    statuses = change_poller.poll_changes(route53_client, list(change_ids), context=context)
+    wait_ms = (time.perf_counter() - wait_started) * 1000
+    for hosted_zone_id in {hosted_zone_id for hosted_zone_id, _ in change_ids.values()}:
+        metrics.record("WaitDuration", wait_ms, unit="Milliseconds", dimensions={"HostedZoneId": hosted_zone_id})
+    pending = [change_id for change_id, status in statuses.items() if status != change_poller.INSYNC]
+    if pending and os.environ.get("PENDING_CHANGES_TABLE"):
+        for change_id in pending:
+            hosted_zone_id, names = change_ids[change_id]
+            change_tracker.track_change(change_id=change_id, hosted_zone_id=hosted_zone_id, names=names,
+                                        role_arn=role_arn)
+        return
+    if pending and checkpoint is not None:
+        for change_id in pending:
+            hosted_zone_id, names = change_ids[change_id]
+            checkpoint.pending[change_id] = (hosted_zone_id, names, role_arn)
+        return
+    if pending:
+        raise Exception(f"Route53 changes {pending} did not reach INSYNC in time.")
+    logger.info(
+        "The change recordset finished completly, but that does not mean that DNS record is propogated to on-prem DNS servers."
+    )
+
+
+def apply_changes(route53_client: boto3.client,
+                  changes_by_zone: Dict[str, List[dict]],
+                  role_arn: str = None,
+                  failed_changes: List[dict] = None,
+                  context=None,
+                  checkpoint: continuation.Checkpoint = None):
+    """Submit one ChangeBatch per destination hosted zone, split at the Route53 limits, then wait once.
+
+    The changes are first diffed against the destination zones so records that are already correct cost no write
+    or wait. The records read for the diff are the index the DELETE payloads are built from. With WAIT_MODE=async
+    the change ids are recorded for the poller instead of waited on.
+    """
+    current_by_zone = {}
+    changes_by_zone = recordset_diff.diff_changes(route53_client, changes_by_zone, current_by_zone)
+    change_ids = submit_changes(route53_client=route53_client,
+                                changes_by_zone=changes_by_zone,
+                                failed_changes=failed_changes,
+                                current_by_zone=current_by_zone)
+    wait_for_changes(route53_client=route53_client,
+                     change_ids=change_ids,
+                     role_arn=role_arn,
+                     context=context,
+                     checkpoint=checkpoint)
+
+
+def _apply_destination(role_arn: Optional[str],
+                       changes_by_zone: Dict[str, List[dict]],
+                       failed_changes: List[dict] = None,
+                       checkpoint: continuation.Checkpoint = None):
+    """Apply the changes of the zones written by one role with its cached client, deferring them past the deadline."""
+    if checkpoint is not None and checkpoint.deadline_near():
+        for changes in changes_by_zone.values():
+            checkpoint.deferred.extend(changes)
+        return
+    dest_route53_client = sts.get_route53_client(role_arn=role_arn)
+    logger.info(f"Assumed role session cache {sts.get_cache_stats()}")
+    apply_changes(route53_client=dest_route53_client,
+                  changes_by_zone=changes_by_zone,
+                  role_arn=role_arn,
+                  failed_changes=failed_changes,
+                  context=checkpoint.context if checkpoint is not None else None,
+                  checkpoint=checkpoint)
+    if checkpoint is not None:
+        for changes in changes_by_zone.values():
+            checkpoint.completed.extend(changes)
+
+
+def apply_routed_changes(changes_by_zone: Dict[str, List[dict]],
+                         failed_changes: List[dict] = None,
+                         checkpoint: continuation.Checkpoint = None,
+                         destination_status: Dict[str, bool] = None):
+    """Apply the changes of every destination hosted zone through the role its route writes with.
+
+    With a checkpoint the applied changes are recorded in it, and the destinations not started before the deadline
+    gets close are deferred to it. When a route fans out to several destinations every destination zone is applied
+    concurrently, up to FANOUT_WORKERS at a time. With destination_status every zone is reported in it, and the
+    changes of a zone that failed are added to failed_changes instead of raising once the other zones finished.
+    """
+    routing_table = routing.get_routing_table()
+    changes_by_destination = {}
+    for hosted_zone_id, changes in changes_by_zone.items():
+        role_arn = routing_table.role_arn(hosted_zone_id)
+        # without fan-out the zones of a role share one write and wait step
+        destination = (role_arn, hosted_zone_id if routing_table.fan_out else None)
+        changes_by_destination.setdefault(destination, {})[hosted_zone_id] = changes
+
+    errors = {}
+    if routing_table.fan_out and len(changes_by_destination) > 1:
+        with ThreadPoolExecutor(max_workers=min(FANOUT_WORKERS, len(changes_by_destination))) as executor:
+            futures = {
+                destination: executor.submit(_apply_destination, destination[0], destination_changes, failed_changes,
+                                             checkpoint)
+                for destination, destination_changes in changes_by_destination.items()
+            }
+        for destination, future in futures.items():
+            if future.exception() is not None:
+                errors[destination] = future.exception()
+    else:
+        for destination, destination_changes in changes_by_destination.items():
+            try:
+                _apply_destination(destination[0], destination_changes, failed_changes, checkpoint)
+            except Exception as ex:
+                if destination_status is None:
+                    raise ex
+                errors[destination] = ex
+
+    for destination, destination_changes in changes_by_destination.items():
+        error = errors.get(destination)
+        if error is not None and destination_status is None:
+            raise error
+        for hosted_zone_id, changes in destination_changes.items():
+            if destination_status is not None:
+                destination_status[hosted_zone_id] = error is None
+            if error is not None:
+                # logged with the handler error prefix so the existing failure metric filter raises the alarm
+                logger.error(f"Lambda ERROR aws-route53-organization-recordset-registration: unable to apply "
+                             f"{len(changes)} changes to hosted zone {hosted_zone_id}: {error}")
+                metrics.record("DestinationFailures", dimensions={"HostedZoneId": hosted_zone_id})
+                if failed_changes is not None:
+                    failed_changes.extend(changes)
+    if changes_by_destination:
+        logger.info(f"Route53 rate limiter {ratelimit.get_stats()}")
+
+
+def filter_event_changes(event,
+                         return_status: dict,
+                         idempotency_keys: dict = None,
+                         change_indexes: dict = None,
+                         destination_changes: dict = None,
+                         claim_version: Callable[..., bool] = None) -> Dict[str, List[dict]]:
+    """Filter the CloudTrail changes of an event, returning the Route53 changes to apply per destination zone.
+
+    Every change is reported in return_status, False for the filtered ones and the cached status for changes
+    already completed by an earlier delivery or invocation of the event. idempotency_keys collects the key and
+    change_indexes the index in the event of every change to apply. A change routed to several destinations is
+    copied for every other zone, destination_changes maps the id of the change to its CloudTrail record name and
+    the change of every zone.
+    claim_version replaces record_versions.claim, the planner checks versions with it without recording them.
+    """
+    claim_version = claim_version or record_versions.claim
+    routing_table = routing.get_routing_table()
+    event_details = event["detail"]["requestParameters"]
+    completed_indexes = continuation.completed_indexes(event)
+
+    if not structured_log.is_verbose():
+        structured_log.sample_event(logger, event, "** RECORD SET CHANGE **")
+    changes_by_zone = {}
+    for change_index, event_changes in enumerate(event_details["changeBatch"]["changes"]):
+        log_change(event, change_index, event_changes)
+        change_action = event_changes["action"]
+        recordset_changes = event_changes["resourceRecordSet"]
+
+        # Force start will override all logic
+        if _utils.stop_processing():
+            logger.info("HALT_PROCESSING set, not starting jobs.")
+            metrics.record("SkippedChanges", dimensions={"Action": change_action, "Reason": "Halted"})
+            return_status[recordset_changes["name"]] = False
+            continue
+        skip_reason = event_filter.recordset_skip_reason(recordset_changes["name"], recordset_changes.get("setIdentifier"))
+        if skip_reason is not None:
+            logger.warning(skip_reason)
+            metrics.record("SkippedChanges", dimensions={"Action": change_action, "Reason": "Filtered"})
+            return_status[recordset_changes["name"]] = False
+            continue
+        if change_index in completed_indexes:
+            logger.info(f"Change {change_index} was already submitted by an earlier invocation, skipping")
             return_status[recordset_changes["name"]] = True
+            continue
+        idempotency_key = idempotency.idempotency_key(event, change_index)
+        completed_status = idempotency.get_status(idempotency_key)
+        if completed_status is not None:
+            logger.info(f"Change {idempotency_key} was already completed by an earlier delivery, skipping")
+            metrics.record("SkippedChanges", dimensions={"Action": change_action, "Reason": "Duplicate"})
+            return_status[recordset_changes["name"]] = completed_status
+            continue
+        try:
+            record = record_change.RecordChange.from_cloudtrail(event_changes)
+        except record_change.UnsupportedRecordSet as ex:
+            logger.warning(f"Not permforming any change because {ex}")
+            metrics.record("SkippedChanges", dimensions={"Action": change_action, "Reason": "Unsupported"})
+            return_status[recordset_changes["name"]] = False
+            continue
+        version = record_versions.change_version(event)
+        change = None
+        zone_changes = {}
+        for destination in routing_table.route_all(recordset_changes["name"]):
+            if not claim_version(destination.hosted_zone_id, recordset_changes["name"], recordset_changes["type"],
+                                 version, set_identifier=record.record_set.set_identifier):
+                logger.warning(f"Skipping {change_action} of {recordset_changes['name']} in hosted zone "
+                               f"{destination.hosted_zone_id}, a later change of the record was already applied")
+                metrics.record("SkippedChanges", dimensions={"Action": change_action, "Reason": "Stale"})
+                continue
+            # the diff rewrites the changes in place, every zone gets its own
+            zone_change = record.to_api()
+            change = change or zone_change
+            zone_changes[destination.hosted_zone_id] = zone_change
+            changes_by_zone.setdefault(destination.hosted_zone_id, []).append(zone_change)
+        if not zone_changes:
+            return_status[recordset_changes["name"]] = False
+            continue
+        if destination_changes is not None:
+            # the diff replaces a DELETE's record with the listed one, the name is kept as the event has it
+            destination_changes[id(change)] = (recordset_changes["name"], zone_changes)
+        if idempotency_keys is not None:
+            idempotency_keys[idempotency_key] = change
+        if change_indexes is not None:
+            change_indexes[change_index] = change
+        # only reported once apply_changes returns, any failure raises out of the invocation
+        return_status[recordset_changes["name"]] = True
+    return changes_by_zone
+
+
+def wait_for_pending_changes(pending: Dict[str, tuple], checkpoint: continuation.Checkpoint):
+    """Wait for the changes an earlier invocation left pending, grouped by the role they were written with."""
+    pending_by_role = {}
+    for change_id, (hosted_zone_id, names, role_arn) in pending.items():
+        pending_by_role.setdefault(role_arn, {})[change_id] = (hosted_zone_id, names)
+    for role_arn, change_ids in pending_by_role.items():
+        wait_for_changes(route53_client=sts.get_route53_client(role_arn=role_arn),
+                         change_ids=change_ids,
+                         role_arn=role_arn,
+                         context=checkpoint.context,
+                         checkpoint=checkpoint)
+
+
+def process_message(event, context):
+    """Process the lambda event message.
+
+    When the invocation gets close to its timeout the changes already submitted are checkpointed and the rest of
+    the event is handed to a continuation invocation, instead of the timeout retrying the whole event. A record
+    mirrored into several destinations is reported with the status of every destination hosted zone. When a
+    destination fails the others are still applied, then the invocation fails so EventBridge retries the event.
+    """
+    try:
+        return_status = {}
+        idempotency_keys = {}
+        change_indexes = {}
+        destination_changes = {}
+        checkpoint = continuation.Checkpoint(context)
+        changes_by_zone = filter_event_changes(event, return_status, idempotency_keys, change_indexes,
+                                               destination_changes)
+        wait_for_pending_changes(continuation.pending_changes(event), checkpoint)
+        # a destination failing does not stop the others from being mirrored to
+        destination_status = {} if routing.get_routing_table().fan_out else None
+        apply_routed_changes(changes_by_zone, checkpoint=checkpoint, destination_status=destination_status)
+        failed_zones = sorted(hosted_zone_id for hosted_zone_id, applied in (destination_status or {}).items()
+                              if not applied)
+        applied = {id(change) for change in checkpoint.completed}
+        completed = set()
+        for change_id, (name, zone_changes) in destination_changes.items():
+            if all(id(zone_change) in applied for zone_change in zone_changes.values()):
+                completed.add(change_id)
+            if len(zone_changes) > 1:
+                return_status[name] = {
+                    hosted_zone_id: id(zone_change) in applied
+                    for hosted_zone_id, zone_change in zone_changes.items()
+                }
+            elif failed_zones:
+                return_status[name] = not set(zone_changes).intersection(failed_zones)
+        for idempotency_key, change in idempotency_keys.items():
+            if id(change) in completed:
+                idempotency.save_status(idempotency_key, True)
+        if failed_zones:
+            # the retried event finds the zones that were applied up to date, only the failed ones are written
+            raise Exception(f"Unable to apply the changes to hosted zones {failed_zones}, status {return_status}")
+        if checkpoint.interrupted:
+            completed_indexes = [index for index, change in change_indexes.items() if id(change) in completed]
+            continuation.invoke_continuation(continuation.continuation_event(event, completed_indexes, checkpoint),
+                                             context)
         return return_status
     except Exception as ex:
         raise ex
+
+
+def _record_key(hosted_zone_id: str, change: dict) -> tuple:
+    """Return the (zone, record name, record type, set identifier) changes to the same record are coalesced on."""
+    return (hosted_zone_id, ) + record_change.record_key(change["ResourceRecordSet"])
+
+
+def coalesce_events(messages: List[tuple], failed_message_ids: set) -> Dict[tuple, tuple]:
+    """Collapse the changes of many (message id, event time, event) to the last effective action per record.
+
+    Returns the record key mapped to the change to apply and every message id and idempotency key that
+    contributed to it.
+    """
+    # SQS does not keep the order the changes were made in, the CloudTrail eventTime does
+    messages = sorted(messages, key=lambda message: message[1])
+    return_status = {}
+    coalesced = {}
+    for message_id, _, event in messages:
+        idempotency_keys = {}
+        destination_changes = {}
+        try:
+            changes_by_zone = filter_event_changes(event, return_status, idempotency_keys,
+                                                   destination_changes=destination_changes)
+        except Exception as ex:
+            logger.error(f"Unable to process message {message_id}: {ex}")
+            failed_message_ids.add(message_id)
+            continue
+        # every zone copy of a change carries its key, so a failed copy keeps the key from being saved
+        change_idempotency_keys = {
+            id(zone_change): key
+            for key, change in idempotency_keys.items()
+            for zone_change in destination_changes[id(change)][1].values()
+        }
+        for hosted_zone_id, changes in changes_by_zone.items():
+            for change in changes:
+                key = _record_key(hosted_zone_id, change)
+                message_ids = [message_id]
+                keys = [change_idempotency_keys.get(id(change))]
+                previous = coalesced.pop(key, None)
+                if previous is not None:
+                    message_ids = previous[1] + message_ids
+                    keys = previous[2] + keys
+                    if change["Action"] == RecordSetChangeAction.create:
+                        # the record may or may not exist after the earlier actions in the window
+                        change = {**change, "Action": RecordSetChangeAction.upsert.value}
+                coalesced[key] = (change, message_ids, keys)
+    logger.info(f"Coalesced {len(messages)} events into {len(coalesced)} record changes {return_status}")
+    return coalesced
+
+
+def process_sqs_batch(event, context):
+    """Process a batch of SQS buffered EventBridge events.
+
+    The coalesced changes are applied with as few ChangeBatches as possible and failed messages are reported as a
+    partial batch response so only those are redelivered.
+    """
+    failed_message_ids = set()
+    messages = []
+    for record in event["Records"]:
+        try:
+            message = json.loads(record["body"])
+            messages.append((record["messageId"], message["detail"]["eventTime"], message))
+        except (ValueError, KeyError, TypeError) as ex:
+            logger.error(f"Unable to parse message {record['messageId']}: {ex}")
+            failed_message_ids.add(record["messageId"])
+
+    coalesced = coalesce_events(messages, failed_message_ids)
+    if coalesced:
+        changes_by_zone = {}
+        for (hosted_zone_id, *_), (change, _, _) in coalesced.items():
+            changes_by_zone.setdefault(hosted_zone_id, []).append(change)
+        failed_changes = []
+        checkpoint = continuation.Checkpoint(context)
+        # a destination failing only redelivers the messages of its own records
+        apply_routed_changes(changes_by_zone, failed_changes=failed_changes, checkpoint=checkpoint,
+                             destination_status={})
+        if checkpoint.pending:
+            logger.warning(f"Stopped waiting for changes still pending {list(checkpoint.pending)}")
+        # SQS redelivers the messages of the changes deferred past the deadline
+        failed_change_ids = {id(change) for change in failed_changes + checkpoint.deferred}
+        failed_keys = set()
+        for change, message_ids, keys in coalesced.values():
+            if id(change) in failed_change_ids:
+                failed_message_ids.update(message_ids)
+                failed_keys.update(keys)
+        # a change mirrored into several zones is only completed once every zone applied it
+        for change, _, keys in coalesced.values():
+            if id(change) not in failed_change_ids:
+                for idempotency_key in keys:
+                    if idempotency_key not in failed_keys:
+                        idempotency.save_status(idempotency_key, True)
+    return {"batchItemFailures": [{"itemIdentifier": message_id} for message_id in sorted(failed_message_ids)]}
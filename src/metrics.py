@@ -0,0 +1,91 @@
+"""CloudWatch Embedded Metric Format (EMF) output."""
+import contextlib
+import json
+import os
+import threading
+import time
+
+METRICS_NAMESPACE = os.environ.get("METRICS_NAMESPACE", "Route53RecordsetRegistration")
+EMF_MAX_VALUES = 100  # CloudWatch accepts at most 100 values per metric in one EMF document
+
+
+def put_metric(name: str, value: float, unit: str = "None", dimensions: dict = None):
+    """Print a single metric as an EMF log line, CloudWatch extracts it from the Lambda log stream."""
+    dimensions = dimensions or {}
+    emf = {
+        "_aws": {
+            "Timestamp": int(time.time() * 1000),
+            "CloudWatchMetrics": [{
+                "Namespace": METRICS_NAMESPACE,
+                "Dimensions": [list(dimensions.keys())],
+                "Metrics": [{
+                    "Name": name,
+                    "Unit": unit
+                }],
+            }],
+        },
+        name: value,
+        **dimensions,
+    }
+    print(json.dumps(emf))
+
+
+_lock = threading.Lock()
+_pending = {}  # sorted dimension items -> {metric name: (unit, [values])}
+
+
+def record(name: str, value: float = 1, unit: str = "Count", dimensions: dict = None):
+    """Buffer a metric value until flush, every value of the invocation is emitted in one EMF line per dimension set."""
+    key = tuple(sorted((dimensions or {}).items()))
+    with _lock:
+        metrics = _pending.setdefault(key, {})
+        metrics.setdefault(name, (unit, []))[1].append(value)
+
+
+@contextlib.contextmanager
+def span(phase: str, dimensions: dict = None):
+    """Time the block and record it as the <phase>Duration metric in milliseconds."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(f"{phase}Duration", (time.perf_counter() - start) * 1000, unit="Milliseconds", dimensions=dimensions)
+
+
+def flush():
+    """Print the buffered metrics as EMF, one line per dimension set with the values of each metric as an array."""
+    with _lock:
+        pending = dict(_pending)
+        _pending.clear()
+    timestamp = int(time.time() * 1000)
+    for key, metrics in pending.items():
+        dimensions = dict(key)
+        longest = max(len(values) for _, values in metrics.values())
+        for offset in range(0, longest, EMF_MAX_VALUES):
+            chunk = {
+                name: (unit, values[offset:offset + EMF_MAX_VALUES])
+                for name, (unit, values) in metrics.items() if len(values) > offset
+            }
+            emf = {
+                "_aws": {
+                    "Timestamp": timestamp,
+                    "CloudWatchMetrics": [{
+                        "Namespace": METRICS_NAMESPACE,
+                        "Dimensions": [list(dimensions.keys())],
+                        "Metrics": [{
+                            "Name": name,
+                            "Unit": unit
+                        } for name, (unit, _) in chunk.items()],
+                    }],
+                },
+                **{name: values if len(values) > 1 else values[0]
+                   for name, (_, values) in chunk.items()},
+                **dimensions,
+            }
+            print(json.dumps(emf))
+
+
+def clear():
+    """Drop the buffered metrics without emitting them."""
+    with _lock:
+        _pending.clear()
@@ -0,0 +1,324 @@
+"""Plan what process_message would change, and what it would cost, without writing anything.
+
+Events run through the same filtering, routing, version and diff steps as process_message, against a snapshot of
+every destination zone read once. The plan holds the ChangeBatch changes per destination zone, the Route53 reads,
+writes, batches and get_change polls they take, and an estimate of the wall-clock time. Planned changes are applied
+to the snapshots, so the later events of a replay are diffed against the state the earlier ones leave.
+
+    python src/planner.py events.jsonl --snapshot-dir .zone-snapshots
+
+The file holds one EventBridge event per line, a JSON list of events or a CloudTrail log file.
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+from typing import Any, Dict, Iterator, List, Optional, TextIO, Tuple
+
+import backfill
+import change_poller
+import change_tracker
+import message_processing
+import ratelimit
+import record_change
+import record_versions
+import recordset_diff
+import routing
+import sts
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# Route53 usually reports a change INSYNC within a minute
+PLAN_PROPAGATION_SECONDS = float(os.environ.get("PLAN_PROPAGATION_SECONDS", "60"))
+# round trip of one Route53 API call
+PLAN_CALL_SECONDS = float(os.environ.get("PLAN_CALL_SECONDS", "0.1"))
+PLAN_CHANGE_LIMIT = int(os.environ.get("PLAN_CHANGE_LIMIT", "1000"))
+# how long the Lambda plan mode reuses the snapshot of a zone
+PLAN_SNAPSHOT_TTL_SECONDS = int(os.environ.get("PLAN_SNAPSHOT_TTL_SECONDS", "300"))
+
+_snapshots: Dict[str, Tuple[float, "ZoneSnapshot"]] = {}
+
+
+def _order_key(key: tuple) -> tuple:
+    """Return the key Route53 lists a record in, reversed labels then type then set identifier."""
+    return recordset_diff.route53_sort_key(key[0]), key[1], key[2] or ""
+
+
+class ZoneSnapshot:
+    """Records of a hosted zone, listed page by page like list_resource_record_sets."""
+    def __init__(self, hosted_zone_id: str, records: Dict[tuple, dict]):
+        """Initialize the snapshot with the records of the zone keyed on (normalized name, type, set identifier)."""
+        self.hosted_zone_id = hosted_zone_id
+        self.records = records
+        self.list_calls = 0
+        # the record keys in the order Route53 lists them, sorted on the first listed page
+        self._order: Optional[List[tuple]] = None
+
+    @classmethod
+    def read(cls, route53_client, hosted_zone_id: str) -> "ZoneSnapshot":
+        """Read every record of the zone."""
+        records = {
+            record_change.record_key(recordset): recordset
+            for recordset in recordset_diff.iter_record_sets(route53_client, hosted_zone_id)
+        }
+        logger.info(f"Read a snapshot of {len(records)} records of hosted zone {hosted_zone_id}")
+        return cls(hosted_zone_id, records)
+
+    def copy(self) -> "ZoneSnapshot":
+        """Return a snapshot planned changes can be applied to, sharing the record sets."""
+        snapshot = ZoneSnapshot(self.hosted_zone_id, dict(self.records))
+        snapshot._order = self._order
+        return snapshot
+
+    def list_page(self,
+                  HostedZoneId: str,
+                  StartRecordName: Optional[str] = None,
+                  StartRecordType: Optional[str] = None,
+                  StartRecordIdentifier: Optional[str] = None,
+                  MaxItems: str = "300") -> dict:
+        """Return a page of list_resource_record_sets, counting the call."""
+        self.list_calls += 1
+        if self._order is None:
+            self._order = sorted(self.records, key=_order_key)
+        keys = self._order
+        if StartRecordName is not None:
+            start = (recordset_diff.route53_sort_key(StartRecordName), StartRecordType or "",
+                     StartRecordIdentifier or "")
+            keys = [key for key in keys if _order_key(key) >= start]
+        page_size = min(int(MaxItems), 300)
+        response = {"ResourceRecordSets": [self.records[key] for key in keys[:page_size]],
+                    "IsTruncated": len(keys) > page_size}
+        if response["IsTruncated"]:
+            name, record_type, set_identifier = keys[page_size]
+            response["NextRecordName"] = f"{name}."
+            response["NextRecordType"] = record_type
+            if set_identifier is not None:
+                response["NextRecordIdentifier"] = set_identifier
+        return response
+
+    def apply(self, changes: List[dict]):
+        """Apply planned changes to the snapshot."""
+        for change in changes:
+            key = record_change.record_key(change["ResourceRecordSet"])
+            if change["Action"] == message_processing.RecordSetChangeAction.delete:
+                self.records.pop(key, None)
+            else:
+                self.records[key] = change["ResourceRecordSet"]
+        self._order = None
+
+    def save(self, path: str):
+        """Write the record sets of the snapshot to a JSON file."""
+        with open(path, "w") as snapshot_file:
+            json.dump(list(self.records.values()), snapshot_file, default=str)
+
+    @classmethod
+    def load(cls, hosted_zone_id: str, path: str) -> "ZoneSnapshot":
+        """Read the snapshot of a zone saved to a JSON file."""
+        with open(path) as snapshot_file:
+            recordsets = json.load(snapshot_file)
+        return cls(hosted_zone_id, {record_change.record_key(recordset): recordset for recordset in recordsets})
+
+
+def get_snapshot(hosted_zone_id: str, snapshot_dir: Optional[str] = None) -> ZoneSnapshot:
+    """Return the snapshot of a destination zone, read through the role its route writes with.
+
+    With snapshot_dir the snapshot is kept in a file of the zone and only read when there is none, otherwise it is
+    kept in memory for PLAN_SNAPSHOT_TTL_SECONDS.
+    """
+    path = os.path.join(snapshot_dir, f"{hosted_zone_id}.json") if snapshot_dir else None
+    if path is not None and os.path.exists(path):
+        return ZoneSnapshot.load(hosted_zone_id, path)
+    cached = _snapshots.get(hosted_zone_id)
+    if path is None and cached is not None and time.monotonic() - cached[0] < PLAN_SNAPSHOT_TTL_SECONDS:
+        return cached[1]
+    route53_client = sts.get_route53_client(role_arn=routing.get_routing_table().role_arn(hosted_zone_id))
+    snapshot = ZoneSnapshot.read(route53_client, hosted_zone_id)
+    if path is not None:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        snapshot.save(path)
+    else:
+        _snapshots[hosted_zone_id] = (time.monotonic(), snapshot)
+    return snapshot
+
+
+def clear_snapshots():
+    """Drop the in-memory snapshots."""
+    _snapshots.clear()
+
+
+class PlannedVersions:
+    """Record versions seen by a plan, checked against the version store without recording them."""
+    def __init__(self):
+        """Initialize the plan without versions seen."""
+        self.versions: Dict[str, str] = {}
+
+    def claim(self, hosted_zone_id: str, recordset_name: str, recordset_type: str, version: str,
+              set_identifier: Optional[str] = None) -> bool:
+        """Return whether the change would be applied, like record_versions.claim, keeping its version in the plan."""
+        if version is None:
+            return True
+        key = record_versions.record_key(hosted_zone_id, recordset_name, recordset_type, set_identifier)
+        planned = self.versions.get(key)
+        if planned is not None and planned > version:
+            return False
+        if planned is None and record_versions.is_stale(hosted_zone_id, recordset_name, recordset_type, version,
+                                                        set_identifier=set_identifier):
+            return False
+        self.versions[key] = version
+        return True
+
+
+def estimate_wait(batches: int) -> tuple:
+    """Return the (seconds, get_change calls) the shared poller takes for changes INSYNC after the propagation time.
+
+    Every poll reads each pending change, so each batch is polled until the first poll at or after
+    PLAN_PROPAGATION_SECONDS, or until the poller gives up at CHANGE_POLL_TIMEOUT_SECONDS.
+    """
+    if not batches or change_tracker.is_async_wait():
+        return 0.0, 0
+    elapsed = 0.0
+    delay = change_poller.CHANGE_POLL_INITIAL_DELAY_SECONDS
+    polls = 0
+    while elapsed < PLAN_PROPAGATION_SECONDS and elapsed + delay <= change_poller.CHANGE_POLL_TIMEOUT_SECONDS:
+        elapsed += delay
+        polls += 1
+        delay = min(change_poller.CHANGE_POLL_MAX_DELAY_SECONDS, delay * change_poller.CHANGE_POLL_BACKOFF)
+    return elapsed, polls * batches
+
+
+def estimate_call_seconds(calls: int) -> float:
+    """Return the seconds the calls take one after another through the Route53 token bucket."""
+    throttled = (calls - ratelimit.ROUTE53_BURST) / ratelimit.ROUTE53_REQUESTS_PER_SECOND
+    return max(calls * PLAN_CALL_SECONDS, throttled)
+
+
+def plan_event(event: dict,
+               snapshots: Dict[str, ZoneSnapshot],
+               versions: Optional[PlannedVersions] = None,
+               snapshot_dir: Optional[str] = None) -> dict:
+    """Plan the changes of one event like process_message applies them, updating the snapshots with them.
+
+    Returns the status of every change, the changes per destination zone, the API calls and the estimated
+    seconds. A ChangeBatch Route53 rejects is bisected by process_message, those extra calls are not estimated.
+    """
+    return_status: Dict[str, Any] = {}
+    versions = versions or PlannedVersions()
+    changes_by_zone = message_processing.filter_event_changes(event, return_status, claim_version=versions.claim)
+    plan = {}
+    reads = 0
+    batches = 0
+    for hosted_zone_id, changes in changes_by_zone.items():
+        if hosted_zone_id not in snapshots:
+            snapshots[hosted_zone_id] = get_snapshot(hosted_zone_id, snapshot_dir).copy()
+        snapshot = snapshots[hosted_zone_id]
+        list_calls = snapshot.list_calls
+        current = recordset_diff.fetch_current_records(None, hosted_zone_id,
+                                                       [change["ResourceRecordSet"]["Name"] for change in changes],
+                                                       list_page=snapshot.list_page)
+        reads += snapshot.list_calls - list_calls
+        minimal = recordset_diff.diff_zone_changes(changes, current)
+        batches += len(message_processing.split_change_batch(minimal))
+        snapshot.apply(minimal)
+        if minimal:
+            plan[hosted_zone_id] = minimal
+    wait_seconds, polls = estimate_wait(batches)
+    call_seconds = estimate_call_seconds(reads + batches)
+    return {
+        "event_id": event.get("detail", {}).get("eventID") or event.get("id"),
+        "status": return_status,
+        "changes": plan,
+        "batches": batches,
+        "api_calls": {"ListResourceRecordSets": reads, "ChangeResourceRecordSets": batches, "GetChange": polls},
+        "estimated_seconds": {"api": call_seconds, "wait": wait_seconds, "total": call_seconds + wait_seconds},
+    }
+
+
+def plan_message(event, context) -> dict:
+    """Plan a Lambda event with PLAN_MODE=true, logging and returning the plan instead of applying it."""
+    result = plan_event(event, {})
+    logger.info(f"Plan {json.dumps(result, default=str)}")
+    return result
+
+
+def plan_events(events: Iterator[dict], snapshot_dir: Optional[str] = None, change_limit: Optional[int] = None) -> dict:
+    """Plan a replay of events in order, returning the totals and the plan of every event.
+
+    The listed changes are capped at PLAN_CHANGE_LIMIT, the counts always cover every event. The estimated seconds
+    add up the events as if they were processed one after another.
+    """
+    change_limit = PLAN_CHANGE_LIMIT if change_limit is None else change_limit
+    snapshots: Dict[str, ZoneSnapshot] = {}
+    versions = PlannedVersions()
+    totals: Dict[str, Any] = {
+        "events": 0,
+        "changes": {"CREATE": 0, "UPSERT": 0, "DELETE": 0},
+        "batches": 0,
+        "api_calls": {"ListResourceRecordSets": 0, "ChangeResourceRecordSets": 0, "GetChange": 0},
+        "estimated_seconds": {"api": 0.0, "wait": 0.0, "total": 0.0},
+    }
+    planned = []
+    listed = 0
+    for event in events:
+        result = plan_event(event, snapshots, versions, snapshot_dir)
+        totals["events"] += 1
+        totals["batches"] += result["batches"]
+        for hosted_zone_id, changes in result["changes"].items():
+            for change in changes:
+                totals["changes"][change["Action"]] += 1
+            if listed + len(changes) > change_limit:
+                result["changes"][hosted_zone_id] = changes[:max(0, change_limit - listed)]
+            listed += len(result["changes"][hosted_zone_id])
+        for field in ("api_calls", "estimated_seconds"):
+            for key, value in result[field].items():
+                totals[field][key] += value
+        planned.append(result)
+    return {"totals": totals, "events": planned}
+
+
+def iter_events(stream: TextIO) -> Iterator[dict]:
+    """Yield the EventBridge events of a JSON lines file, a JSON list, one event or a CloudTrail log file."""
+    first = stream.read(1)
+    while first and first.isspace():
+        first = stream.read(1)
+    if first == "[":
+        yield from json.loads(first + stream.read())
+        return
+    text = first + stream.read()
+    try:
+        document = json.loads(text)
+    except json.JSONDecodeError:
+        for line in text.splitlines():
+            if line.strip():
+                yield json.loads(line)
+        return
+    if "Records" in document:
+        for record in document["Records"]:
+            if backfill.is_change_record(record):
+                yield {"id": record.get("eventID"), "time": record.get("eventTime"), "detail": record}
+        return
+    yield document
+
+
+def main(argv: Optional[List[str]] = None):
+    """Print the plan of the events of a file or stdin."""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("events", help="file of EventBridge events, - for stdin")
+    parser.add_argument("--snapshot-dir", help="directory the destination zone snapshots are kept in and reused from")
+    parser.add_argument("--change-limit", type=int, default=PLAN_CHANGE_LIMIT, help="changes listed in the plan")
+    parser.add_argument("--summary", action="store_true", help="only print the totals")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.WARNING, format="%(asctime)s %(levelname)s %(message)s")
+    if args.events == "-":
+        result = plan_events(iter_events(sys.stdin), snapshot_dir=args.snapshot_dir, change_limit=args.change_limit)
+    else:
+        with open(args.events) as events_file:
+            result = plan_events(iter_events(events_file), snapshot_dir=args.snapshot_dir,
+                                 change_limit=args.change_limit)
+    print(json.dumps(result["totals"] if args.summary else result, indent=2, default=str))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,153 @@
+"""Shared token bucket and adaptive backoff for Route53 and STS API calls.
+
+The clients are built without botocore retries, so every attempt goes through the bucket and a throttle is
+counted and backed off from here only once.
+"""
+import logging
+import os
+import random
+import threading
+import time
+from typing import Optional
+
+from botocore import exceptions as botocore_exceptions
+from botocore.exceptions import ClientError
+
+import metrics
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# Route53 allows five requests per second per account, shared by every Lambda instance
+ROUTE53_REQUESTS_PER_SECOND = float(os.environ.get("ROUTE53_REQUESTS_PER_SECOND", "5"))
+ROUTE53_BURST = float(os.environ.get("ROUTE53_BURST", "5"))
+ROUTE53_MAX_RETRIES = int(os.environ.get("ROUTE53_MAX_RETRIES", "8"))
+ROUTE53_BACKOFF_BASE_SECONDS = float(os.environ.get("ROUTE53_BACKOFF_BASE_SECONDS", "0.5"))
+ROUTE53_BACKOFF_MAX_SECONDS = float(os.environ.get("ROUTE53_BACKOFF_MAX_SECONDS", "20"))
+# AssumeRole allows far more, the bucket only spaces a burst of cold role sessions
+STS_REQUESTS_PER_SECOND = float(os.environ.get("STS_REQUESTS_PER_SECOND", "50"))
+
+THROTTLE_ERROR_CODES = {"Throttling", "ThrottlingException", "PriorRequestNotComplete"}
+# endpoint connection errors, connect and read timeouts and dropped connections
+CONNECTION_ERRORS = (botocore_exceptions.ConnectionError, botocore_exceptions.HTTPClientError)
+
+_sleep = time.sleep  # replaced in unit tests
+_stats_lock = threading.Lock()
+_stats = {"calls": 0, "throttles": 0, "retries": 0, "waited_seconds": 0.0}
+
+
+def _count(key: str, value=1):
+    """Increment a rate limiter counter."""
+    with _stats_lock:
+        _stats[key] += value
+
+
+class TokenBucket:
+    """Thread-safe token bucket whose rate halves on throttling and recovers slowly on success."""
+    def __init__(self, rate: float, capacity: float, min_rate: float = 0.2):
+        """Initialize a full bucket refilled at rate tokens per second, never slowed below min_rate."""
+        self.max_rate = rate
+        self.rate = rate
+        self.min_rate = min(min_rate, rate)
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        """Add the tokens accrued since the last refill."""
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self) -> float:
+        """Take a token, sleeping until one is available. Returns the seconds waited."""
+        waited = 0.0
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return waited
+                delay = (1 - self._tokens) / self.rate
+            _sleep(delay)
+            waited += delay
+
+    def throttled(self):
+        """Halve the rate after a throttling error."""
+        with self._lock:
+            self.rate = max(self.min_rate, self.rate / 2)
+
+    def succeeded(self):
+        """Recover the rate additively after a successful call."""
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + self.max_rate / 20)
+
+
+route53_bucket = TokenBucket(rate=ROUTE53_REQUESTS_PER_SECOND, capacity=ROUTE53_BURST)
+sts_bucket = TokenBucket(rate=STS_REQUESTS_PER_SECOND, capacity=STS_REQUESTS_PER_SECOND)
+
+
+def backoff_delay(attempt: int) -> float:
+    """Return the full jitter exponential backoff delay of a retry attempt."""
+    return random.uniform(0, min(ROUTE53_BACKOFF_MAX_SECONDS, ROUTE53_BACKOFF_BASE_SECONDS * 2**attempt))
+
+
+def call(api_method, bucket: Optional[TokenBucket] = None, **kwargs):
+    """Call a client method through a shared token bucket, retrying throttling, server and connection errors.
+
+    The Route53 bucket is used unless another one is given. Only throttling errors slow the bucket down.
+    """
+    bucket = bucket or route53_bucket
+    dimensions = {"Operation": getattr(api_method, "__name__", "unknown")}
+    attempt = 0
+    while True:
+        waited = bucket.acquire()
+        _count("calls")
+        metrics.record("Route53Calls", dimensions=dimensions)
+        if waited:
+            _count("waited_seconds", waited)
+        try:
+            response = api_method(**kwargs)
+        except CONNECTION_ERRORS as ex:
+            # botocore no longer retries the connection errors either
+            error, error_code = ex, type(ex).__name__
+        except ClientError as ce:
+            error, error_code = ce, ce.response.get("Error", {}).get("Code")
+            # botocore no longer retries the 5xx errors either
+            server_error = ce.response.get("ResponseMetadata", {}).get("HTTPStatusCode", 0) >= 500
+            if error_code not in THROTTLE_ERROR_CODES and not server_error:
+                raise ce
+            if error_code in THROTTLE_ERROR_CODES:
+                _count("throttles")
+                metrics.record("Throttles", dimensions=dimensions)
+                bucket.throttled()
+        else:
+            bucket.succeeded()
+            return response
+        if attempt >= ROUTE53_MAX_RETRIES:
+            logger.error(f"Giving up on {error_code} after {attempt} retries")
+            raise error
+        delay = backoff_delay(attempt)
+        logger.warning(f"{dimensions['Operation']} {error_code}, retrying in {delay:.2f} seconds")
+        _count("retries")
+        metrics.record("Retries", dimensions=dimensions)
+        _count("waited_seconds", delay)
+        _sleep(delay)
+        attempt += 1
+
+
+def get_stats() -> dict:
+    """Return a copy of the rate limiter counters."""
+    with _stats_lock:
+        return dict(_stats)
+
+
+def reset():
+    """Reset the counters and the buckets."""
+    global route53_bucket, sts_bucket
+    with _stats_lock:
+        for key in _stats:
+            _stats[key] = 0.0 if key == "waited_seconds" else 0
+    route53_bucket = TokenBucket(rate=ROUTE53_REQUESTS_PER_SECOND, capacity=ROUTE53_BURST)
+    sts_bucket = TokenBucket(rate=STS_REQUESTS_PER_SECOND, capacity=STS_REQUESTS_PER_SECOND)
@@ -0,0 +1,185 @@
+"""Full-zone reconciliation of source hosted zones into the destination hosted zone."""
+import heapq
+import json
+import logging
+import os
+from typing import Iterator, List, Optional, Tuple
+
+import boto3
+
+import event_filter
+import message_processing
+import record_change
+import recordset_diff
+import routing
+import runtime_config
+import sts
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+RECONCILE_PLAN_LIMIT = int(os.environ.get("RECONCILE_PLAN_LIMIT", "1000"))
+# stop submitting new batches with this much time left so the waits and the response fit in the invocation
+RECONCILE_DEADLINE_MARGIN_MS = int(os.environ.get("RECONCILE_DEADLINE_MARGIN_MS", "120000"))
+
+
+def _record_key(recordset: dict) -> Tuple[str, str, str]:
+    """Return the Route53 sort order key of a record set."""
+    return (recordset_diff.route53_sort_key(recordset["Name"]), recordset["Type"],
+            record_change.record_key(recordset)[2] or "")
+
+
+def _is_synced_record(recordset: dict, dest_hosted_zone_id: str) -> bool:
+    """Return whether process_message would sync the record set, a record passing its filters routed to the zone."""
+    if event_filter.recordset_skip_reason(recordset["Name"], recordset.get("SetIdentifier")) is not None:
+        return False
+    try:
+        record_change.source_record_set(recordset)
+    except record_change.UnsupportedRecordSet:
+        return False
+    return any(destination.hosted_zone_id == dest_hosted_zone_id
+               for destination in routing.get_routing_table().route_all(recordset["Name"]))
+
+
+def _keyed_records(route53_client: boto3.client, hosted_zone_id: str, dest_hosted_zone_id: str,
+                   start_record_name: Optional[str]) -> Iterator[Tuple[tuple, dict]]:
+    """Yield (sort key, record set) of the records of a zone synced to the destination, streamed page by page.
+
+    The merge diff is only right when both sides come in sort key order, a record listed out of order stops the
+    reconciliation instead of being reported missing on one side.
+    """
+    previous_key = None
+    for recordset in recordset_diff.iter_record_sets(route53_client, hosted_zone_id,
+                                                     start_record_name=start_record_name):
+        key = _record_key(recordset)
+        if previous_key is not None and key < previous_key:
+            raise Exception(f"Hosted zone {hosted_zone_id} listed {recordset['Name']} {recordset['Type']} out of "
+                            f"the order the merge diff expects, after {previous_key}.")
+        previous_key = key
+        if _is_synced_record(recordset, dest_hosted_zone_id):
+            yield key, recordset
+
+
+def merge_diff(source_records: Iterator[Tuple[tuple, dict]],
+               dest_records: Iterator[Tuple[tuple, dict]],
+               delete_orphans: bool = False) -> Iterator[dict]:
+    """Merge two record streams sorted on the same key, yielding the changes that make dest match source.
+
+    Neither side is held in memory beyond the current record. Destination records missing from every source are
+    only deleted with delete_orphans, the destination zone usually holds records of other accounts as well.
+    """
+    source = next(source_records, None)
+    dest = next(dest_records, None)
+    previous_source_key = None
+    while source is not None or dest is not None:
+        if source is not None and source[0] == previous_source_key:
+            logger.warning(f"Skipping {source[1]['Name']} {source[1]['Type']}, it exists in more than one source zone")
+            source = next(source_records, None)
+            continue
+        if dest is None or (source is not None and source[0] < dest[0]):
+            yield _change(message_processing.RecordSetChangeAction.create.value, source[1])
+            previous_source_key = source[0]
+            source = next(source_records, None)
+        elif source is None or dest[0] < source[0]:
+            if delete_orphans:
+                # Route53 only deletes an exact match, the listed record is one
+                yield {"Action": message_processing.RecordSetChangeAction.delete.value, "ResourceRecordSet": dest[1]}
+            dest = next(dest_records, None)
+        else:
+            change = _change(message_processing.RecordSetChangeAction.upsert.value, source[1])
+            if not recordset_diff.same_record(dest[1], change["ResourceRecordSet"]):
+                yield change
+            previous_source_key = source[0]
+            source = next(source_records, None)
+            dest = next(dest_records, None)
+
+
+def _change(change_action: str, recordset: dict) -> dict:
+    """Build the destination change of a record set listed from a source zone."""
+    return record_change.RecordChange(change_action, record_change.source_record_set(recordset)).to_api()
+
+
+def _in_source_zones(source_clients: List[Tuple[boto3.client, str]], recordset: dict) -> bool:
+    """Return whether a record the merge diff found in no source zone is there after all, with an exact read."""
+    key = record_change.record_key(recordset)
+    return any(
+        key in recordset_diff.lookup_records(route53_client, hosted_zone_id, [recordset["Name"]])
+        for route53_client, hosted_zone_id in source_clients)
+
+
+def _source_client(source_zone: dict) -> boto3.client:
+    """Return the Route53 client of a source zone, through its role when one is configured."""
+    if source_zone.get("role_arn"):
+        return sts.get_route53_client(role_arn=source_zone["role_arn"])
+    return boto3.client("route53", config=sts.CLIENT_CONFIG)
+
+
+def reconcile(source_zones: List[dict],
+              dest_hosted_zone_id: str,
+              context=None,
+              dry_run: bool = False,
+              delete_orphans: bool = False,
+              start_record_name: str = None) -> dict:
+    """Reconcile the destination zone with the source zones, streaming both sides in sorted record order.
+
+    Changes are applied in ChangeBatches as they are found. An orphan is only deleted once an exact read of every
+    source zone confirms none of them has it. When the invocation runs out of time the result holds
+    resume_record_name to continue from in a new invocation. With dry_run nothing is written and the planned
+    changes are returned instead, capped at RECONCILE_PLAN_LIMIT.
+    """
+    source_clients = [(_source_client(source_zone), source_zone["hosted_zone_id"]) for source_zone in source_zones]
+    source_streams = [
+        _keyed_records(route53_client, hosted_zone_id, dest_hosted_zone_id, start_record_name)
+        for route53_client, hosted_zone_id in source_clients
+    ]
+    source_records = heapq.merge(*source_streams, key=lambda keyed: keyed[0])
+    role_arn = routing.get_routing_table().role_arn(dest_hosted_zone_id)
+    dest_route53_client = sts.get_route53_client(role_arn=role_arn)
+    dest_records = _keyed_records(dest_route53_client, dest_hosted_zone_id, dest_hosted_zone_id, start_record_name)
+
+    result = {"dry_run": dry_run, "counts": {"CREATE": 0, "UPSERT": 0, "DELETE": 0}, "complete": True}
+    plan = []
+    pending = []
+    change_ids = {}
+    for change in merge_diff(source_records, dest_records, delete_orphans=delete_orphans):
+        if (change["Action"] == message_processing.RecordSetChangeAction.delete
+                and _in_source_zones(source_clients, change["ResourceRecordSet"])):
+            logger.warning(f"Not deleting {change['ResourceRecordSet']['Name']}, a source zone still has it")
+            continue
+        result["counts"][change["Action"]] += 1
+        if dry_run:
+            logger.info(f"Plan {change['Action']} {change['ResourceRecordSet']['Name']}")
+            if len(plan) < RECONCILE_PLAN_LIMIT:
+                plan.append(change)
+            continue
+        pending.append(change)
+        if len(pending) >= runtime_config.get_int("ROUTE53_MAX_BATCH_RECORDS",
+                                                  message_processing.ROUTE53_MAX_BATCH_RECORDS):
+            change_ids.update(message_processing.submit_changes(dest_route53_client, {dest_hosted_zone_id: pending}))
+            pending = []
+            if context is not None and context.get_remaining_time_in_millis() < RECONCILE_DEADLINE_MARGIN_MS:
+                result["complete"] = False
+                result["resume_record_name"] = change["ResourceRecordSet"]["Name"]
+                break
+    if pending:
+        change_ids.update(message_processing.submit_changes(dest_route53_client, {dest_hosted_zone_id: pending}))
+    message_processing.wait_for_changes(dest_route53_client, change_ids, role_arn=role_arn, context=context)
+    if dry_run:
+        result["plan"] = plan
+    logger.info(f"Reconciliation of {dest_hosted_zone_id} {json.dumps(result['counts'])}")
+    return result
+
+
+def reconcile_message(event, context) -> dict:
+    """Reconcile from a Lambda event, falling back to RECONCILE_SOURCE_ZONES and DEST_HOSTED_ZONE_ID."""
+    source_zones = event.get("source_zones") or json.loads(os.environ.get("RECONCILE_SOURCE_ZONES", "[]"))
+    if not source_zones:
+        raise ValueError("No source hosted zones to reconcile, set source_zones or RECONCILE_SOURCE_ZONES.")
+    return reconcile(
+        source_zones=source_zones,
+        dest_hosted_zone_id=event.get("dest_hosted_zone_id") or os.environ["DEST_HOSTED_ZONE_ID"],
+        context=context,
+        dry_run=event.get("dry_run", False),
+        delete_orphans=event.get("delete_orphans", False),
+        start_record_name=event.get("start_record_name"),
+    )
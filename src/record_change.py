@@ -0,0 +1,261 @@
+"""Record set changes, converted between the CloudTrail requestParameters and the Route53 API shapes.
+
+One model carries alias and value records and the weighted, latency, failover and multivalue answer routing policies,
+so the event, backfill and reconcile paths build their ChangeBatch changes the same way. The model is pure python,
+the event filter imports it without loading boto3.
+"""
+import os
+import re
+from typing import Any, Dict, Iterable, Optional
+
+# a health check belongs to the account that created it, the destination account usually has no health check of
+# that id, so the id is only copied for destinations in the source account
+SYNC_HEALTH_CHECK_IDS = os.environ.get("SYNC_HEALTH_CHECK_IDS", "false").lower() == "true"
+
+# the setIdentifier the plain records of the organization are created with, written without a routing policy
+SIMPLE_SET_IDENTIFIER = "Simple"
+
+# (slot, Route53 API field, CloudTrail field) of the routing policy fields
+_POLICY_FIELDS = (
+    ("weight", "Weight", "weight"),
+    ("region", "Region", "region"),
+    ("failover", "Failover", "failover"),
+    ("multi_value_answer", "MultiValueAnswer", "multiValueAnswer"),
+)
+# the apex records belong to the zone they are in, they are never copied into another zone
+UNSYNCED_TYPES = frozenset(("SOA", "NS"))
+# routing policies the model does not carry, a record using one is not synced
+_UNSUPPORTED_FIELDS = {
+    "geoLocation": "GeoLocation",
+    "geoProximityLocation": "GeoProximityLocation",
+    "cidrRoutingConfig": "CidrRoutingConfig",
+    "trafficPolicyInstanceId": "TrafficPolicyInstanceId",
+}
+
+
+class UnsupportedRecordSet(ValueError):
+    """The record set uses a routing policy or shape the model does not carry."""
+
+
+# Route53 lists the characters of a name other than a-z, 0-9, - and _ as \ooo octal escapes, * as \052
+_ESCAPED_CHARACTER = re.compile(r"\\([0-7]{3})")
+
+
+def normalize_name(name: str) -> str:
+    """Return the record name without the trailing dot, lower cased, with the escapes Route53 lists it with decoded."""
+    return _ESCAPED_CHARACTER.sub(lambda match: chr(int(match.group(1), 8)), name.rstrip(".")).lower()
+
+
+class AliasTarget:
+    """Target of an alias record."""
+
+    __slots__ = ("hosted_zone_id", "dns_name", "evaluate_target_health")
+
+    def __init__(self, hosted_zone_id: str, dns_name: str, evaluate_target_health: bool = False):
+        """Initialize the target with the hosted zone id and DNS name it resolves to."""
+        self.hosted_zone_id = hosted_zone_id
+        self.dns_name = dns_name
+        self.evaluate_target_health = evaluate_target_health
+
+    @classmethod
+    def from_api(cls, alias_target: dict) -> "AliasTarget":
+        """Build the target of a Route53 API AliasTarget."""
+        return cls(alias_target["HostedZoneId"], alias_target["DNSName"],
+                   alias_target.get("EvaluateTargetHealth", False))
+
+    @classmethod
+    def from_cloudtrail(cls, alias_target: dict) -> "AliasTarget":
+        """Build the target of a CloudTrail aliasTarget."""
+        return cls(alias_target["hostedZoneId"], alias_target["dNSName"],
+                   alias_target.get("evaluateTargetHealth", False))
+
+    def to_api(self) -> dict:
+        """Return the Route53 API AliasTarget."""
+        return {
+            "HostedZoneId": self.hosted_zone_id,
+            "DNSName": self.dns_name,
+            "EvaluateTargetHealth": self.evaluate_target_health,
+        }
+
+    def same_target(self, other: "AliasTarget") -> bool:
+        """Return whether both point at the same target, whatever EvaluateTargetHealth is."""
+        return (self.hosted_zone_id == other.hosted_zone_id
+                and normalize_name(self.dns_name) == normalize_name(other.dns_name))
+
+    def __eq__(self, other) -> bool:
+        """Return whether both point at the same target with the same EvaluateTargetHealth."""
+        return (isinstance(other, AliasTarget) and self.same_target(other)
+                and self.evaluate_target_health == other.evaluate_target_health)
+
+    def __repr__(self) -> str:
+        """Return the target as its constructor call."""
+        return f"AliasTarget({self.hosted_zone_id!r}, {self.dns_name!r}, {self.evaluate_target_health!r})"
+
+
+class RecordSet:
+    """Route53 record set, either an alias or TTL and values, with an optional routing policy.
+
+    A record with the Simple setIdentifier is kept without a set identifier or routing policy, the way it has
+    always been written to the destination zones.
+    """
+
+    __slots__ = ("name", "type", "ttl", "values", "alias_target", "set_identifier", "weight", "region", "failover",
+                 "multi_value_answer", "health_check_id")
+
+    def __init__(self,
+                 name: str,
+                 type: str,
+                 ttl: Optional[int] = None,
+                 values: Iterable[str] = (),
+                 alias_target: Optional[AliasTarget] = None,
+                 set_identifier: Optional[str] = None,
+                 weight: Optional[int] = None,
+                 region: Optional[str] = None,
+                 failover: Optional[str] = None,
+                 multi_value_answer: Optional[bool] = None,
+                 health_check_id: Optional[str] = None):
+        """Initialize the record set, dropping the set identifier and routing policy of a Simple record."""
+        self.name = name
+        self.type = type
+        self.ttl = ttl
+        self.values = tuple(values)
+        self.alias_target = alias_target
+        self.set_identifier = set_identifier
+        self.weight = weight
+        self.region = region
+        self.failover = failover
+        self.multi_value_answer = multi_value_answer
+        self.health_check_id = health_check_id
+        if set_identifier == SIMPLE_SET_IDENTIFIER:
+            self.set_identifier = self.weight = self.region = self.failover = self.multi_value_answer = None
+
+    @classmethod
+    def from_cloudtrail(cls, recordset: dict) -> "RecordSet":
+        """Build the record set of a CloudTrail change, raising UnsupportedRecordSet for what cannot be synced."""
+        unsupported = [field for field in _UNSUPPORTED_FIELDS if field in recordset]
+        if unsupported:
+            raise UnsupportedRecordSet(f"{recordset['name']} uses {', '.join(unsupported)}, which is not synced")
+        if recordset["type"] in UNSYNCED_TYPES:
+            raise UnsupportedRecordSet(f"{recordset['name']} is a {recordset['type']} record")
+        if "aliasTarget" not in recordset and "resourceRecords" not in recordset:
+            raise UnsupportedRecordSet(f"{recordset['name']} has neither an alias target nor values")
+        return cls(
+            name=recordset["name"],
+            type=recordset["type"],
+            # CloudTrail lower cases the first letter of TTL only
+            ttl=recordset.get("tTL", recordset.get("ttl")),
+            values=(record["value"] for record in recordset.get("resourceRecords", ())),
+            alias_target=AliasTarget.from_cloudtrail(recordset["aliasTarget"]) if "aliasTarget" in recordset else None,
+            set_identifier=recordset.get("setIdentifier"),
+            health_check_id=recordset.get("healthCheckId") if SYNC_HEALTH_CHECK_IDS else None,
+            **{slot: recordset[field] for slot, _, field in _POLICY_FIELDS if field in recordset},
+        )
+
+    @classmethod
+    def from_api(cls, recordset: dict) -> "RecordSet":
+        """Build the record set of a listed record or ChangeBatch change."""
+        unsupported = [field for field in _UNSUPPORTED_FIELDS.values() if field in recordset]
+        if unsupported:
+            raise UnsupportedRecordSet(f"{recordset['Name']} uses {', '.join(unsupported)}, which is not synced")
+        return cls(
+            name=recordset["Name"],
+            type=recordset["Type"],
+            ttl=recordset.get("TTL"),
+            values=(record["Value"] for record in recordset.get("ResourceRecords", ())),
+            alias_target=AliasTarget.from_api(recordset["AliasTarget"]) if "AliasTarget" in recordset else None,
+            set_identifier=recordset.get("SetIdentifier"),
+            health_check_id=recordset.get("HealthCheckId"),
+            **{slot: recordset[field] for slot, field, _ in _POLICY_FIELDS if field in recordset},
+        )
+
+    def to_api(self) -> dict:
+        """Return the ResourceRecordSet of a ChangeBatch change, a new dict on every call."""
+        recordset: Dict[str, Any] = {"Name": self.name, "Type": self.type}
+        if self.set_identifier is not None:
+            recordset["SetIdentifier"] = self.set_identifier
+        for slot, field, _ in _POLICY_FIELDS:
+            value = getattr(self, slot)
+            if value is not None:
+                recordset[field] = value
+        if self.alias_target is not None:
+            recordset["AliasTarget"] = self.alias_target.to_api()
+        else:
+            recordset["TTL"] = self.ttl
+            recordset["ResourceRecords"] = [{"Value": value} for value in self.values]
+        if self.health_check_id is not None:
+            recordset["HealthCheckId"] = self.health_check_id
+        return recordset
+
+    def key(self) -> tuple:
+        """Return the (normalized name, type, set identifier) the record is unique on in a hosted zone."""
+        return normalize_name(self.name), self.type, self.set_identifier
+
+    def _policy(self) -> tuple:
+        return (self.weight, self.region, self.failover, self.multi_value_answer, self.health_check_id)
+
+    def same_target(self, other: "RecordSet") -> bool:
+        """Return whether both answer with the same alias target or values, whatever EvaluateTargetHealth or TTL is.
+
+        Route53 only deletes an exact match, the listed record replaces a delete that only drifted in those.
+        """
+        if self.key() != other.key() or self._policy() != other._policy():
+            return False
+        if self.alias_target is not None and other.alias_target is not None:
+            return self.alias_target.same_target(other.alias_target)
+        return self.alias_target is other.alias_target and sorted(self.values) == sorted(other.values)
+
+    def __eq__(self, other) -> bool:
+        """Return whether both are the same record with the same target, TTL and EvaluateTargetHealth."""
+        return (isinstance(other, RecordSet) and self.same_target(other) and self.ttl == other.ttl
+                and self.alias_target == other.alias_target)
+
+    def __repr__(self) -> str:
+        """Return the record set as its Route53 API shape."""
+        return f"RecordSet({self.to_api()!r})"
+
+
+class RecordChange:
+    """A CREATE, UPSERT or DELETE of a record set."""
+
+    __slots__ = ("action", "record_set")
+
+    def __init__(self, action: str, record_set: RecordSet):
+        """Initialize the change with its CREATE, UPSERT or DELETE action and the record set it applies to."""
+        self.action = action
+        self.record_set = record_set
+
+    @classmethod
+    def from_cloudtrail(cls, event_change: dict) -> "RecordChange":
+        """Build the change of a CloudTrail changeBatch change, raising UnsupportedRecordSet like the record set."""
+        return cls(event_change["action"], RecordSet.from_cloudtrail(event_change["resourceRecordSet"]))
+
+    @classmethod
+    def from_api(cls, change: dict) -> "RecordChange":
+        """Build the change of a ChangeBatch change, whose Action may still be a RecordSetChangeAction."""
+        return cls(str(getattr(change["Action"], "value", change["Action"])),
+                   RecordSet.from_api(change["ResourceRecordSet"]))
+
+    def to_api(self) -> dict:
+        """Return the ChangeBatch change, a new dict on every call so every destination zone gets its own."""
+        return {"Action": self.action, "ResourceRecordSet": self.record_set.to_api()}
+
+    def __repr__(self) -> str:
+        """Return the change as its constructor call."""
+        return f"RecordChange({self.action!r}, {self.record_set!r})"
+
+
+def source_record_set(recordset: dict) -> RecordSet:
+    """Build the destination record set of a record listed from a source zone, the same as from_cloudtrail would."""
+    if recordset["Type"] in UNSYNCED_TYPES:
+        raise UnsupportedRecordSet(f"{recordset['Name']} is a {recordset['Type']} record")
+    record_set = RecordSet.from_api(recordset)
+    if not SYNC_HEALTH_CHECK_IDS:
+        record_set.health_check_id = None
+    return record_set
+
+
+def record_key(recordset: dict) -> tuple:
+    """Return the (normalized name, type, set identifier) of a Route53 API record set."""
+    set_identifier = recordset.get("SetIdentifier")
+    return (normalize_name(recordset["Name"]), recordset["Type"],
+            None if set_identifier == SIMPLE_SET_IDENTIFIER else set_identifier)
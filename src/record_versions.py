@@ -0,0 +1,122 @@
+"""Last-writer-wins version store keyed on the destination record, so a delayed change cannot undo a later one."""
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+import boto3
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# longer than EventBridge and SQS keep retrying an event
+RECORD_VERSION_TTL_SECONDS = int(os.environ.get("RECORD_VERSION_TTL_SECONDS", "604800"))
+RECORD_VERSION_CACHE_SIZE = int(os.environ.get("RECORD_VERSION_CACHE_SIZE", "4096"))
+
+_cache_lock = threading.Lock()
+_cache = OrderedDict()
+_tables = {}
+
+
+def change_version(event: dict) -> Optional[str]:
+    """Return the version of a change, its CloudTrail eventTime.
+
+    eventTime has a resolution of seconds and the eventID is random, so changes made in the same second share a
+    version and are applied in the order they arrive, only a strictly later eventTime makes a change stale. Returns
+    None for an event without a time, which is never considered stale.
+    """
+    detail = event.get("detail", {})
+    return detail.get("eventTime") or event.get("time") or None
+
+
+def record_key(hosted_zone_id: str, recordset_name: str, recordset_type: str, set_identifier: Optional[str] = None) -> str:
+    """Return the key of a record in a destination hosted zone, the records of a routing policy each have their own."""
+    key = f"{hosted_zone_id}#{recordset_name.rstrip('.').lower()}#{recordset_type}"
+    return key if set_identifier is None else f"{key}#{set_identifier}"
+
+
+def get_versions_table():
+    """Return the DynamoDB table behind the in-memory cache, None when RECORD_VERSIONS_TABLE is not set."""
+    table_name = os.environ.get("RECORD_VERSIONS_TABLE")
+    if not table_name:
+        return None
+    table = _tables.get(table_name)
+    if table is None:
+        table = _tables[table_name] = boto3.resource("dynamodb").Table(table_name)
+    return table
+
+
+def _cache_put(key: str, version: str):
+    """Store the latest known version in the LRU, evicting the least recently used records."""
+    with _cache_lock:
+        if _cache.get(key, "") < version:
+            _cache[key] = version
+        _cache.move_to_end(key)
+        while len(_cache) > RECORD_VERSION_CACHE_SIZE:
+            _cache.popitem(last=False)
+
+
+def claim(hosted_zone_id: str,
+          recordset_name: str,
+          recordset_type: str,
+          version: Optional[str],
+          set_identifier: Optional[str] = None) -> bool:
+    """Record the version as the latest of the record, returning False when a later change was already seen.
+
+    A version is only ever replaced by a later one, so a cached version later than the change answers without a
+    table call. The same version can be claimed again, a redelivery of a change that failed is still applied, and
+    so can another change made in the same second.
+    """
+    if version is None:
+        return True
+    key = record_key(hosted_zone_id, recordset_name, recordset_type, set_identifier)
+    with _cache_lock:
+        cached = _cache.get(key)
+    if cached is not None and cached >= version:
+        return cached == version
+    table = get_versions_table()
+    if table is not None:
+        now = int(time.time())
+        try:
+            table.put_item(
+                Item={"record_key": key, "version": version, "expires_at": now + RECORD_VERSION_TTL_SECONDS},
+                # DynamoDB deletes expired items lazily, so the ttl is checked here as well
+                ConditionExpression="attribute_not_exists(record_key) OR version <= :version OR expires_at <= :now",
+                ExpressionAttributeValues={":version": version, ":now": now},
+            )
+        except table.meta.client.exceptions.ConditionalCheckFailedException:
+            item = table.get_item(Key={"record_key": key}, ConsistentRead=True).get("Item")
+            if item is not None:
+                _cache_put(key, item["version"])
+            return False
+    _cache_put(key, version)
+    return True
+
+
+def is_stale(hosted_zone_id: str,
+             recordset_name: str,
+             recordset_type: str,
+             version: Optional[str],
+             set_identifier: Optional[str] = None) -> bool:
+    """Return whether a later change of the record was already seen, like claim but without recording the version."""
+    if version is None:
+        return False
+    key = record_key(hosted_zone_id, recordset_name, recordset_type, set_identifier)
+    with _cache_lock:
+        cached = _cache.get(key)
+    if cached is not None and cached >= version:
+        return cached != version
+    table = get_versions_table()
+    if table is None:
+        return False
+    item = table.get_item(Key={"record_key": key}, ConsistentRead=True).get("Item")
+    return item is not None and item["version"] > version and int(item["expires_at"]) > int(time.time())
+
+
+def clear_cache():
+    """Drop the in-memory cache and the table resources."""
+    with _cache_lock:
+        _cache.clear()
+    _tables.clear()
@@ -0,0 +1,210 @@
+"""Desired-state diff of Route53 changes against the records already in the destination hosted zone."""
+import logging
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+import boto3
+
+import metrics
+import ratelimit
+import record_change
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+LIST_PAGE_SIZE = "300"  # the Route53 maximum for list_resource_record_sets
+
+
+def route53_sort_key(recordset_name: str) -> str:
+    """Return the key Route53 sorts record names on, the labels reversed with the trailing dot (com.example.www.).
+
+    The trailing dot is compared like any other character, so a name with a character below "." sorts before the
+    name it extends: io.test.api-v2. before io.test.api. Python compares the code points, in the UTF-8 byte order.
+    """
+    return ".".join(reversed(record_change.normalize_name(recordset_name).split("."))) + "."
+
+
+def iter_record_sets(
+    route53_client: boto3.client,
+    hosted_zone_id: str,
+    start_record_name: str = None,
+) -> Iterator[dict]:
+    """Yield the record sets of a hosted zone in Route53 order, one page in memory at a time."""
+    list_kwargs: Dict[str, Any] = {"HostedZoneId": hosted_zone_id, "MaxItems": LIST_PAGE_SIZE}
+    if start_record_name is not None:
+        list_kwargs["StartRecordName"] = start_record_name
+    while True:
+        response = ratelimit.call(route53_client.list_resource_record_sets, **list_kwargs)
+        yield from response["ResourceRecordSets"]
+        if not response.get("IsTruncated", False):
+            return
+        list_kwargs["StartRecordName"] = response["NextRecordName"]
+        list_kwargs["StartRecordType"] = response["NextRecordType"]
+        if "NextRecordIdentifier" in response:
+            list_kwargs["StartRecordIdentifier"] = response["NextRecordIdentifier"]
+        else:
+            list_kwargs.pop("StartRecordIdentifier", None)
+
+
+def _rate_limited_list_page(route53_client: boto3.client) -> Callable[..., dict]:
+    """Return the rate limited list_resource_record_sets call of a client."""
+    def list_page(**list_kwargs) -> dict:
+        return ratelimit.call(route53_client.list_resource_record_sets, **list_kwargs)
+
+    return list_page
+
+
+def fetch_current_records(route53_client: boto3.client,
+                          hosted_zone_id: str,
+                          names: List[str],
+                          list_page: Callable[..., dict] = None) -> Dict[tuple, dict]:
+    """Read the current records for all names with as few paginated reads as possible.
+
+    The names are read in Route53 order. When the next wanted name sorts after the next page, the read jumps to it
+    instead of paging through the records in between. Each name is jumped to at most once, so a listing ordered
+    differently than route53_sort_key still ends. Returns the record sets keyed on (normalized name, type, set
+    identifier), the set identifier None for a plain record. list_page replaces the rate limited
+    list_resource_record_sets call, the planner reads a snapshot of the zone with it.
+    """
+    list_page = list_page or _rate_limited_list_page(route53_client)
+    wanted = sorted({record_change.normalize_name(name) for name in names}, key=route53_sort_key)
+    if not wanted:
+        return {}
+    wanted_names = set(wanted)
+    current = {}
+    position = 0
+    jumped_to = {wanted[0]}
+    list_kwargs = {"HostedZoneId": hosted_zone_id, "MaxItems": LIST_PAGE_SIZE, "StartRecordName": wanted[0]}
+    with metrics.span("List", {"HostedZoneId": hosted_zone_id}):
+        while True:
+            response = list_page(**list_kwargs)
+            for recordset in response["ResourceRecordSets"]:
+                key = record_change.record_key(recordset)
+                if key[0] in wanted_names:
+                    current[key] = recordset
+            if not response.get("IsTruncated", False):
+                return current
+            next_key = route53_sort_key(response["NextRecordName"])
+            while position < len(wanted) and route53_sort_key(wanted[position]) < next_key:
+                position += 1
+            if position == len(wanted):
+                return current
+            if route53_sort_key(wanted[position]) > next_key and wanted[position] not in jumped_to:
+                jumped_to.add(wanted[position])
+                list_kwargs = {"HostedZoneId": hosted_zone_id, "MaxItems": LIST_PAGE_SIZE,
+                               "StartRecordName": wanted[position]}
+                continue
+            list_kwargs["StartRecordName"] = response["NextRecordName"]
+            list_kwargs["StartRecordType"] = response["NextRecordType"]
+            if "NextRecordIdentifier" in response:
+                list_kwargs["StartRecordIdentifier"] = response["NextRecordIdentifier"]
+            else:
+                list_kwargs.pop("StartRecordIdentifier", None)
+
+
+def lookup_records(route53_client: boto3.client,
+                   hosted_zone_id: str,
+                   names: List[str],
+                   list_page: Callable[..., dict] = None) -> Dict[tuple, dict]:
+    """Read the records of every name with its own read starting at the name, whatever order the zone is listed in.
+
+    Returns the record sets keyed like fetch_current_records.
+    """
+    list_page = list_page or _rate_limited_list_page(route53_client)
+    current = {}
+    with metrics.span("List", {"HostedZoneId": hosted_zone_id}):
+        for name in sorted({record_change.normalize_name(name) for name in names}):
+            list_kwargs = {"HostedZoneId": hosted_zone_id, "MaxItems": LIST_PAGE_SIZE, "StartRecordName": name}
+            while True:
+                response = list_page(**list_kwargs)
+                records = [(record_change.record_key(recordset), recordset)
+                           for recordset in response["ResourceRecordSets"]]
+                current.update((key, recordset) for key, recordset in records if key[0] == name)
+                # the records of a name are listed together, a page ending on another name holds all of them
+                if not response.get("IsTruncated", False) or not records or records[-1][0][0] != name:
+                    break
+                list_kwargs["StartRecordName"] = response["NextRecordName"]
+                list_kwargs["StartRecordType"] = response["NextRecordType"]
+                if "NextRecordIdentifier" in response:
+                    list_kwargs["StartRecordIdentifier"] = response["NextRecordIdentifier"]
+                else:
+                    list_kwargs.pop("StartRecordIdentifier", None)
+    return current
+
+
+def _record_set(recordset: dict) -> Optional[record_change.RecordSet]:
+    """Return the model of a listed record set, None for a routing policy the model does not carry."""
+    try:
+        return record_change.RecordSet.from_api(recordset)
+    except record_change.UnsupportedRecordSet:
+        return None
+
+
+def same_record(current: dict, desired: dict) -> bool:
+    """Return whether two record sets answer the same, alias target or TTL and values and routing policy."""
+    current_record = _record_set(current)
+    return current_record is not None and current_record == _record_set(desired)
+
+
+def _same_target_ignoring_health(current: dict, desired: dict) -> bool:
+    """Return whether two record sets answer the same, whatever EvaluateTargetHealth or TTL is."""
+    current_record = _record_set(current)
+    desired_record = _record_set(desired)
+    return current_record is not None and desired_record is not None and current_record.same_target(desired_record)
+
+
+def diff_zone_changes(changes: List[dict], current: Dict[tuple, dict]) -> List[dict]:
+    """Reduce the changes of one zone to the minimal CREATE/UPSERT/DELETE set against the current records.
+
+    Changes to the same record collapse to their net effect and changes already satisfied are dropped. The
+    change dicts that remain are rewritten in place, so callers tracking them by identity keep working.
+    """
+    net_changes = {}
+    for change in changes:
+        key = record_change.record_key(change["ResourceRecordSet"])
+        net_changes.pop(key, None)
+        net_changes[key] = change
+
+    minimal = []
+    for key, change in net_changes.items():
+        recordset = change["ResourceRecordSet"]
+        existing = current.get(key)
+        if change["Action"] == "DELETE":
+            if existing is None:
+                logger.info(f"Skipping DELETE of {recordset['Name']}, it does not exist")
+                metrics.record("SkippedChanges", dimensions={"Action": "DELETE", "Reason": "NotFound"})
+                continue
+            if _same_target_ignoring_health(existing, recordset):
+                # Route53 only deletes an exact match, the existing record covers a drifted EvaluateTargetHealth or TTL
+                change["ResourceRecordSet"] = existing
+            minimal.append(change)
+            continue
+        if existing is None:
+            change["Action"] = "CREATE"
+        elif same_record(existing, recordset):
+            logger.info(f"Skipping {change['Action']} of {recordset['Name']}, it is already up to date")
+            metrics.record("SkippedChanges", dimensions={"Action": change["Action"], "Reason": "UpToDate"})
+            continue
+        else:
+            change["Action"] = "UPSERT"
+        minimal.append(change)
+    return minimal
+
+
+def diff_changes(route53_client: boto3.client,
+                 changes_by_zone: Dict[str, List[dict]],
+                 current_by_zone: Dict[str, Dict[tuple, dict]] = None) -> Dict[str, List[dict]]:
+    """Drop the changes already satisfied by the destination zones, one paginated read per zone.
+
+    current_by_zone collects the records read per zone, the index the writes look existing records up in.
+    """
+    minimal_by_zone = {}
+    for hosted_zone_id, changes in changes_by_zone.items():
+        current = fetch_current_records(route53_client, hosted_zone_id,
+                                        [change["ResourceRecordSet"]["Name"] for change in changes])
+        if current_by_zone is not None:
+            current_by_zone[hosted_zone_id] = current
+        minimal = diff_zone_changes(changes, current)
+        logger.info(f"Reduced {len(changes)} changes to {len(minimal)} for hosted zone {hosted_zone_id}")
+        if minimal:
+            minimal_by_zone[hosted_zone_id] = minimal
+    return minimal_by_zone
@@ -0,0 +1,128 @@
+"""Route record names to destination hosted zones by longest domain suffix."""
+import json
+import os
+from typing import Dict, List, NamedTuple, Optional, Tuple, Union
+
+import runtime_config
+
+_VALUE = object()  # key holding the destinations of the suffix ending at a trie node
+
+
+class Destination(NamedTuple):
+    """Destination hosted zone of a domain suffix, role_arn None uses ASSUME_ROLE_ARN."""
+
+    hosted_zone_id: str
+    role_arn: Optional[str] = None
+
+
+def _reversed_labels(domain_name: str):
+    """Return the labels of a domain name from the top level domain down."""
+    domain_name = domain_name.rstrip(".").lower()
+    if not domain_name:
+        return []
+    return reversed(domain_name.split("."))
+
+
+class RoutingTable:
+    """Reversed-label trie answering the longest matching domain suffix of a record name.
+
+    A suffix routed to a list of destinations is mirrored into every one of them, the first is its primary.
+    """
+    def __init__(self, routes: Dict[str, Union[Destination, List[Destination]]] = None):
+        """Initialize the trie with the destinations of every suffix."""
+        self._root = {}
+        self.routes = {}
+        self.fan_out = False
+        self._zone_roles = {}
+        for suffix, destinations in (routes or {}).items():
+            self.add(suffix, destinations)
+
+    def add(self, suffix: str, destinations: Union[Destination, List[Destination]]):
+        """Route the suffix to one or more destinations, an empty suffix matches every name."""
+        if isinstance(destinations, Destination):
+            destinations = [destinations]
+        if not destinations:
+            raise ValueError(f"Suffix {suffix} is routed to no destination.")
+        for destination in destinations:
+            if self._zone_roles.get(destination.hosted_zone_id, destination.role_arn) != destination.role_arn:
+                raise ValueError(f"Hosted zone {destination.hosted_zone_id} is routed with more than one role.")
+            self._zone_roles[destination.hosted_zone_id] = destination.role_arn
+        node = self._root
+        for label in _reversed_labels(suffix):
+            node = node.setdefault(label, {})
+        node[_VALUE] = tuple(destinations)
+        self.routes[suffix] = destinations[0]
+        self.fan_out = self.fan_out or len(destinations) > 1
+
+    def route_all(self, recordset_name: str) -> Tuple[Destination, ...]:
+        """Return every destination of the longest suffix matching whole labels of the name, empty if none does."""
+        node = self._root
+        match = node.get(_VALUE, ())
+        for label in _reversed_labels(recordset_name):
+            node = node.get(label)
+            if node is None:
+                break
+            match = node.get(_VALUE, match)
+        return match
+
+    def route(self, recordset_name: str) -> Optional[Destination]:
+        """Return the primary destination of the longest suffix matching the name, None if none does."""
+        destinations = self.route_all(recordset_name)
+        return destinations[0] if destinations else None
+
+    def role_arn(self, hosted_zone_id: str) -> Optional[str]:
+        """Return the role writing to a destination hosted zone."""
+        return self._zone_roles.get(hosted_zone_id)
+
+
+def _parse_destination(destination) -> Destination:
+    """Parse a hosted zone id or {"hosted_zone_id", "role_arn"} destination."""
+    if isinstance(destination, str):
+        return Destination(hosted_zone_id=destination)
+    return Destination(hosted_zone_id=destination["hosted_zone_id"], role_arn=destination.get("role_arn"))
+
+
+def parse_routes(routes_config: str) -> Dict[str, Union[Destination, List[Destination]]]:
+    """Parse DOMAIN_ROUTES, a JSON object of suffix to destination or list of destinations to mirror into.
+
+    A destination is a hosted zone id or {"hosted_zone_id", "role_arn"}.
+    """
+    routes = {}
+    for suffix, destination in json.loads(routes_config).items():
+        if isinstance(destination, list):
+            routes[suffix] = [_parse_destination(item) for item in destination]
+        else:
+            routes[suffix] = _parse_destination(destination)
+    return routes
+
+
+def _routes_from_environment(routes_config: Optional[str], company_domain_filter: Optional[str],
+                             dest_hosted_zone_id: Optional[str]) -> Dict[str, Destination]:
+    """Return the configured routes, DOMAIN_ROUTES or the single COMPANY_DOMAIN_FILTER/DEST_HOSTED_ZONE_ID route."""
+    if routes_config:
+        return parse_routes(routes_config)
+    if dest_hosted_zone_id is None:
+        dest_hosted_zone_id = "<insert default hosted zone for domain>"  # zone id - created for unit testing
+    return {company_domain_filter or "": Destination(hosted_zone_id=dest_hosted_zone_id)}
+
+
+_routing_table = None
+_routing_table_source = None
+
+
+def get_routing_table() -> RoutingTable:
+    """Return the routing table compiled from the runtime configuration.
+
+    The table is only rebuilt when the runtime document is reloaded with changes or the environment changes, a
+    lookup does not encode the routes of the document again.
+    """
+    global _routing_table, _routing_table_source
+    source = (runtime_config.get_generation(), os.environ.get("DOMAIN_ROUTES"),
+              os.environ.get("COMPANY_DOMAIN_FILTER"), os.environ.get("DEST_HOSTED_ZONE_ID"))
+    if _routing_table is None or source != _routing_table_source:
+        _routing_table = RoutingTable(
+            _routes_from_environment(runtime_config.get_text("DOMAIN_ROUTES"),
+                                     runtime_config.get_text("COMPANY_DOMAIN_FILTER"),
+                                     runtime_config.get_text("DEST_HOSTED_ZONE_ID")))
+        _routing_table_source = source
+    return _routing_table
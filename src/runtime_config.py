@@ -0,0 +1,155 @@
+"""Runtime configuration reloaded from SSM Parameter Store, AppConfig or a file without redeploying the function.
+
+RUNTIME_CONFIG_SOURCE names a JSON object whose keys are the environment variables they override, for example
+{"HALT_PROCESSING": "1", "DOMAIN_ROUTES": {"api.business.io": "Z111"}, "ROUTE53_MAX_BATCH_RECORDS": 500}:
+
+* ssm:/route53-registration/runtime-config, a String parameter read with boto3;
+* appconfig:application/environment/profile, read from the AppConfig Lambda extension;
+* file:/path/to/config.json, the local stand-in for tests and scripts.
+
+A key missing from the document falls back to the environment. The document is cached in the container for
+RUNTIME_CONFIG_TTL_SECONDS. Once it expires, one caller reloads it while the others keep reading the cached
+document, and a failed reload keeps the last document it read.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from typing import Any, Optional
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+RUNTIME_CONFIG_TTL_SECONDS = float(os.environ.get("RUNTIME_CONFIG_TTL_SECONDS", "10"))
+# the AppConfig Lambda extension listens on this port
+APPCONFIG_EXTENSION_PORT = int(os.environ.get("AWS_APPCONFIG_EXTENSION_HTTP_PORT", "2772"))
+
+_reload_lock = threading.Lock()
+_document = {}
+_source = None
+_loaded_at = None
+# bumped whenever the document changes, settings compiled from it are only rebuilt then
+_generation = 0
+
+
+def _read_ssm(name: str) -> str:
+    """Return the value of an SSM parameter, boto3 is only imported for this source."""
+    import sts
+
+    # built once under the lock of the shared session, reloads run on the threads of the fanned out destinations
+    ssm_client = sts.get_default_client("ssm")
+    return ssm_client.get_parameter(Name=name, WithDecryption=True)["Parameter"]["Value"]
+
+
+def _read_appconfig(profile_path: str) -> str:
+    """Return the configuration of application/environment/profile from the AppConfig Lambda extension.
+
+    urllib.request pulls in http.client and ssl, it is only imported for this source.
+    """
+    import urllib.request
+
+    application, environment, profile = profile_path.split("/", 2)
+    url = (f"http://localhost:{APPCONFIG_EXTENSION_PORT}/applications/{application}/environments/{environment}"
+           f"/configurations/{profile}")
+    with urllib.request.urlopen(url, timeout=2) as response:
+        return response.read().decode("utf-8")
+
+
+def _read_file(path: str) -> str:
+    with open(path) as config_file:
+        return config_file.read()
+
+
+_READERS = {"ssm": _read_ssm, "appconfig": _read_appconfig, "file": _read_file}
+
+
+def load_document(source: str) -> dict:
+    """Read and parse the configuration document of a source."""
+    kind, _, location = source.partition(":")
+    if kind not in _READERS:
+        raise ValueError(f"Unknown RUNTIME_CONFIG_SOURCE {source}, expected ssm:, appconfig: or file:")
+    document = json.loads(_READERS[kind](location) or "{}")
+    if not isinstance(document, dict):
+        raise ValueError(f"The runtime configuration of {source} is not a JSON object")
+    return document
+
+
+def _reload(source: str, blocking: bool):
+    """Reload the document, only one caller at a time, keeping the last document when the reload fails."""
+    global _document, _source, _loaded_at, _generation
+    if not _reload_lock.acquire(blocking=blocking):
+        return
+    try:
+        if _source == source and _loaded_at is not None and time.monotonic() - _loaded_at < RUNTIME_CONFIG_TTL_SECONDS:
+            return
+        try:
+            document = load_document(source)
+        except Exception as ex:
+            if _source != source:
+                raise ex
+            logger.warning(f"Unable to reload the runtime configuration of {source}, keeping the last one: {ex}")
+            # retried after the next ttl instead of on every call
+            _loaded_at = time.monotonic()
+            return
+        if document != _document or _source != source:
+            logger.info(f"Loaded the runtime configuration of {source} {sorted(document)}")
+            _generation += 1
+        _document, _source, _loaded_at = document, source, time.monotonic()
+    finally:
+        _reload_lock.release()
+
+
+def get_document() -> dict:
+    """Return the cached configuration document, an empty one without RUNTIME_CONFIG_SOURCE."""
+    source = os.environ.get("RUNTIME_CONFIG_SOURCE")
+    if not source:
+        return {}
+    if _source != source:
+        # nothing to fall back on yet, every caller waits for the first load
+        _reload(source, blocking=True)
+    elif time.monotonic() - _loaded_at >= RUNTIME_CONFIG_TTL_SECONDS:
+        _reload(source, blocking=False)
+    return _document
+
+
+def get_generation() -> Optional[int]:
+    """Return the generation of the cached document, None without RUNTIME_CONFIG_SOURCE.
+
+    It changes whenever a reload reads a different document, so a setting compiled from the document is only
+    rebuilt when the generation it was built from is no longer the current one.
+    """
+    if not os.environ.get("RUNTIME_CONFIG_SOURCE"):
+        return None
+    get_document()
+    return _generation
+
+
+def get(name: str, default: Any = None) -> Any:
+    """Return a setting from the runtime configuration, falling back to the environment and then the default."""
+    document = get_document()
+    if name in document:
+        return document[name]
+    return os.environ.get(name, default)
+
+
+def get_int(name: str, default: int) -> int:
+    """Return an integer setting."""
+    value = get(name)
+    return default if value in (None, "") else int(value)
+
+
+def get_text(name: str, default: Optional[str] = None) -> Optional[str]:
+    """Return a setting as text, JSON encoding an object or list from the document."""
+    value = get(name, default)
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, sort_keys=True)
+    return None if value is None else str(value)
+
+
+def clear_cache():
+    """Drop the cached document."""
+    global _document, _source, _loaded_at, _generation
+    with _reload_lock:
+        _document, _source, _loaded_at = {}, None, None
+        _generation += 1
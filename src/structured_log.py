@@ -0,0 +1,85 @@
+"""Bounded structured logging, one compact JSON line per change instead of the whole event per change."""
+import json
+import logging
+import os
+import random
+
+LOG_MAX_FIELD_CHARS = int(os.environ.get("LOG_MAX_FIELD_CHARS", "256"))
+LOG_MAX_LINE_CHARS = int(os.environ.get("LOG_MAX_LINE_CHARS", "2048"))
+LOG_MAX_EVENT_CHARS = int(os.environ.get("LOG_MAX_EVENT_CHARS", "16384"))
+LOG_EVENT_SAMPLE_RATE = float(os.environ.get("LOG_EVENT_SAMPLE_RATE", "0.01"))
+
+_random = random.Random()
+
+
+def is_verbose() -> bool:
+    """Return whether LOG_MODE=verbose asks for the full event dumps of every change."""
+    return os.environ.get("LOG_MODE", "structured") == "verbose"
+
+
+def truncate(value: str, limit: int) -> str:
+    """Cap a string, marking how much was cut."""
+    if len(value) <= limit:
+        return value
+    return f"{value[:limit]}...<{len(value) - limit} more>"
+
+
+class LazyJson:
+    """Log argument serialized to one capped JSON line only when a handler formats the record."""
+    def __init__(self, message: str, fields: dict):
+        """Initialize the argument with the message and the fields logged with it."""
+        self.message = message
+        self.fields = fields
+
+    def __str__(self) -> str:
+        """Return the message and the fields that are set as one capped JSON line."""
+        fields = {
+            key: truncate(value, LOG_MAX_FIELD_CHARS) if isinstance(value, str) else value
+            for key, value in self.fields.items() if value is not None
+        }
+        line = json.dumps({"message": self.message, **fields}, separators=(",", ":"), default=str)
+        return truncate(line, LOG_MAX_LINE_CHARS)
+
+
+def info(logger: logging.Logger, message: str, **fields):
+    """Log a compact JSON line at INFO, serialized only when INFO is enabled and the record is emitted."""
+    if logger.isEnabledFor(logging.INFO):
+        logger.info("%s", LazyJson(message, fields))
+
+
+def change_fields(event: dict, change_index: int, event_change: dict) -> dict:
+    """Return the key fields of a CloudTrail change."""
+    recordset = event_change.get("resourceRecordSet", {})
+    alias_target = recordset.get("aliasTarget", {})
+    return {
+        "event_id": event.get("detail", {}).get("eventID") or event.get("id"),
+        "change_index": change_index,
+        "action": event_change.get("action"),
+        "name": recordset.get("name"),
+        "type": recordset.get("type"),
+        "set_identifier": recordset.get("setIdentifier"),
+        "alias_target": alias_target.get("dNSName"),
+    }
+
+
+class _CappedEvent:
+    """Event serialized and capped at LOG_MAX_EVENT_CHARS only when it is logged."""
+    def __init__(self, event):
+        self.event = event
+
+    def __str__(self) -> str:
+        return truncate(json.dumps(self.event, separators=(",", ":"), default=str), LOG_MAX_EVENT_CHARS)
+
+
+def sample_event(logger: logging.Logger, event, event_type: str):
+    """Dump the capped event for LOG_EVENT_SAMPLE_RATE of the events."""
+    if logger.isEnabledFor(logging.INFO) and _random.random() < LOG_EVENT_SAMPLE_RATE:
+        logger.info("Sampled %s event %s", event_type, _CappedEvent(event))
+
+
+def log_failed_event(logger: logging.Logger, event):
+    """Log the event an invocation failed on, capped at LOG_MAX_EVENT_CHARS unless LOG_MODE=verbose."""
+    if is_verbose():
+        logger.info(event)
+        return
+    logger.info("Failed event %s", _CappedEvent(event))
@@ -1,6 +1,31 @@
+import datetime
 import os
+import threading
+from typing import Optional
 
 import boto3
+from botocore.config import Config
+
+import metrics
+import ratelimit
+
+# Sessions are requested long enough that a refresh margin covering the full 900s Lambda timeout still leaves
+# most of the session to be reused by later warm invocations.
+STS_SESSION_DURATION_SECONDS = int(os.environ.get("STS_SESSION_DURATION_SECONDS", "3600"))
+STS_REFRESH_MARGIN_SECONDS = int(os.environ.get("STS_REFRESH_MARGIN_SECONDS", "900"))
+
+_cache_lock = threading.Lock()
+_role_locks = {}
+_session_cache = {}
+_cache_stats = {"hits": 0, "misses": 0, "refreshes": 0}
+# the botocore session loads the endpoint and service model data, it is built once per container and is not
+# thread-safe, clients are created from it under _client_lock
+_client_lock = threading.Lock()
+_sts_client = None
+_default_clients = {}
+_dynamodb_tables = {}
+# ratelimit owns the retries and backoff, a botocore retry would hide the throttle from the token bucket
+CLIENT_CONFIG = Config(retries={"mode": "standard", "total_max_attempts": 1})
 
 
 def get_adler_cross_account_iam():
@@ -8,14 +33,147 @@ def get_adler_cross_account_iam():
     return os.environ["ASSUME_ROLE_ARN"]
 
 
-def get_sts_role_session():
-    """Create and return new credentials assumed from the ADLER accout."""
-    sts = boto3.client("sts")
-    sts_role_cred = sts.assume_role(RoleArn=get_adler_cross_account_iam(),
-                                    RoleSessionName="SyncRole",
-                                    DurationSeconds=900)
+def _utcnow() -> datetime.datetime:
+    """Return the current UTC time, created for unit testing."""
+    return datetime.datetime.now(datetime.timezone.utc)
+
+
+def get_boto3_session() -> boto3.session.Session:
+    """Return the boto3 default session, shared with boto3.client and boto3.resource."""
+    if boto3.DEFAULT_SESSION is None:
+        with _cache_lock:
+            if boto3.DEFAULT_SESSION is None:
+                boto3.setup_default_session()
+    return boto3.DEFAULT_SESSION
+
+
+def get_sts_client() -> boto3.client:
+    """Return the STS client of the Lambda role, built once."""
+    global _sts_client
+    if _sts_client is None:
+        with _client_lock:
+            if _sts_client is None:
+                _sts_client = get_boto3_session().client("sts", config=CLIENT_CONFIG)
+    return _sts_client
+
+
+def get_default_client(service_name: str) -> boto3.client:
+    """Return a client of the Lambda role for the service, built once."""
+    client = _default_clients.get(service_name)
+    if client is None:
+        with _client_lock:
+            client = _default_clients.get(service_name)
+            if client is None:
+                client = _default_clients[service_name] = get_boto3_session().client(service_name)
+    return client
+
+
+def get_dynamodb_table(table_name: str):
+    """Return a DynamoDB table resource of the Lambda role, built once per table."""
+    table = _dynamodb_tables.get(table_name)
+    if table is None:
+        with _client_lock:
+            table = _dynamodb_tables.get(table_name)
+            if table is None:
+                table = _dynamodb_tables[table_name] = get_boto3_session().resource("dynamodb").Table(table_name)
+    return table
+
+
+def _role_lock(role_arn: str) -> threading.Lock:
+    """Return the lock guarding the cache entry of a single role arn."""
+    with _cache_lock:
+        if role_arn not in _role_locks:
+            _role_locks[role_arn] = threading.Lock()
+        return _role_locks[role_arn]
+
+
+def _assume_role(role_arn: str) -> dict:
+    """Assume the role and return the sts credentials."""
+    with metrics.span("Sts"):
+        sts_role_cred = ratelimit.call(get_sts_client().assume_role,
+                                       bucket=ratelimit.sts_bucket,
+                                       RoleArn=role_arn,
+                                       RoleSessionName="SyncRole",
+                                       DurationSeconds=STS_SESSION_DURATION_SECONDS)
+    return sts_role_cred["Credentials"]
+
+
+def _is_fresh(entry: dict) -> bool:
+    """Return whether the cached credentials are outside of the refresh margin."""
+    remaining = entry["credentials"]["Expiration"] - _utcnow()
+    return remaining.total_seconds() > STS_REFRESH_MARGIN_SECONDS
+
+
+def _get_cache_entry(role_arn: str) -> dict:
+    """Return the cached session for the role arn, assuming the role when missing or close to expiry."""
+    entry = _session_cache.get(role_arn)
+    if entry is not None and _is_fresh(entry):
+        with _cache_lock:
+            _cache_stats["hits"] += 1
+        return entry
+    with _role_lock(role_arn):
+        # another thread may have refreshed while we waited on the lock
+        entry = _session_cache.get(role_arn)
+        if entry is not None and _is_fresh(entry):
+            with _cache_lock:
+                _cache_stats["hits"] += 1
+            return entry
+        with _cache_lock:
+            _cache_stats["misses" if entry is None else "refreshes"] += 1
+        entry = {"credentials": _assume_role(role_arn), "clients": {}}
+        _session_cache[role_arn] = entry
+        return entry
+
+
+def get_sts_role_session(role_arn: str = None):
+    """Return credentials assumed from the ADLER accout, cached until shortly before they expire."""
+    credentials = _get_cache_entry(role_arn or get_adler_cross_account_iam())["credentials"]
     return [
-        sts_role_cred["Credentials"]["AccessKeyId"],
-        sts_role_cred["Credentials"]["SecretAccessKey"],
-        sts_role_cred["Credentials"]["SessionToken"],
+        credentials["AccessKeyId"],
+        credentials["SecretAccessKey"],
+        credentials["SessionToken"],
     ]
+
+
+def get_client(service_name: str, role_arn: Optional[str] = None) -> boto3.client:
+    """Return a client for the service built from the cached assumed role credentials."""
+    role_arn = role_arn or get_adler_cross_account_iam()
+    entry = _get_cache_entry(role_arn)
+    client = entry["clients"].get(service_name)
+    if client is None:
+        with _role_lock(role_arn):
+            client = entry["clients"].get(service_name)
+            if client is None:
+                credentials = entry["credentials"]
+                with _client_lock:
+                    client = get_boto3_session().client(service_name,
+                                                        aws_access_key_id=credentials["AccessKeyId"],
+                                                        aws_secret_access_key=credentials["SecretAccessKey"],
+                                                        aws_session_token=credentials["SessionToken"],
+                                                        config=CLIENT_CONFIG)
+                entry["clients"][service_name] = client
+    return client
+
+
+def get_route53_client(role_arn: Optional[str] = None) -> boto3.client:
+    """Return the destination Route53 client for the assumed role."""
+    return get_client("route53", role_arn=role_arn)
+
+
+def get_cache_stats() -> dict:
+    """Return a copy of the credential cache hit/miss/refresh counters."""
+    with _cache_lock:
+        return dict(_cache_stats)
+
+
+def clear_cache():
+    """Drop every cached session and client and reset the counters."""
+    global _sts_client
+    with _cache_lock:
+        _sts_client = None
+        _default_clients.clear()
+        _dynamodb_tables.clear()
+        _session_cache.clear()
+        _role_locks.clear()
+        for key in _cache_stats:
+            _cache_stats[key] = 0
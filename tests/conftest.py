@@ -19,6 +19,35 @@ sys.path.insert(0, my_path + "/../src/")
 print(sys.path)
 
 
+@pytest.fixture(autouse=True)
+def clear_caches():
+    """Start every test without sessions or statuses cached in memory by a previous test."""
+    import change_poller
+    import idempotency
+    import metrics
+    import planner
+    import ratelimit
+    import record_versions
+    import runtime_config
+    import sts
+
+    sts.clear_cache()
+    idempotency.clear_cache()
+    record_versions.clear_cache()
+    planner.clear_snapshots()
+    runtime_config.clear_cache()
+    metrics.clear()
+    ratelimit.reset()
+    # unit tests run against moto, they should not sleep on the production request rate
+    ratelimit.route53_bucket = ratelimit.TokenBucket(rate=10000, capacity=10000)
+    change_poller._sleep = lambda seconds: None
+    yield
+    sts.clear_cache()
+    idempotency.clear_cache()
+    record_versions.clear_cache()
+    runtime_config.clear_cache()
+
+
 @pytest.fixture(scope="function")
 def context():
     orig_env = os.environ.copy()
@@ -91,29 +120,88 @@ def dynamodb_client() -> Tuple[boto3.client, boto3.resource]:
         ]
 
 
-@pytest.fixture(scope="session")
+@pytest.fixture(scope="function")
 def create_recordset_event():
     with open("tests/test-files/eventbridge.create.event.json") as json_file:
         eventbridge_event = json.load(json_file)
         yield eventbridge_event
 
 
-@pytest.fixture(scope="session")
+@pytest.fixture(scope="function")
 def bad_create_recordset_event():
     with open("tests/test-files/eventbridge.create.bad.event.json") as json_file:
         eventbridge_event = json.load(json_file)
         yield eventbridge_event
 
 
-@pytest.fixture(scope="session")
+@pytest.fixture(scope="function")
 def delete_recordset_event():
     with open("tests/test-files/eventbridge.delete.event.json") as json_file:
         eventbridge_event = json.load(json_file)
         yield eventbridge_event
 
 
-@pytest.fixture(scope="session")
+@pytest.fixture(scope="function")
 def regional_alb_recordset_event():
     with open("tests/test-files/eventbridge.regional.alb.event.json") as json_file:
         eventbridge_event = json.load(json_file)
         yield eventbridge_event
+
+
+@pytest.fixture(scope="function")
+def pending_changes_table(dynamodb_client):
+    """Create the DynamoDB table used by WAIT_MODE=async."""
+    _, dynamodb_resource = dynamodb_client
+    table = dynamodb_resource.create_table(
+        TableName="pending-changes",
+        KeySchema=[{"AttributeName": "change_id", "KeyType": "HASH"}],
+        AttributeDefinitions=[{"AttributeName": "change_id", "AttributeType": "S"}],
+        BillingMode="PAY_PER_REQUEST",
+    )
+    os.environ["PENDING_CHANGES_TABLE"] = "pending-changes"
+    os.environ["WAIT_MODE"] = "async"
+    yield table
+    os.environ.pop("WAIT_MODE")
+    os.environ.pop("PENDING_CHANGES_TABLE")
+
+
+def sqs_event(*eventbridge_events) -> dict:
+    """Wrap EventBridge events the way the SQS intake queue delivers them."""
+    return {
+        "Records": [{
+            "messageId": f"message-{index}",
+            "receiptHandle": f"handle-{index}",
+            "body": json.dumps(eventbridge_event),
+            "eventSource": "aws:sqs",
+        } for index, eventbridge_event in enumerate(eventbridge_events)]
+    }
+
+
+@pytest.fixture(scope="function")
+def idempotency_table(dynamodb_client):
+    """Create the DynamoDB table behind the idempotency cache."""
+    _, dynamodb_resource = dynamodb_client
+    table = dynamodb_resource.create_table(
+        TableName="idempotency",
+        KeySchema=[{"AttributeName": "idempotency_key", "KeyType": "HASH"}],
+        AttributeDefinitions=[{"AttributeName": "idempotency_key", "AttributeType": "S"}],
+        BillingMode="PAY_PER_REQUEST",
+    )
+    os.environ["IDEMPOTENCY_TABLE"] = "idempotency"
+    yield table
+    os.environ.pop("IDEMPOTENCY_TABLE")
+
+
+@pytest.fixture(scope="function")
+def record_versions_table(dynamodb_client):
+    """Create the DynamoDB table behind the record version cache."""
+    _, dynamodb_resource = dynamodb_client
+    table = dynamodb_resource.create_table(
+        TableName="record-versions",
+        KeySchema=[{"AttributeName": "record_key", "KeyType": "HASH"}],
+        AttributeDefinitions=[{"AttributeName": "record_key", "AttributeType": "S"}],
+        BillingMode="PAY_PER_REQUEST",
+    )
+    os.environ["RECORD_VERSIONS_TABLE"] = "record-versions"
+    yield table
+    os.environ.pop("RECORD_VERSIONS_TABLE")
@@ -0,0 +1,374 @@
+"""In-process fake of the Route53 and STS APIs the sync calls, with latency, propagation and throttling injection.
+
+moto answers instantly, never throttles and reports every change INSYNC straight away. These fakes take time on a
+FakeClock, keep changes PENDING for insync_after_seconds, inject Throttling and PriorRequestNotComplete errors and
+log every request, so the waiting, batching and rate limiting code can be tested and benchmarked realistically.
+
+    clock = FakeClock()
+    route53 = FakeRoute53(clock=clock, latency_seconds=0.05, insync_after_seconds=30, throttle_rate=0.1)
+    zone_id = route53.create_hosted_zone("api.test.io")
+    with fake_aws(route53, clock=clock):
+        message_processing.process_message(event, context)
+    route53.request_log
+"""
+import contextlib
+import copy
+import datetime
+import itertools
+import random
+import re
+import string
+import threading
+import time
+from typing import Dict, List, Optional
+from unittest import mock
+
+from botocore.exceptions import ClientError
+
+import change_poller
+import ratelimit
+import sts
+
+# the characters Route53 lists as they are, the others are listed as \\ooo escapes of their bytes
+_UNESCAPED = frozenset(string.ascii_lowercase + string.digits + "-_")
+
+
+class FakeClock:
+    """Monotonic clock advanced by sleeping on it, shared by the fakes and the code under test."""
+    def __init__(self, start: float = 0.0):
+        self._now = start
+        self._lock = threading.Lock()
+
+    def now(self) -> float:
+        """Return the current fake time in seconds."""
+        with self._lock:
+            return self._now
+
+    def sleep(self, seconds: float):
+        """Advance the fake time instead of sleeping."""
+        with self._lock:
+            self._now += max(seconds, 0)
+
+
+class RealClock:
+    """Wall clock for load tests that should really take the injected latency."""
+    def now(self) -> float:
+        """Return the monotonic time in seconds."""
+        return time.monotonic()
+
+    def sleep(self, seconds: float):
+        """Sleep for real."""
+        time.sleep(max(seconds, 0))
+
+
+class InvalidChangeBatch(ClientError):
+    """Route53 InvalidChangeBatch, caught through client.exceptions like the botocore error factory classes."""
+
+
+class NoSuchChange(ClientError):
+    """Route53 NoSuchChange."""
+
+
+class NoSuchHostedZone(ClientError):
+    """Route53 NoSuchHostedZone."""
+
+
+class _Exceptions:
+    """The client.exceptions namespace of the fake."""
+    ClientError = ClientError
+    InvalidChangeBatch = InvalidChangeBatch
+    NoSuchChange = NoSuchChange
+    NoSuchHostedZone = NoSuchHostedZone
+
+
+def _error(error_class, code: str, message: str, operation_name: str) -> ClientError:
+    """Build a ClientError the way botocore does."""
+    return error_class(error_response={"Error": {"Code": code, "Message": message}}, operation_name=operation_name)
+
+
+def _unescape_name(name: str) -> str:
+    return re.sub(r"\\([0-7]{3})", lambda match: chr(int(match.group(1), 8)), name)
+
+
+def _escape_name(name: str) -> str:
+    """Return the name the way Route53 lists it, lower cased and fully qualified, * and other characters \\ooo escaped.
+
+    Written from the Route53 documentation rather than with recordset_diff, so the fake can catch its mistakes.
+    """
+    labels = []
+    for label in _unescape_name(name.lower().rstrip(".")).split("."):
+        labels.append("".join(char if char in _UNESCAPED else "".join(f"\\{byte:03o}" for byte in char.encode())
+                              for char in label))
+    return ".".join(labels) + "."
+
+
+def _record_key(recordset: dict) -> tuple:
+    """Return the (listed name, type, set identifier) a record set is unique on."""
+    return _escape_name(recordset["Name"]), recordset["Type"], recordset.get("SetIdentifier", "Simple")
+
+
+def _stored(recordset: dict) -> dict:
+    """Return the record set the way Route53 keeps it, the name fully qualified and escaped."""
+    stored = copy.deepcopy(recordset)
+    stored["Name"] = _escape_name(recordset["Name"])
+    return stored
+
+
+def _dns_order(name: str) -> bytes:
+    """Return the bytes Route53 compares names on, the labels reversed, each followed by its dot."""
+    labels = _unescape_name(name).rstrip(".").split(".")
+    return b"".join(f"{label}.".encode() for label in labels[::-1])
+
+
+def _sort_key(key: tuple) -> tuple:
+    """Return the key Route53 lists records in, the name then type then set identifier."""
+    return _dns_order(key[0]), key[1], key[2]
+
+
+class _FakeClient:
+    """Latency, error injection and request logging shared by the fake clients."""
+
+    exceptions = _Exceptions
+
+    def __init__(self,
+                 clock=None,
+                 latency_seconds: float = 0.0,
+                 throttle_rate: float = 0.0,
+                 seed: int = 0):
+        self.clock = clock or FakeClock()
+        self.latency_seconds = latency_seconds
+        self.throttle_rate = throttle_rate
+        self.request_log: List[dict] = []
+        self._random = random.Random(seed)
+        self._failures: Dict[str, List[str]] = {}
+        self._lock = threading.RLock()
+
+    def fail_next(self, operation_name: str, code: str, count: int = 1):
+        """Fail the next count calls of the operation with the error code, before any other injection."""
+        with self._lock:
+            self._failures.setdefault(operation_name, []).extend([code] * count)
+
+    def _injected_error(self, operation_name: str) -> Optional[str]:
+        """Return the error code to fail the call with, None to let it through."""
+        queued = self._failures.get(operation_name)
+        if queued:
+            return queued.pop(0)
+        if self.throttle_rate and self._random.random() < self.throttle_rate:
+            return "Throttling"
+        return None
+
+    def _request(self, operation_name: str, params: dict, handler):
+        """Take the latency, then log and answer the request or fail it with an injected error."""
+        self.clock.sleep(self.latency_seconds)
+        with self._lock:
+            entry = {"operation": operation_name, "params": copy.deepcopy(params), "at": self.clock.now(), "error": None}
+            self.request_log.append(entry)
+            error_code = self._injected_error(operation_name)
+            if error_code is not None:
+                entry["error"] = error_code
+                raise _error(ClientError, error_code, f"Injected {error_code}", operation_name)
+            try:
+                return handler()
+            except ClientError as ce:
+                entry["error"] = ce.response["Error"]["Code"]
+                raise
+
+    def calls(self, operation_name: str = None) -> List[dict]:
+        """Return the logged requests, only those of one operation when given."""
+        with self._lock:
+            return [entry for entry in self.request_log if operation_name in (None, entry["operation"])]
+
+
+class FakeRoute53(_FakeClient):
+    """Drop-in Route53 client for change_resource_record_sets, list_resource_record_sets and get_change."""
+    def __init__(self,
+                 clock=None,
+                 latency_seconds: float = 0.0,
+                 insync_after_seconds: float = 0.0,
+                 throttle_rate: float = 0.0,
+                 prior_request_rate: float = 0.0,
+                 seed: int = 0):
+        super().__init__(clock=clock, latency_seconds=latency_seconds, throttle_rate=throttle_rate, seed=seed)
+        self.insync_after_seconds = insync_after_seconds
+        self.prior_request_rate = prior_request_rate
+        self.zones: Dict[str, Dict[tuple, dict]] = {}
+        self.changes: Dict[str, float] = {}
+        self._ids = itertools.count(1)
+
+    def _injected_error(self, operation_name: str) -> Optional[str]:
+        """Add PriorRequestNotComplete, which Route53 answers writes with while it is busy, to the injections."""
+        error_code = super()._injected_error(operation_name)
+        if (error_code is None and operation_name == "ChangeResourceRecordSets" and self.prior_request_rate
+                and self._random.random() < self.prior_request_rate):
+            return "PriorRequestNotComplete"
+        return error_code
+
+    def create_hosted_zone(self, name: str, hosted_zone_id: str = None) -> str:
+        """Create an empty hosted zone and return its id."""
+        hosted_zone_id = hosted_zone_id or f"FAKEZONE{next(self._ids)}"
+        with self._lock:
+            self.zones[hosted_zone_id] = {}
+        return hosted_zone_id
+
+    def put_record_sets(self, hosted_zone_id: str, recordsets: List[dict]):
+        """Seed record sets without a request, logging or propagation delay."""
+        with self._lock:
+            for recordset in recordsets:
+                self.zones[hosted_zone_id][_record_key(recordset)] = _stored(recordset)
+
+    def _zone(self, hosted_zone_id: str, operation_name: str) -> Dict[tuple, dict]:
+        """Return the records of a hosted zone, NoSuchHostedZone when it does not exist."""
+        zone = self.zones.get(hosted_zone_id.replace("/hostedzone/", ""))
+        if zone is None:
+            raise _error(NoSuchHostedZone, "NoSuchHostedZone", f"No hosted zone found with ID: {hosted_zone_id}",
+                         operation_name)
+        return zone
+
+    def change_resource_record_sets(self, HostedZoneId: str, ChangeBatch: dict) -> dict:
+        """Apply the ChangeBatch atomically, rejecting it with the messages Route53 uses for conflicts."""
+        def handler():
+            zone = self._zone(HostedZoneId, "ChangeResourceRecordSets")
+            updated = dict(zone)
+            errors = []
+            for change in ChangeBatch["Changes"]:
+                recordset = change["ResourceRecordSet"]
+                key = _record_key(recordset)
+                described = f"[name='{key[0]}', type='{key[1]}', set-identifier='{key[2]}']"
+                action = str(getattr(change["Action"], "value", change["Action"]))
+                if action == "CREATE" and key in updated:
+                    errors.append(f"Tried to create resource record set {described} but it already exists")
+                elif action == "DELETE" and key not in updated:
+                    errors.append(f"Tried to delete resource record set {described} but it was not found")
+                elif action == "DELETE" and updated[key] != _stored(recordset):
+                    errors.append(f"Tried to delete resource record set {described} but the values provided do not "
+                                  "match the current values")
+                elif action == "DELETE":
+                    del updated[key]
+                else:
+                    updated[key] = _stored(recordset)
+            if errors:
+                raise _error(InvalidChangeBatch, "InvalidChangeBatch", str(errors), "ChangeResourceRecordSets")
+            zone.clear()
+            zone.update(updated)
+            change_id = f"/change/FAKE{next(self._ids)}"
+            self.changes[change_id] = self.clock.now()
+            return {"ChangeInfo": self._change_info(change_id)}
+
+        return self._request("ChangeResourceRecordSets", {"HostedZoneId": HostedZoneId, "ChangeBatch": ChangeBatch},
+                             handler)
+
+    def _change_info(self, change_id: str) -> dict:
+        """Return the ChangeInfo of a change, INSYNC once insync_after_seconds passed on the clock."""
+        submitted_at = self.changes[change_id]
+        status = "INSYNC" if self.clock.now() - submitted_at >= self.insync_after_seconds else "PENDING"
+        return {
+            "Id": change_id,
+            "Status": status,
+            "SubmittedAt": datetime.datetime(2022, 1, 1, tzinfo=datetime.timezone.utc) +
+            datetime.timedelta(seconds=submitted_at),
+        }
+
+    def get_change(self, Id: str) -> dict:
+        """Return the status of a submitted change."""
+        def handler():
+            change_id = Id if Id.startswith("/change/") else f"/change/{Id}"
+            if change_id not in self.changes:
+                raise _error(NoSuchChange, "NoSuchChange", f"Could not find resource with ID: {Id}", "GetChange")
+            return {"ChangeInfo": self._change_info(change_id)}
+
+        return self._request("GetChange", {"Id": Id}, handler)
+
+    def list_resource_record_sets(self,
+                                  HostedZoneId: str,
+                                  StartRecordName: str = None,
+                                  StartRecordType: str = None,
+                                  StartRecordIdentifier: str = None,
+                                  MaxItems: str = "300") -> dict:
+        """List the records in Route53 order from the start record, one page of MaxItems at a time."""
+        params = {
+            "HostedZoneId": HostedZoneId,
+            "StartRecordName": StartRecordName,
+            "StartRecordType": StartRecordType,
+            "StartRecordIdentifier": StartRecordIdentifier,
+            "MaxItems": MaxItems,
+        }
+
+        def handler():
+            zone = self._zone(HostedZoneId, "ListResourceRecordSets")
+            keys = sorted(zone, key=_sort_key)
+            if StartRecordName is not None:
+                start = (_dns_order(_escape_name(StartRecordName)), StartRecordType or "",
+                         StartRecordIdentifier or "")
+                keys = [key for key in keys if _sort_key(key) >= start]
+            page_size = min(int(MaxItems), 300)
+            response = {
+                "ResourceRecordSets": [copy.deepcopy(zone[key]) for key in keys[:page_size]],
+                "IsTruncated": len(keys) > page_size,
+                "MaxItems": MaxItems,
+            }
+            if response["IsTruncated"]:
+                name, record_type, set_identifier = keys[page_size]
+                response["NextRecordName"] = name
+                response["NextRecordType"] = record_type
+                if set_identifier != "Simple":
+                    response["NextRecordIdentifier"] = set_identifier
+            return response
+
+        return self._request("ListResourceRecordSets", {k: v for k, v in params.items() if v is not None}, handler)
+
+
+class FakeSts(_FakeClient):
+    """Drop-in STS client for assume_role."""
+    def assume_role(self, RoleArn: str, RoleSessionName: str, DurationSeconds: int = 3600) -> dict:
+        """Return credentials expiring DurationSeconds from now."""
+        def handler():
+            expiration = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(seconds=DurationSeconds)
+            return {
+                "Credentials": {
+                    "AccessKeyId": f"FAKEKEY{len(self.request_log)}",
+                    "SecretAccessKey": "fake",
+                    "SessionToken": "fake",
+                    "Expiration": expiration,
+                },
+                "AssumedRoleUser": {"Arn": f"{RoleArn}/{RoleSessionName}"},
+            }
+
+        return self._request("AssumeRole", {
+            "RoleArn": RoleArn,
+            "RoleSessionName": RoleSessionName,
+            "DurationSeconds": DurationSeconds
+        }, handler)
+
+
+class _FakeSession:
+    """boto3 session handing out the fakes for the services they cover."""
+    def __init__(self, clients: dict):
+        self._clients = clients
+
+    def client(self, service_name: str, **kwargs):
+        return self._clients[service_name]
+
+
+@contextlib.contextmanager
+def fake_aws(route53: FakeRoute53, sts_client: FakeSts = None, clock=None):
+    """Route the Route53 and STS clients of the sync to the fakes, sleeping on the clock when given.
+
+    The assumed role cache of the sts module is still exercised, only the clients it builds are replaced.
+    """
+    sts_client = sts_client or FakeSts(clock=route53.clock)
+    session = _FakeSession({"route53": route53, "sts": sts_client})
+    patches = [
+        mock.patch.object(sts, "get_boto3_session", return_value=session),
+        mock.patch.object(sts, "get_sts_client", return_value=sts_client),
+    ]
+    if clock is not None:
+        patches += [
+            mock.patch.object(change_poller, "_sleep", clock.sleep),
+            mock.patch.object(ratelimit, "_sleep", clock.sleep),
+        ]
+    sts.clear_cache()
+    with contextlib.ExitStack() as stack:
+        for patch in patches:
+            stack.enter_context(patch)
+        yield route53
+    sts.clear_cache()
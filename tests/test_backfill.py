@@ -0,0 +1,95 @@
+import copy
+import gzip
+import io
+import json
+import os
+
+import boto3
+import moto
+from botocore.config import Config
+
+import backfill
+
+
+def _record(create_recordset_event, event_id: str, event_time: str, changes: list, **fields) -> dict:
+    record = copy.deepcopy(create_recordset_event["detail"])
+    template = record["requestParameters"]["changeBatch"]["changes"][0]
+    record["eventID"] = event_id
+    record["eventTime"] = event_time
+    record["requestParameters"]["changeBatch"]["changes"] = []
+    for action, name, dns_name in changes:
+        change = copy.deepcopy(template)
+        change["action"] = action
+        change["resourceRecordSet"]["name"] = name
+        change["resourceRecordSet"]["aliasTarget"]["dNSName"] = dns_name
+        record["requestParameters"]["changeBatch"]["changes"].append(change)
+    record.update(fields)
+    return record
+
+
+def _write_log(path, records: list):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with gzip.open(path, "wt") as log_file:
+        json.dump({"Records": records}, log_file)
+
+
+def _alias_targets(route53_client) -> dict:
+    recordsets = route53_client.list_resource_record_sets(
+        HostedZoneId=os.environ["DEST_HOSTED_ZONE_ID"])["ResourceRecordSets"]
+    return {
+        recordset["Name"]: recordset["AliasTarget"]["DNSName"].rstrip(".")
+        for recordset in recordsets if "AliasTarget" in recordset
+    }
+
+
+class TestBackfill:
+    """Test class for the CloudTrail log backfill."""
+    def test_records_decoded_across_chunks(self):
+        """Test the incremental parser yields every record whatever the read size."""
+        records = [{"eventID": str(index), "nested": {"text": "a]b}" * index}} for index in range(20)]
+        document = json.dumps({"Records": records}, indent=2)
+
+        for read_chars in (1, 7, 4096):
+            assert list(backfill.iter_log_records(io.StringIO(document), read_chars=read_chars)) == records
+
+    def test_final_state_replayed(self, context, route53_client, sts_client, create_recordset_event, tmp_path):
+        """Test files read out of eventTime order replay the last change of every record only."""
+        old = _record(create_recordset_event, "e1", "2022-10-31T18:00:00Z",
+                      [("CREATE", "bf1.api.test.io.", "old.amazonaws.com"),
+                       ("CREATE", "bf2.api.test.io.", "gone.amazonaws.com")])
+        new = _record(create_recordset_event, "e2", "2022-10-31T19:00:00Z",
+                      [("UPSERT", "bf1.api.test.io.", "new.amazonaws.com"),
+                       ("DELETE", "bf2.api.test.io.", "gone.amazonaws.com")])
+        failed = _record(create_recordset_event, "e3", "2022-10-31T20:00:00Z",
+                         [("UPSERT", "bf1.api.test.io.", "failed.amazonaws.com")], errorCode="InvalidChangeBatch")
+        other = {"eventSource": "s3.amazonaws.com", "eventName": "GetObject", "eventTime": "2022-10-31T18:30:00Z"}
+        # the later events sort first
+        _write_log(str(tmp_path / "a" / "late.json.gz"), [new, failed])
+        _write_log(str(tmp_path / "b" / "early.json.gz"), [other, old])
+
+        result = backfill.backfill(str(tmp_path))
+
+        assert result["files"] == 2
+        assert result["records"] == 4
+        assert result["final"] == {"UPSERT": 1, "DELETE": 1}
+        targets = _alias_targets(route53_client)
+        assert targets.get("bf1.api.test.io.") == "new.amazonaws.com"
+        assert "bf2.api.test.io." not in targets
+
+    def test_s3_prefix_streamed(self, context, route53_client, create_recordset_event):
+        """Test the log files of an S3 prefix are streamed and a dry run writes nothing."""
+        with moto.mock_s3():
+            # moto stores the aws-chunked body of the default checksummed upload as is
+            s3_client = boto3.client("s3", config=Config(request_checksum_calculation="when_required"))
+            s3_client.create_bucket(Bucket="trail")
+            records = [_record(create_recordset_event, "e1", "2022-10-31T18:00:00Z",
+                               [("CREATE", "bf3.api.test.io.", "s3.amazonaws.com")])]
+            s3_client.put_object(Bucket="trail", Key="AWSLogs/1.json.gz",
+                                 Body=gzip.compress(json.dumps({"Records": records}).encode()))
+            s3_client.put_object(Bucket="trail", Key="AWSLogs/digest.txt", Body=b"ignored")
+
+            result = backfill.backfill("s3://trail/AWSLogs/", dry_run=True)
+
+        assert result["files"] == 1
+        assert result["final"] == {"UPSERT": 1}
+        assert "bf3.api.test.io." not in _alias_targets(route53_client)
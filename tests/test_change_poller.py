@@ -0,0 +1,44 @@
+import pytest
+
+import change_poller
+import message_processing
+
+
+class TestChangePoller:
+    """Test class for the shared multi-change poller."""
+    def test_many_changes_polled_together(self, mocker):
+        """Test every change is polled until INSYNC with growing delays."""
+        sleep = mocker.patch("change_poller._sleep")
+        polls = {}
+
+        def get_change(Id):
+            polls[Id] = polls.get(Id, 0) + 1
+            return {"ChangeInfo": {"Status": "INSYNC" if polls[Id] >= int(Id[-1]) else "PENDING"}}
+
+        route53_client = mocker.Mock()
+        route53_client.get_change.side_effect = get_change
+        statuses = change_poller.poll_changes(route53_client, ["C1", "C2", "C3"])
+
+        assert statuses == {"C1": "INSYNC", "C2": "INSYNC", "C3": "INSYNC"}
+        assert polls == {"C1": 1, "C2": 2, "C3": 3}
+        delays = [call.args[0] for call in sleep.call_args_list]
+        assert delays == [2, 3, 4.5]
+
+    def test_stops_before_the_deadline(self, context, mocker):
+        """Test polling stops with the changes still pending when the invocation is about to time out."""
+        mocker.patch("change_poller._sleep")
+        remaining = iter([60000, 14000, 9000])
+        mocker.patch.object(context, "get_remaining_time_in_millis", side_effect=lambda: next(remaining))
+        route53_client = mocker.Mock()
+        route53_client.get_change.return_value = {"ChangeInfo": {"Status": "PENDING"}}
+
+        statuses = change_poller.poll_changes(route53_client, ["C1", "C2"], context=context)
+
+        assert statuses == {"C1": "PENDING", "C2": "PENDING"}
+        assert route53_client.get_change.call_count == 4
+
+    def test_wait_for_changes_raises_on_pending_changes(self, mocker):
+        """Test changes left pending without a pending changes table fail the invocation like the waiter did."""
+        mocker.patch("change_poller.poll_changes", return_value={"C1": "INSYNC", "C2": "PENDING"})
+        with pytest.raises(Exception, match="C2"):
+            message_processing.wait_for_changes(mocker.Mock(), {"C1": ("Z1", ["a"]), "C2": ("Z1", ["b"])})
@@ -0,0 +1,59 @@
+import time
+
+import change_poller
+import change_tracker
+import sts
+from handler import lambda_handler, poller_handler
+
+
+class TestChangeTracker:
+    """Test class for the asynchronous propagation tracking."""
+    def test_async_wait_records_pending_change_without_waiting(self, context, mocker, route53_client, sts_client,
+                                                               pending_changes_table, create_recordset_event):
+        """Test the handler returns without the waiter and leaves the change for the poller."""
+        wait_spy = mocker.spy(change_poller, "poll_changes")
+        response = lambda_handler(create_recordset_event, context)
+
+        assert list(response.values()) == [True]
+        assert wait_spy.call_count == 0
+        pending = change_tracker.list_pending_changes()
+        assert len(pending) == 1
+        assert pending[0]["names"] == ["test.api.test.io."]
+
+    def test_pending_changes_table_built_once(self, context, mocker, pending_changes_table):
+        """Test tracking many changes builds the table resource once, on the shared session."""
+        resource_spy = mocker.spy(sts.get_boto3_session(), "resource")
+        for index in range(3):
+            change_tracker.track_change(change_id=f"/change/C{index}", hosted_zone_id="Z1",
+                                        names=["test.api.test.io."], role_arn="arn:aws:iam::1:role/r")
+
+        assert len(change_tracker.list_pending_changes()) == 3
+        assert resource_spy.call_count == 1
+
+    def test_poller_marks_changes_insync(self, context, mocker, route53_client, sts_client, pending_changes_table,
+                                         create_recordset_event):
+        """Test the poller removes INSYNC changes so later polls skip them, and emits the time to INSYNC metric."""
+        metric_spy = mocker.spy(change_tracker.metrics, "put_metric")
+        lambda_handler(create_recordset_event, context)
+
+        summary = poller_handler({}, context)
+
+        assert len(summary[change_tracker.INSYNC]) == 1
+        assert change_tracker.list_pending_changes() == []
+        assert pending_changes_table.scan()["Count"] == 0
+        assert metric_spy.call_args.args[0] == "TimeToInsync"
+
+    def test_poller_alerts_stuck_changes_once(self, context, mocker, route53_client, sts_client,
+                                              pending_changes_table):
+        """Test a change pending past CHANGE_STUCK_SECONDS is alerted on once and kept pending."""
+        change_tracker.track_change(change_id="/change/STUCK",
+                                    hosted_zone_id="Z1",
+                                    names=["test.api.test.io."],
+                                    submitted_at=time.time() - 3600)
+        mocker.patch.object(route53_client, "get_change", return_value={"ChangeInfo": {"Status": "PENDING"}})
+        mocker.patch("sts.get_route53_client", return_value=route53_client)
+        error_spy = mocker.spy(change_tracker.logger, "error")
+
+        assert poller_handler({}, context)["stuck"] == ["/change/STUCK"]
+        assert poller_handler({}, context)["stuck"] == ["/change/STUCK"]
+        assert error_spy.call_count == 1
@@ -0,0 +1,102 @@
+import copy
+import json
+import os
+import uuid
+
+import pytest
+
+import change_poller
+import continuation
+import message_processing
+
+
+def _two_destination_event(route53_client, create_recordset_event) -> dict:
+    """Route other.io through a second role so the event is applied in two steps."""
+    other_zone = route53_client.create_hosted_zone(
+        Name="other.io", CallerReference=str(uuid.uuid4()))["HostedZone"]["Id"].replace("/hostedzone/", "")
+    os.environ["DOMAIN_ROUTES"] = json.dumps({
+        "api.test.io": os.environ["DEST_HOSTED_ZONE_ID"],
+        "other.io": {
+            "hosted_zone_id": other_zone,
+            "role_arn": "arn:aws:iam::111111111111:role/other",
+        },
+    })
+    event = copy.deepcopy(create_recordset_event)
+    changes = event["detail"]["requestParameters"]["changeBatch"]["changes"]
+    for name in ["b.api.test.io.", "a.other.io.", "b.other.io."]:
+        change = copy.deepcopy(changes[0])
+        change["resourceRecordSet"]["name"] = name
+        changes.append(change)
+    return event
+
+
+class TestContinuation:
+    """Test class for the deadline-aware checkpoints."""
+    def test_destination_past_deadline_handed_to_continuation(self, context, mocker, route53_client, sts_client,
+                                                              create_recordset_event):
+        """Test a shrinking time budget defers the second destination and the continuation applies only that."""
+        event = _two_destination_event(route53_client, create_recordset_event)
+        budget = iter(range(60000, 0, -20000))
+        mocker.patch.object(context, "get_remaining_time_in_millis", side_effect=lambda: next(budget))
+        invoke = mocker.patch("continuation.invoke_continuation")
+        batch_spy = mocker.spy(message_processing, "change_resource_record_sets_batch")
+        try:
+            response = message_processing.process_message(event, context)
+            assert all(response.values())
+            assert batch_spy.call_count == 1
+            continuation_event = invoke.call_args.args[0]
+            assert continuation_event["continuation"] == {"attempt": 1, "completed": [0, 1], "pending": []}
+
+            mocker.patch.object(context, "get_remaining_time_in_millis", return_value=840000)
+            batch_spy.reset_mock()
+            response = message_processing.process_message(continuation_event, context)
+        finally:
+            os.environ.pop("DOMAIN_ROUTES")
+
+        assert all(response.values())
+        assert invoke.call_count == 1
+        assert [len(call.kwargs["changes"]) for call in batch_spy.call_args_list] == [2]
+        assert batch_spy.call_args.kwargs["changes"][0]["ResourceRecordSet"]["Name"] == "a.other.io."
+
+    def test_pending_changes_waited_on_by_continuation(self, context, mocker, route53_client, sts_client,
+                                                       create_recordset_event):
+        """Test changes still pending at the deadline are checkpointed and waited on, not written again."""
+        budget = iter([840000, 11000])
+        mocker.patch.object(context, "get_remaining_time_in_millis", side_effect=lambda: next(budget))
+        invoke = mocker.patch("continuation.invoke_continuation")
+        event = copy.deepcopy(create_recordset_event)
+        event["detail"]["requestParameters"]["changeBatch"]["changes"][0]["resourceRecordSet"]["name"] = "c.api.test.io."
+
+        message_processing.process_message(event, context)
+
+        continuation_event = invoke.call_args.args[0]
+        assert continuation_event["continuation"]["completed"] == [0]
+        [pending] = continuation_event["continuation"]["pending"]
+        assert pending["hosted_zone_id"] == os.environ["DEST_HOSTED_ZONE_ID"]
+        assert pending["names"] == ["c.api.test.io."]
+
+        mocker.patch.object(context, "get_remaining_time_in_millis", return_value=840000)
+        batch_spy = mocker.spy(message_processing, "change_resource_record_sets_batch")
+        poll_spy = mocker.spy(change_poller, "poll_changes")
+        response = message_processing.process_message(continuation_event, context)
+
+        assert response == {"c.api.test.io.": True}
+        assert batch_spy.call_count == 0
+        assert poll_spy.call_args.args[1] == [pending["change_id"]]
+        assert invoke.call_count == 1
+
+    def test_continuation_invokes_function_asynchronously(self, context, mocker):
+        """Test the continuation is an Event invocation of the function and gives up after the maximum attempts."""
+        lambda_client = mocker.patch("continuation.boto3.client").return_value
+        context.invoked_function_arn = "arn:aws:lambda:us-east-1:111111111111:function:sync"
+        event = continuation.continuation_event({"id": "1"}, [0, 2], continuation.Checkpoint(context))
+
+        continuation.invoke_continuation(event, context)
+
+        assert lambda_client.invoke.call_args.kwargs["FunctionName"] == context.invoked_function_arn
+        assert lambda_client.invoke.call_args.kwargs["InvocationType"] == "Event"
+        assert json.loads(lambda_client.invoke.call_args.kwargs["Payload"])["continuation"]["completed"] == [0, 2]
+
+        event["continuation"]["attempt"] = continuation.CONTINUATION_MAX_ATTEMPTS + 1
+        with pytest.raises(Exception, match="continuations"):
+            continuation.invoke_continuation(event, context)
@@ -0,0 +1,27 @@
+import os
+
+import event_filter
+import message_processing
+from handler import lambda_handler
+
+
+class TestEventFilter:
+    """Test class for the boto3 free event filter."""
+    def test_filtered_event_answered_before_message_processing(self, context, mocker, regional_alb_recordset_event):
+        """Test an event with no change to sync never reaches process_message."""
+        process_spy = mocker.spy(message_processing, "process_message")
+        response = lambda_handler(regional_alb_recordset_event, context)
+        assert response == {"test.api.test.io.": False}
+        assert process_spy.call_count == 0
+
+    def test_halt_processing_filters_every_change(self, context, create_recordset_event):
+        """Test HALT_PROCESSING reports every change as not processed."""
+        os.environ["HALT_PROCESSING"] = "1"
+        try:
+            assert event_filter.filtered_status(create_recordset_event) == {"test.api.test.io.": False}
+        finally:
+            os.environ["HALT_PROCESSING"] = "0"
+
+    def test_event_with_a_synced_change_is_not_filtered(self, context, route53_client, create_recordset_event):
+        """Test an event with a change routed to a destination zone is left to process_message."""
+        assert event_filter.filtered_status(create_recordset_event) is None
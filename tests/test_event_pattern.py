@@ -0,0 +1,101 @@
+import copy
+import json
+import os
+
+import pytest
+
+import event_filter
+import event_pattern
+import routing
+
+FIXTURES = [
+    "eventbridge.create.event.json",
+    "eventbridge.delete.event.json",
+    "eventbridge.regional.alb.event.json",
+]
+
+
+def _values(value, path: list) -> list:
+    """Return the leaf values at the path, flattening arrays like EventBridge."""
+    if isinstance(value, list):
+        return [leaf for item in value for leaf in _values(item, path)]
+    if not path:
+        return [value]
+    if not isinstance(value, dict) or path[0] not in value:
+        return []
+    return _values(value[path[0]], path[1:])
+
+
+def _leaf_matches(value, field_filter) -> bool:
+    if isinstance(field_filter, str):
+        return value == field_filter
+    (operator, operand), = field_filter.items()
+    if operator == "equals-ignore-case":
+        return isinstance(value, str) and value.lower() == operand.lower()
+    if operator == "suffix":
+        return isinstance(value, str) and value.lower().endswith(operand["equals-ignore-case"].lower())
+    raise AssertionError(f"Unsupported filter {field_filter}")
+
+
+def _matches(pattern: dict, event: dict, path: list = None) -> bool:
+    """Evaluate an EventBridge pattern, every field matching when any of its values matches any of its filters."""
+    path = path or []
+    for key, field_pattern in pattern.items():
+        if isinstance(field_pattern, dict):
+            if not _matches(field_pattern, event, path + [key]):
+                return False
+            continue
+        values = _values(event, path + [key])
+        field_matches = False
+        for field_filter in field_pattern:
+            if isinstance(field_filter, dict) and "exists" in field_filter:
+                field_matches |= bool(values) == field_filter["exists"]
+            else:
+                field_matches |= any(_leaf_matches(value, field_filter) for value in values)
+        if not field_matches:
+            return False
+    return True
+
+
+def _fixture(name: str) -> dict:
+    with open(os.path.join(os.path.dirname(__file__), "test-files", name)) as json_file:
+        return json.load(json_file)
+
+
+class TestEventPattern:
+    """Test class for the EventBridge pattern generated from the routing configuration."""
+    @pytest.mark.parametrize("domain_filter", ["api.test.io", "test.io", "other.example.com", ""])
+    @pytest.mark.parametrize("fixture", FIXTURES)
+    def test_pattern_accepts_fixtures_the_filter_accepts(self, monkeypatch, fixture, domain_filter):
+        """Test the pattern with setIdentifier exclusion matches exactly the fixtures filtered_status processes."""
+        monkeypatch.setenv("COMPANY_DOMAIN_FILTER", domain_filter)
+        event = _fixture(fixture)
+        pattern = event_pattern.build_event_pattern(exclude_set_identifiers=True)
+
+        assert _matches(pattern, event) == (event_filter.filtered_status(event) is None)
+
+    def test_mixed_event_never_dropped_by_default(self, monkeypatch):
+        """Test an event mixing routed, unrouted and non-Simple changes triggers the default pattern."""
+        monkeypatch.setenv("COMPANY_DOMAIN_FILTER", "api.test.io")
+        event = _fixture("eventbridge.create.event.json")
+        changes = event["detail"]["requestParameters"]["changeBatch"]["changes"]
+        regional = copy.deepcopy(changes[0])
+        regional["resourceRecordSet"]["setIdentifier"] = "alb-us-east-1"
+        unrouted = copy.deepcopy(changes[0])
+        unrouted["resourceRecordSet"]["name"] = "svc.other.example.com."
+        changes[0]["resourceRecordSet"]["name"] = "API.Test.IO"
+        changes.extend([regional, unrouted])
+
+        assert event_filter.filtered_status(event) is None
+        assert _matches(event_pattern.build_event_pattern(), event)
+
+    def test_routes_compiled_to_suffixes(self):
+        """Test every route becomes apex and subdomain filters and a catch-all route drops the name constraint."""
+        table = routing.RoutingTable(routing.parse_routes('{"a.io": "Z1", "b.a.io.": "Z2"}'))
+        name_pattern = event_pattern.build_event_pattern(table)["detail"]["requestParameters"]["changeBatch"]
+        filters = name_pattern["changes"]["resourceRecordSet"]["name"]
+
+        assert {"suffix": {"equals-ignore-case": ".a.io."}} in filters
+        assert {"equals-ignore-case": "b.a.io"} in filters
+        catch_all = routing.RoutingTable(routing.parse_routes('{"a.io": "Z1", "": "Z2"}'))
+        assert "requestParameters" not in event_pattern.build_event_pattern(catch_all)["detail"]
@@ -0,0 +1,127 @@
+import copy
+
+import message_processing
+import ratelimit
+import recordset_diff
+
+from .fake_route53 import FakeClock, FakeRoute53, fake_aws
+
+
+def _event(create_recordset_event, names, action: str = "CREATE") -> dict:
+    event = copy.deepcopy(create_recordset_event)
+    template = event["detail"]["requestParameters"]["changeBatch"]["changes"][0]
+    changes = []
+    for name in names:
+        change = copy.deepcopy(template)
+        change["action"] = action
+        change["resourceRecordSet"]["name"] = name
+        changes.append(change)
+    event["detail"]["requestParameters"]["changeBatch"]["changes"] = changes
+    return event
+
+
+def _alias(name: str, dns_name: str = "lb.amazonaws.com") -> dict:
+    return {
+        "Name": name,
+        "Type": "A",
+        "AliasTarget": {
+            "HostedZoneId": "Z26RNL4JYFTOTI",
+            "DNSName": dns_name,
+            "EvaluateTargetHealth": False
+        },
+    }
+
+
+class TestFakeRoute53:
+    """Test class for the processing pipeline against the fake Route53 backend."""
+    def test_pending_changes_polled_until_insync(self, context, create_recordset_event, monkeypatch):
+        """Test the poller keeps polling a PENDING change until the propagation delay passed on the clock."""
+        clock = FakeClock()
+        route53 = FakeRoute53(clock=clock, latency_seconds=0.05, insync_after_seconds=20)
+        zone_id = route53.create_hosted_zone("api.test.io")
+        monkeypatch.setenv("DEST_HOSTED_ZONE_ID", zone_id)
+        event = _event(create_recordset_event, [f"svc{i}.api.test.io." for i in range(3)])
+
+        with fake_aws(route53, clock=clock):
+            response = message_processing.process_message(event, context)
+
+        assert all(response.values())
+        assert len(route53.calls("ChangeResourceRecordSets")) == 1
+        assert len(route53.calls("GetChange")) > 1
+        assert clock.now() >= 20
+        assert len(route53.zones[zone_id]) == 3
+
+    def test_throttled_writes_retried(self, context, create_recordset_event, monkeypatch):
+        """Test Throttling and PriorRequestNotComplete on the write are retried through the rate limiter."""
+        clock = FakeClock()
+        route53 = FakeRoute53(clock=clock)
+        route53.fail_next("ChangeResourceRecordSets", "Throttling")
+        route53.fail_next("ChangeResourceRecordSets", "PriorRequestNotComplete")
+        monkeypatch.setenv("DEST_HOSTED_ZONE_ID", route53.create_hosted_zone("api.test.io"))
+
+        with fake_aws(route53, clock=clock):
+            response = message_processing.process_message(_event(create_recordset_event, ["a.api.test.io."]),
+                                                          context)
+
+        assert response == {"a.api.test.io.": True}
+        assert [call["error"] for call in route53.calls("ChangeResourceRecordSets")] == [
+            "Throttling", "PriorRequestNotComplete", None
+        ]
+        assert ratelimit.get_stats()["retries"] == 2
+
+    def test_create_conflict_upserted(self, context, create_recordset_event, monkeypatch, mocker):
+        """Test the fake rejects a CREATE of an existing record like Route53 so it is retried as an UPSERT."""
+        route53 = FakeRoute53()
+        zone_id = route53.create_hosted_zone("api.test.io")
+        route53.put_record_sets(zone_id, [_alias("a.api.test.io.", "old.amazonaws.com")])
+        monkeypatch.setenv("DEST_HOSTED_ZONE_ID", zone_id)
+        # the diff engine would turn the CREATE into an UPSERT before it reaches Route53
+        mocker.patch("recordset_diff.fetch_current_records", return_value={})
+
+        with fake_aws(route53):
+            message_processing.process_message(_event(create_recordset_event, ["a.api.test.io."]), context)
+
+        assert [call["error"] for call in route53.calls("ChangeResourceRecordSets")] == ["InvalidChangeBatch", None]
+        [record] = route53.zones[zone_id].values()
+        assert record["AliasTarget"]["DNSName"] == "internal-event-compaction-nlb.us-east-1.elb.amazonaws.com"
+
+    def test_list_paginates_in_route53_order(self, monkeypatch):
+        """Test list_resource_record_sets pages through the zone in reversed label order."""
+        monkeypatch.setattr(recordset_diff, "LIST_PAGE_SIZE", "2")
+        route53 = FakeRoute53()
+        zone_id = route53.create_hosted_zone("test.io")
+        names = ["b.test.io.", "a.b.test.io.", "z.test.io.", "a.test.io.", "c.a.test.io."]
+        route53.put_record_sets(zone_id, [_alias(name) for name in names])
+
+        listed = [recordset["Name"] for recordset in recordset_diff.iter_record_sets(route53, zone_id)]
+
+        assert listed == ["a.test.io.", "c.a.test.io.", "b.test.io.", "a.b.test.io.", "z.test.io."]
+        assert len(route53.calls("ListResourceRecordSets")) == 3
+
+    def test_list_escapes_and_orders_on_the_trailing_dot(self):
+        """Test the wildcard is listed as \\052 and api-v2 sorts before api, the way Route53 documents it."""
+        route53 = FakeRoute53()
+        zone_id = route53.create_hosted_zone("test.io")
+        names = ["a.api.test.io.", "api.test.io.", "*.api.test.io.", "api-v2.test.io."]
+        route53.put_record_sets(zone_id, [_alias(name) for name in names])
+
+        first_page = route53.list_resource_record_sets(HostedZoneId=zone_id, MaxItems="1")
+        rest = route53.list_resource_record_sets(HostedZoneId=zone_id, StartRecordName="api.test.io.")
+        listed = [recordset["Name"] for recordset in first_page["ResourceRecordSets"] + rest["ResourceRecordSets"]]
+
+        assert listed == ["api-v2.test.io.", "api.test.io.", "\\052.api.test.io.", "a.api.test.io."]
+
+    def test_wildcard_and_hyphenated_deletes_applied(self, context, create_recordset_event, monkeypatch):
+        """Test DELETEs of a wildcard and of a name sorting before its sibling reach the zone through the diff."""
+        monkeypatch.setattr(recordset_diff, "LIST_PAGE_SIZE", "1")
+        route53 = FakeRoute53()
+        zone_id = route53.create_hosted_zone("api.test.io")
+        monkeypatch.setenv("DEST_HOSTED_ZONE_ID", zone_id)
+        names = ["*.api.test.io.", "v2-x.api.test.io.", "v2.api.test.io."]
+        with fake_aws(route53):
+            message_processing.process_message(_event(create_recordset_event, names + ["a.v2.api.test.io."]), context)
+            delete_event = _event(create_recordset_event, names, action="DELETE")
+            delete_event["detail"]["eventID"] = "delete-wildcard"
+            message_processing.process_message(delete_event, context)
+
+        assert [recordset["Name"] for recordset in route53.zones[zone_id].values()] == ["a.v2.api.test.io."]
@@ -0,0 +1,59 @@
+import copy
+
+import change_poller
+import idempotency
+import message_processing
+from handler import lambda_handler, sqs_handler
+
+from .conftest import sqs_event
+
+REPLAYS = 25
+
+
+class TestIdempotency:
+    """Test class for the idempotency store."""
+    def test_replayed_event_written_once(self, context, mocker, route53_client, sts_client, idempotency_table,
+                                         create_recordset_event):
+        """Test redelivering the same event only writes to Route53 the first time."""
+        batch_spy = mocker.spy(message_processing, "change_resource_record_sets_batch")
+        wait_spy = mocker.spy(change_poller, "poll_changes")
+
+        responses = [lambda_handler(copy.deepcopy(create_recordset_event), context) for _ in range(REPLAYS)]
+
+        assert all(response == {"test.api.test.io.": True} for response in responses)
+        assert batch_spy.call_count == 1
+        assert wait_spy.call_count == 1
+
+    def test_replayed_event_written_once_across_containers(self, context, mocker, route53_client, sts_client,
+                                                           idempotency_table, create_recordset_event):
+        """Test the DynamoDB table short-circuits redeliveries landing on a cold container."""
+        batch_spy = mocker.spy(message_processing, "change_resource_record_sets_batch")
+
+        for _ in range(REPLAYS):
+            idempotency.clear_cache()
+            assert lambda_handler(copy.deepcopy(create_recordset_event), context) == {"test.api.test.io.": True}
+
+        assert batch_spy.call_count == 1
+
+    def test_replayed_sqs_message_written_once(self, context, mocker, route53_client, sts_client,
+                                               idempotency_table, create_recordset_event):
+        """Test redelivered SQS messages of an applied event do not write again."""
+        batch_spy = mocker.spy(message_processing, "change_resource_record_sets_batch")
+
+        for _ in range(REPLAYS):
+            assert sqs_handler(sqs_event(create_recordset_event), context) == {"batchItemFailures": []}
+
+        assert batch_spy.call_count == 1
+
+    def test_expired_status_is_applied_again(self, context, mocker, route53_client, sts_client, idempotency_table,
+                                             create_recordset_event):
+        """Test a change is applied again once its idempotency record expired."""
+        apply_spy = mocker.spy(message_processing, "apply_changes")
+        lambda_handler(copy.deepcopy(create_recordset_event), context)
+        mocker.patch("idempotency.IDEMPOTENCY_TTL_SECONDS", -1)
+        idempotency.save_status(idempotency.idempotency_key(create_recordset_event, 0), True)
+
+        lambda_handler(copy.deepcopy(create_recordset_event), context)
+
+        assert apply_spy.call_count == 2
+        assert len(apply_spy.call_args.kwargs["changes_by_zone"]) == 1
@@ -0,0 +1,87 @@
+import copy
+import os
+
+import change_poller
+import message_processing
+
+
+def _alias_change(name: str, action: str = "CREATE") -> dict:
+    return {
+        "action": action,
+        "resourceRecordSet": {
+            "name": name,
+            "type": "A",
+            "aliasTarget": {
+                "hostedZoneId": "Z26RNL4JYFTOTI",
+                "dNSName": "internal-event-compaction-nlb.us-east-1.elb.amazonaws.com",
+                "evaluateTargetHealth": False,
+            },
+        },
+    }
+
+
+class TestMessageProcessing:
+    """Test class for the batched Route53 ChangeBatch path."""
+    def test_all_changes_submitted_as_one_change_batch(self, context, mocker, route53_client, sts_client,
+                                                       create_recordset_event):
+        """Test every change of an event is written with a single request and a single wait."""
+        event = copy.deepcopy(create_recordset_event)
+        event["detail"]["requestParameters"]["changeBatch"]["changes"] = [
+            _alias_change(f"test{i}.api.test.io.") for i in range(20)
+        ]
+        batch_spy = mocker.spy(message_processing, "change_resource_record_sets_batch")
+        wait_spy = mocker.spy(change_poller, "poll_changes")
+
+        response = message_processing.process_message(event, context)
+
+        assert len(response) == 20
+        assert all(response.values())
+        assert batch_spy.call_count == 1
+        assert wait_spy.call_count == 1
+        records = route53_client.list_resource_record_sets(HostedZoneId=os.environ["DEST_HOSTED_ZONE_ID"])
+        assert len([r for r in records["ResourceRecordSets"] if r["Type"] == "A"]) == 20
+
+    def test_change_batch_split_at_route53_limits(self, mocker):
+        """Test a ChangeBatch is split once the ResourceRecord element limit is reached."""
+        mocker.patch("message_processing.ROUTE53_MAX_BATCH_RECORDS", 4)
+        changes = [
+            message_processing.build_alias_change("UPSERT", f"test{i}.api.test.io.", "A", "Z26RNL4JYFTOTI",
+                                                  "lb.amazonaws.com") for i in range(5)
+        ]
+        batches = message_processing.split_change_batch(changes)
+        assert [len(batch) for batch in batches] == [2, 2, 1]
+        assert [change for batch in batches for change in batch] == changes
+
+    def test_invalid_change_batch_bisected_to_offending_record(self, context, mocker, route53_client, sts_client,
+                                                               create_recordset_event):
+        """Test a rejected ChangeBatch is bisected and only the offending record hits the single record path."""
+        event = copy.deepcopy(create_recordset_event)
+        event["detail"]["requestParameters"]["changeBatch"]["changes"] = [
+            _alias_change(f"test{i}.api.test.io.") for i in range(4)
+        ]
+        real_batch = message_processing.change_resource_record_sets_batch
+
+        def reject_existing(route53_client, changes, hosted_zone_id):
+            if any(change["ResourceRecordSet"]["Name"] == "test3.api.test.io." and change["Action"] == "CREATE"
+                   for change in changes):
+                raise route53_client.exceptions.InvalidChangeBatch(
+                    operation_name="change_resource_record_sets",
+                    error_response={
+                        "Error": {
+                            "Message":
+                            "[Tried to create resource record set [name='test3.api.test.io.', type='A'] but it already exists]"
+                        }
+                    },
+                )
+            return real_batch(route53_client=route53_client, changes=changes, hosted_zone_id=hosted_zone_id)
+
+        mocker.patch("message_processing.change_resource_record_sets_batch", side_effect=reject_existing)
+        modify_spy = mocker.spy(message_processing, "modify_route53_change_recordset")
+
+        response = message_processing.process_message(event, context)
+
+        assert all(response.values())
+        assert [call.kwargs["recordset_name"] for call in modify_spy.call_args_list] == [
+            "test2.api.test.io.", "test3.api.test.io.", "test3.api.test.io."
+        ]
+        assert modify_spy.call_args_list[-1].kwargs["change_action"] == message_processing.RecordSetChangeAction.upsert
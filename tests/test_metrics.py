@@ -0,0 +1,51 @@
+import json
+import os
+
+import metrics
+from handler import lambda_handler
+
+
+def _emf_lines(output: str) -> list:
+    return [json.loads(line) for line in output.splitlines() if line.startswith('{"_aws"')]
+
+
+def _find(documents: list, name: str, **dimensions) -> dict:
+    for document in documents:
+        if name in document and all(document.get(key) == value for key, value in dimensions.items()):
+            return document
+    raise AssertionError(f"No {name} metric with {dimensions} in {documents}")
+
+
+class TestMetrics:
+    """Test class for the per-phase EMF metrics."""
+    def test_invocation_emits_phase_spans(self, context, capsys, route53_client, sts_client, create_recordset_event):
+        """Test an applied change emits STS, list, change and wait durations with the zone and action dimensions."""
+        lambda_handler(create_recordset_event, context)
+        documents = _emf_lines(capsys.readouterr().out)
+
+        zone = {"HostedZoneId": os.environ["DEST_HOSTED_ZONE_ID"]}
+        assert _find(documents, "StsDuration")["StsDuration"] > 0
+        assert _find(documents, "ListDuration", **zone)
+        assert _find(documents, "ChangeDuration", **zone)
+        assert _find(documents, "WaitDuration", **zone)
+        assert _find(documents, "Changes", Action="CREATE", **zone)["Changes"] == 1
+        assert _find(documents, "Route53Calls", Operation="change_resource_record_sets")["Route53Calls"] == 1
+        change_document = _find(documents, "ChangeDuration", **zone)
+        assert change_document["_aws"]["CloudWatchMetrics"][0]["Dimensions"] == [["HostedZoneId"]]
+
+    def test_filtered_changes_counted_as_skipped(self, context, capsys, regional_alb_recordset_event):
+        """Test a filtered event emits only the skipped change count."""
+        lambda_handler(regional_alb_recordset_event, context)
+        documents = _emf_lines(capsys.readouterr().out)
+
+        assert len(documents) == 1
+        assert _find(documents, "SkippedChanges", Action="CREATE", Reason="Filtered")["SkippedChanges"] == 1
+
+    def test_values_split_at_emf_limit(self, capsys):
+        """Test more than 100 values of a metric are split over several EMF documents."""
+        for value in range(250):
+            metrics.record("ChangeDuration", value, unit="Milliseconds", dimensions={"HostedZoneId": "Z1"})
+        metrics.flush()
+        documents = _emf_lines(capsys.readouterr().out)
+
+        assert [len(document["ChangeDuration"]) for document in documents] == [100, 100, 50]
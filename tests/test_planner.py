@@ -0,0 +1,69 @@
+import json
+import os
+
+import pytest
+
+import message_processing
+import planner
+import record_versions
+import recordset_diff
+from handler import lambda_handler
+
+
+def _dest_names(route53_client) -> list:
+    records = route53_client.list_resource_record_sets(
+        HostedZoneId=os.environ["DEST_HOSTED_ZONE_ID"])["ResourceRecordSets"]
+    return [record["Name"] for record in records]
+
+
+class TestPlanner:
+    """Test class for the dry-run planner."""
+    def test_plan_mode_writes_nothing(self, context, monkeypatch, mocker, route53_client, sts_client,
+                                      create_recordset_event):
+        """Test PLAN_MODE returns the change plan and its estimates without a write or a version claim."""
+        monkeypatch.setenv("PLAN_MODE", "true")
+        batch_spy = mocker.spy(message_processing, "change_resource_record_sets_batch")
+        claim_spy = mocker.spy(record_versions, "claim")
+
+        result = lambda_handler(create_recordset_event, context)
+
+        assert result["status"] == {"test.api.test.io.": True}
+        assert [(change["Action"], change["ResourceRecordSet"]["Name"])
+                for change in result["changes"][os.environ["DEST_HOSTED_ZONE_ID"]]] == [("CREATE", "test.api.test.io.")]
+        assert result["api_calls"]["ListResourceRecordSets"] == 1
+        assert result["api_calls"]["ChangeResourceRecordSets"] == result["batches"] == 1
+        assert result["estimated_seconds"]["total"] > result["estimated_seconds"]["wait"] > 0
+        assert batch_spy.call_count == claim_spy.call_count == 0
+        assert "test.api.test.io." not in _dest_names(route53_client)
+
+    def test_replay_diffed_against_planned_state(self, context, mocker, route53_client, sts_client, tmp_path,
+                                                 create_recordset_event, delete_recordset_event):
+        """Test later events of a replay see the earlier planned changes and the zone snapshot is reused."""
+        events_path = tmp_path / "events.jsonl"
+        events = (create_recordset_event, delete_recordset_event)
+        events_path.write_text("\n".join(json.dumps(event) for event in events))
+        snapshot_dir = str(tmp_path / "snapshots")
+        with open(events_path) as events_file:
+            result = planner.plan_events(planner.iter_events(events_file), snapshot_dir=snapshot_dir)
+
+        assert result["totals"]["events"] == 2
+        assert result["totals"]["changes"] == {"CREATE": 1, "UPSERT": 0, "DELETE": 1}
+        assert os.path.exists(os.path.join(snapshot_dir, f"{os.environ['DEST_HOSTED_ZONE_ID']}.json"))
+
+        read_spy = mocker.spy(recordset_diff, "iter_record_sets")
+        with open(events_path) as events_file:
+            replayed = planner.plan_events(planner.iter_events(events_file), snapshot_dir=snapshot_dir,
+                                           change_limit=1)
+        assert read_spy.call_count == 0
+        assert replayed["totals"] == result["totals"]
+        assert sum(len(changes) for event in replayed["events"] for changes in event["changes"].values()) == 1
+
+    def test_wait_follows_the_poll_backoff(self, monkeypatch):
+        """Test the wait estimate is the first poll after the propagation time, each poll reading every batch."""
+        monkeypatch.setattr(planner, "PLAN_PROPAGATION_SECONDS", 10.0)
+        monkeypatch.setattr(planner.change_poller, "CHANGE_POLL_INITIAL_DELAY_SECONDS", 2.0)
+        monkeypatch.setattr(planner.change_poller, "CHANGE_POLL_BACKOFF", 2.0)
+
+        # polls after 2, 6 and 14 seconds
+        assert planner.estimate_wait(3) == (pytest.approx(14.0), 9)
+        assert planner.estimate_wait(0) == (0.0, 0)
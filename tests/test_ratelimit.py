@@ -0,0 +1,99 @@
+import time
+
+import pytest
+from botocore.exceptions import ClientError, EndpointConnectionError, ReadTimeoutError
+
+import message_processing
+import ratelimit
+
+
+def _client_error(code: str) -> ClientError:
+    return ClientError(error_response={"Error": {"Code": code, "Message": code}}, operation_name="ChangeResourceRecordSets")
+
+
+class TestRateLimit:
+    """Test class for the Route53 token bucket and backoff."""
+    def test_throttling_retried_with_backoff(self, mocker):
+        """Test throttling errors are retried and counted."""
+        sleep = mocker.patch("ratelimit._sleep")
+        api_method = mocker.Mock(side_effect=[_client_error("Throttling"), _client_error("PriorRequestNotComplete"), "ok"])
+
+        assert ratelimit.call(api_method, Id="1") == "ok"
+        assert api_method.call_count == 3
+        assert sleep.call_count == 2
+        stats = ratelimit.get_stats()
+        assert (stats["calls"], stats["throttles"], stats["retries"]) == (3, 2, 2)
+
+    def test_other_errors_are_not_retried(self, mocker):
+        """Test errors other than throttling raise straight away."""
+        api_method = mocker.Mock(side_effect=_client_error("InvalidChangeBatch"))
+        with pytest.raises(ClientError):
+            ratelimit.call(api_method)
+        assert api_method.call_count == 1
+
+    def test_server_errors_retried_without_slowing_down(self, mocker):
+        """Test a 5xx error is retried, as botocore no longer does, without halving the rate."""
+        mocker.patch("ratelimit._sleep")
+        server_error = _client_error("InternalFailure")
+        server_error.response["ResponseMetadata"] = {"HTTPStatusCode": 500}
+        api_method = mocker.Mock(side_effect=[server_error, "ok"])
+        rate = ratelimit.route53_bucket.rate
+
+        assert ratelimit.call(api_method) == "ok"
+        assert ratelimit.route53_bucket.rate == rate
+        assert (ratelimit.get_stats()["throttles"], ratelimit.get_stats()["retries"]) == (0, 1)
+
+    def test_connection_errors_retried_without_slowing_down(self, mocker):
+        """Test connection errors and read timeouts are retried, as botocore no longer does, without halving the rate."""
+        mocker.patch("ratelimit._sleep")
+        api_method = mocker.Mock(side_effect=[
+            EndpointConnectionError(endpoint_url="https://route53.amazonaws.com"),
+            ReadTimeoutError(endpoint_url="https://route53.amazonaws.com"), "ok"
+        ])
+        rate = ratelimit.route53_bucket.rate
+
+        assert ratelimit.call(api_method) == "ok"
+        assert ratelimit.route53_bucket.rate == rate
+        assert (ratelimit.get_stats()["throttles"], ratelimit.get_stats()["retries"]) == (0, 2)
+
+    def test_gives_up_after_max_retries(self, mocker):
+        """Test a call throttled on every attempt raises after ROUTE53_MAX_RETRIES retries."""
+        mocker.patch("ratelimit._sleep")
+        mocker.patch("ratelimit.ROUTE53_MAX_RETRIES", 3)
+        api_method = mocker.Mock(side_effect=_client_error("Throttling"))
+        with pytest.raises(ClientError):
+            ratelimit.call(api_method)
+        assert api_method.call_count == 4
+
+    def test_token_bucket_limits_rate_and_adapts(self):
+        """Test the bucket spaces calls at its rate and halves the rate when throttled."""
+        bucket = ratelimit.TokenBucket(rate=50, capacity=1)
+        start = time.monotonic()
+        for _ in range(11):
+            bucket.acquire()
+        assert time.monotonic() - start >= 0.18
+        bucket.throttled()
+        assert bucket.rate == 25
+        bucket.succeeded()
+        assert bucket.rate == 27.5
+
+    def test_process_message_survives_prior_request_not_complete(self, context, mocker, route53_client, sts_client,
+                                                                 create_recordset_event):
+        """Test a PriorRequestNotComplete from Route53 degrades into a retry instead of failing the event."""
+        mocker.patch("ratelimit._sleep")
+        real_change = route53_client.change_resource_record_sets
+        responses = iter([_client_error("PriorRequestNotComplete")])
+
+        def change_resource_record_sets(**kwargs):
+            error = next(responses, None)
+            if error is not None:
+                raise error
+            return real_change(**kwargs)
+
+        mocker.patch.object(route53_client, "change_resource_record_sets", side_effect=change_resource_record_sets)
+        mocker.patch("sts.get_route53_client", return_value=route53_client)
+
+        response = message_processing.process_message(create_recordset_event, context)
+
+        assert response == {"test.api.test.io.": True}
+        assert ratelimit.get_stats()["throttles"] == 1
@@ -0,0 +1,149 @@
+import os
+import uuid
+
+import pytest
+
+import message_processing
+import reconcile
+from handler import reconcile_handler
+
+from .fake_route53 import FakeRoute53, fake_aws
+
+
+def _create_zone(route53_client, records) -> str:
+    hosted_zone_id = route53_client.create_hosted_zone(
+        Name="api.test.io", CallerReference=str(uuid.uuid4()))["HostedZone"]["Id"].replace("/hostedzone/", "")
+    if records:
+        route53_client.change_resource_record_sets(HostedZoneId=hosted_zone_id, ChangeBatch={"Changes": records})
+    return hosted_zone_id
+
+
+def _alias(name: str, dns_name: str = "lb.amazonaws.com") -> dict:
+    return message_processing.build_alias_change("CREATE", name, "A", "Z26RNL4JYFTOTI", dns_name)
+
+
+def _dest_records(route53_client) -> dict:
+    records = route53_client.list_resource_record_sets(HostedZoneId=os.environ["DEST_HOSTED_ZONE_ID"])
+    return {r["Name"]: r["AliasTarget"]["DNSName"] for r in records["ResourceRecordSets"] if "AliasTarget" in r}
+
+
+class TestReconcile:
+    """Test class for the full-zone reconciliation."""
+    def test_reconcile_streams_sources_into_destination(self, context, route53_client, sts_client):
+        """Test missing and drifted records are written and orphans are kept by default."""
+        route53_client.change_resource_record_sets(HostedZoneId=os.environ["DEST_HOSTED_ZONE_ID"],
+                                                   ChangeBatch={
+                                                       "Changes": [
+                                                           _alias("same.api.test.io."),
+                                                           _alias("drifted.api.test.io.", "old-lb.amazonaws.com"),
+                                                           _alias("orphan.api.test.io."),
+                                                       ]
+                                                   })
+        first_source = _create_zone(route53_client, [_alias("same.api.test.io."), _alias("drifted.api.test.io.")])
+        second_source = _create_zone(route53_client, [_alias("new.api.test.io."), _alias("a.new.api.test.io.")])
+
+        result = reconcile_handler({"source_zones": [{"hosted_zone_id": first_source},
+                                                     {"hosted_zone_id": second_source}]}, context)
+
+        assert result["counts"] == {"CREATE": 2, "UPSERT": 1, "DELETE": 0}
+        assert _dest_records(route53_client) == {
+            "same.api.test.io.": "lb.amazonaws.com",
+            "drifted.api.test.io.": "lb.amazonaws.com",
+            "orphan.api.test.io.": "lb.amazonaws.com",
+            "new.api.test.io.": "lb.amazonaws.com",
+            "a.new.api.test.io.": "lb.amazonaws.com",
+        }
+
+    def test_reconcile_dry_run_plans_without_writing(self, context, mocker, route53_client, sts_client):
+        """Test a dry run returns the plan and never writes."""
+        route53_client.change_resource_record_sets(HostedZoneId=os.environ["DEST_HOSTED_ZONE_ID"],
+                                                   ChangeBatch={"Changes": [_alias("orphan.api.test.io.")]})
+        source = _create_zone(route53_client, [_alias("new.api.test.io.")])
+        batch_spy = mocker.spy(message_processing, "change_resource_record_sets_batch")
+
+        result = reconcile.reconcile([{"hosted_zone_id": source}],
+                                     os.environ["DEST_HOSTED_ZONE_ID"],
+                                     dry_run=True,
+                                     delete_orphans=True)
+
+        assert [(change["Action"], change["ResourceRecordSet"]["Name"]) for change in result["plan"]] == [
+            ("CREATE", "new.api.test.io."),
+            ("DELETE", "orphan.api.test.io."),
+        ]
+        assert batch_spy.call_count == 0
+
+    def test_reconcile_applies_process_message_filters(self, context, route53_client, sts_client):
+        """Test records outside the domain filter or with a routing policy are not reconciled."""
+        os.environ["COMPANY_DOMAIN_FILTER"] = "new.api.test.io"
+        latency = _alias("latency.new.api.test.io.")
+        latency["ResourceRecordSet"].update({"SetIdentifier": "us-east-1", "Region": "us-east-1"})
+        source = _create_zone(route53_client, [_alias("other.api.test.io."), _alias("new.api.test.io."), latency])
+        try:
+            result = reconcile.reconcile([{"hosted_zone_id": source}], os.environ["DEST_HOSTED_ZONE_ID"],
+                                         dry_run=True)
+        finally:
+            os.environ.pop("COMPANY_DOMAIN_FILTER")
+
+        assert [change["ResourceRecordSet"]["Name"] for change in result["plan"]] == ["new.api.test.io."]
+
+    def test_merge_diff_is_streaming(self):
+        """Test the merge diff consumes generators lazily in sorted order."""
+        def records(names):
+            for name in names:
+                recordset = _alias(name)["ResourceRecordSet"]
+                yield reconcile._record_key(recordset), recordset
+
+        changes = reconcile.merge_diff(records(f"r{i:05d}.api.test.io." for i in range(100000)),
+                                       records(f"r{i:05d}.api.test.io." for i in range(0, 100000, 2)))
+        first = next(changes)
+        assert (first["Action"], first["ResourceRecordSet"]["Name"]) == ("CREATE", "r00001.api.test.io.")
+
+    def test_reconcile_in_route53_order(self, context, monkeypatch):
+        """Test hyphenated siblings and wildcards in the Route53 listing order yield no spurious change or delete."""
+        route53 = FakeRoute53()
+        source = route53.create_hosted_zone("api.test.io")
+        dest = route53.create_hosted_zone("api.test.io")
+        monkeypatch.setenv("DEST_HOSTED_ZONE_ID", dest)
+        names = ["*.api.test.io.", "v2-x.api.test.io.", "v2.api.test.io.", "a.v2.api.test.io.", "v2x.api.test.io."]
+        route53.put_record_sets(source, [_alias(name)["ResourceRecordSet"] for name in names])
+        route53.put_record_sets(dest, [_alias(name)["ResourceRecordSet"] for name in names[:3] + ["orphan.api.test.io."]])
+
+        with fake_aws(route53):
+            result = reconcile.reconcile([{"hosted_zone_id": source, "role_arn": "arn:aws:iam::222222222222:role/src"}],
+                                         dest, dry_run=True, delete_orphans=True)
+
+        assert [(change["Action"], change["ResourceRecordSet"]["Name"]) for change in result["plan"]] == [
+            ("DELETE", "orphan.api.test.io."),
+            ("CREATE", "a.v2.api.test.io."),
+            ("CREATE", "v2x.api.test.io."),
+        ]
+
+    def test_orphan_found_in_a_source_zone_kept(self, context, mocker, monkeypatch):
+        """Test an orphan the merge reports is not deleted when an exact read finds it in a source zone."""
+        route53 = FakeRoute53()
+        source = route53.create_hosted_zone("api.test.io")
+        dest = route53.create_hosted_zone("api.test.io")
+        monkeypatch.setenv("DEST_HOSTED_ZONE_ID", dest)
+        route53.put_record_sets(source, [_alias("kept.api.test.io.")["ResourceRecordSet"]])
+        route53.put_record_sets(dest, [_alias("kept.api.test.io.")["ResourceRecordSet"]])
+        mocker.patch.object(reconcile, "merge_diff", return_value=iter([{
+            "Action": "DELETE",
+            "ResourceRecordSet": _alias("kept.api.test.io.")["ResourceRecordSet"]
+        }]))
+
+        with fake_aws(route53):
+            result = reconcile.reconcile([{"hosted_zone_id": source, "role_arn": "arn:aws:iam::222222222222:role/src"}],
+                                         dest, delete_orphans=True)
+
+        assert result["counts"]["DELETE"] == 0
+        assert len(route53.zones[dest]) == 1
+
+    def test_listing_out_of_order_stops_the_merge(self, mocker):
+        """Test a zone listed in another order than the merge key stops instead of yielding spurious changes."""
+        mocker.patch.object(reconcile.recordset_diff, "iter_record_sets", return_value=iter([
+            _alias("v2.api.test.io.")["ResourceRecordSet"],
+            _alias("v2-x.api.test.io.")["ResourceRecordSet"],
+        ]))
+
+        with pytest.raises(Exception, match="out of the order"):
+            list(reconcile._keyed_records(None, "Z1", "Z1", None))
@@ -0,0 +1,101 @@
+import copy
+import os
+
+import pytest
+
+import message_processing
+import record_change
+
+
+def _cloudtrail_change(action: str, **recordset) -> dict:
+    return {"action": action, "resourceRecordSet": recordset}
+
+
+def _dest_records(route53_client) -> dict:
+    records = route53_client.list_resource_record_sets(
+        HostedZoneId=os.environ["DEST_HOSTED_ZONE_ID"])["ResourceRecordSets"]
+    return {(record["Name"], record["Type"], record.get("SetIdentifier")): record for record in records}
+
+
+class TestRecordChange:
+    """Test class for the record set change model."""
+    def test_cloudtrail_converted_to_api(self):
+        """Test value and weighted records convert to the ChangeBatch shape and back without loss."""
+        weighted = record_change.RecordChange.from_cloudtrail(
+            _cloudtrail_change("UPSERT", name="www.api.test.io.", type="CNAME", tTL=60, setIdentifier="blue",
+                               weight=10, resourceRecords=[{"value": "blue.api.test.io"}], healthCheckId="hc-1"))
+
+        change = weighted.to_api()
+
+        assert change == {
+            "Action": "UPSERT",
+            "ResourceRecordSet": {
+                "Name": "www.api.test.io.",
+                "Type": "CNAME",
+                "SetIdentifier": "blue",
+                "Weight": 10,
+                "TTL": 60,
+                "ResourceRecords": [{"Value": "blue.api.test.io"}],
+            },
+        }
+        assert record_change.RecordChange.from_api(change).to_api() == change
+        assert weighted.to_api() is not change
+        assert weighted.record_set.key() == ("www.api.test.io", "CNAME", "blue")
+
+    def test_simple_set_identifier_written_as_plain_record(self):
+        """Test the Simple setIdentifier keeps being written without a routing policy."""
+        record_set = record_change.RecordSet.from_cloudtrail({
+            "name": "test.api.test.io.",
+            "type": "A",
+            "setIdentifier": "Simple",
+            "region": "us-east-1",
+            "aliasTarget": {"hostedZoneId": "Z26RNL4JYFTOTI", "dNSName": "lb.amazonaws.com", "evaluateTargetHealth": True},
+        })
+
+        assert record_set.to_api() == {
+            "Name": "test.api.test.io.",
+            "Type": "A",
+            "AliasTarget": {"HostedZoneId": "Z26RNL4JYFTOTI", "DNSName": "lb.amazonaws.com", "EvaluateTargetHealth": True},
+        }
+
+    @pytest.mark.parametrize("recordset", [
+        {"name": "geo.api.test.io.", "type": "A", "setIdentifier": "eu", "geoLocation": {"continentCode": "EU"},
+         "resourceRecords": [{"value": "10.0.0.1"}], "tTL": 60},
+        {"name": "api.test.io.", "type": "NS", "resourceRecords": [{"value": "ns-1.awsdns-01.org"}], "tTL": 172800},
+    ])
+    def test_unsupported_records_rejected(self, recordset):
+        """Test routing policies the model does not carry and the apex records of a zone are not converted."""
+        with pytest.raises(record_change.UnsupportedRecordSet):
+            record_change.RecordSet.from_cloudtrail(recordset)
+
+    def test_value_record_synced(self, context, route53_client, sts_client, create_recordset_event):
+        """Test a CNAME change without an alias target is created, updated and deleted in the destination."""
+        event_changes = create_recordset_event["detail"]["requestParameters"]["changeBatch"]["changes"]
+        event_changes[0] = _cloudtrail_change("CREATE", name="cname.api.test.io.", type="CNAME", tTL=300,
+                                              resourceRecords=[{"value": "origin.example.com"}])
+
+        assert message_processing.process_message(copy.deepcopy(create_recordset_event), context) == {
+            "cname.api.test.io.": True
+        }
+        record = _dest_records(route53_client)[("cname.api.test.io.", "CNAME", None)]
+        assert (record["TTL"], record["ResourceRecords"]) == (300, [{"Value": "origin.example.com"}])
+
+        event_changes[0]["action"] = "DELETE"
+        event_changes[0]["resourceRecordSet"]["tTL"] = 60
+        create_recordset_event["detail"]["eventID"] = "delete-cname"
+        create_recordset_event["detail"]["eventTime"] = "2099-01-01T00:00:00Z"
+        assert message_processing.process_message(create_recordset_event, context) == {"cname.api.test.io.": True}
+        assert ("cname.api.test.io.", "CNAME", None) not in _dest_records(route53_client)
+
+    def test_latency_record_synced_when_enabled(self, context, monkeypatch, route53_client, sts_client,
+                                                regional_alb_recordset_event):
+        """Test a regional ALB latency record is synced with its set identifier and region, not its health check."""
+        monkeypatch.setenv("SYNC_ROUTING_POLICIES", "true")
+
+        response = message_processing.process_message(regional_alb_recordset_event, context)
+
+        assert response == {"test.api.test.io.": True}
+        record = _dest_records(route53_client)[("test.api.test.io.", "A", "alb-us-east-1")]
+        assert record["Region"] == "us-east-1"
+        assert record["AliasTarget"]["EvaluateTargetHealth"] is True
+        assert "HealthCheckId" not in record
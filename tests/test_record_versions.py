@@ -0,0 +1,57 @@
+import copy
+import json
+import os
+
+import message_processing
+import metrics
+import record_versions
+
+
+class TestRecordVersions:
+    """Test class for the last-writer-wins record versions."""
+    def test_delayed_create_after_delete_discarded(self, context, mocker, capsys, route53_client, sts_client,
+                                                   create_recordset_event, delete_recordset_event):
+        """Test a CREATE delivered after the DELETE that followed it makes no Route53 call."""
+        message_processing.process_message(copy.deepcopy(delete_recordset_event), context)
+        record_spy = mocker.spy(message_processing, "change_resource_record_sets")
+        batch_spy = mocker.spy(message_processing, "change_resource_record_sets_batch")
+        list_spy = mocker.spy(message_processing.recordset_diff, "fetch_current_records")
+        metrics.clear()
+        capsys.readouterr()
+
+        response = message_processing.process_message(copy.deepcopy(create_recordset_event), context)
+
+        assert response == {"test.api.test.io.": False}
+        assert record_spy.call_count == batch_spy.call_count == list_spy.call_count == 0
+        metrics.flush()
+        [document] = [json.loads(line) for line in capsys.readouterr().out.splitlines() if line.startswith('{"_aws"')]
+        assert (document["Action"], document["Reason"], document["SkippedChanges"]) == ("CREATE", "Stale", 1)
+
+    def test_versions_shared_through_table(self, record_versions_table, mocker):
+        """Test a later version claimed by another container rejects an earlier one, and the cache answers again."""
+        newer = record_versions.change_version({"detail": {"eventTime": "2022-10-31T18:08:37Z", "eventID": "b"}})
+        older = record_versions.change_version({"detail": {"eventTime": "2022-10-31T18:04:08Z", "eventID": "a"}})
+        assert record_versions.claim("ZONE", "a.api.test.io.", "A", newer)
+        record_versions.clear_cache()
+
+        assert not record_versions.claim("ZONE", "A.api.test.io", "A", older)
+        put_spy = mocker.spy(record_versions.get_versions_table().meta.client, "put_item")
+        assert not record_versions.claim("ZONE", "a.api.test.io.", "A", older)
+        assert record_versions.claim("ZONE", "a.api.test.io.", "A", newer)
+        assert record_versions.claim("ZONE", "a.api.test.io.", "AAAA", older)
+        assert put_spy.call_count == 1
+
+    def test_changes_in_the_same_second_applied_in_order(self, context, route53_client, sts_client,
+                                                         create_recordset_event, delete_recordset_event):
+        """Test a CREATE made in the same second as the DELETE before it is applied, whatever their eventIDs."""
+        for event, event_id in ((delete_recordset_event, "ffffffff"), (create_recordset_event, "00000000")):
+            event["detail"]["eventTime"] = "2099-01-01T00:00:00Z"
+            event["detail"]["eventID"] = event_id
+        message_processing.process_message(delete_recordset_event, context)
+
+        response = message_processing.process_message(create_recordset_event, context)
+
+        assert response == {"test.api.test.io.": True}
+        records = route53_client.list_resource_record_sets(
+            HostedZoneId=os.environ["DEST_HOSTED_ZONE_ID"])["ResourceRecordSets"]
+        assert "test.api.test.io." in [record["Name"] for record in records]
@@ -0,0 +1,201 @@
+import copy
+import os
+
+import change_poller
+import message_processing
+import record_change
+import recordset_diff
+
+from .fake_route53 import FakeRoute53
+
+
+def _alias_change(name: str, action: str = "CREATE", dns_name: str = "lb.amazonaws.com",
+                  evaluate_target_health: bool = False) -> dict:
+    return message_processing.build_alias_change(action, name, "A", "Z26RNL4JYFTOTI", dns_name,
+                                                 evaluate_target_health)
+
+
+def _create_records(route53_client, changes):
+    route53_client.change_resource_record_sets(HostedZoneId=os.environ["DEST_HOSTED_ZONE_ID"],
+                                               ChangeBatch={"Changes": changes})
+
+
+class TestRecordsetDiff:
+    """Test class for the desired-state diff."""
+    def test_redeploy_of_up_to_date_records_skips_writes(self, context, mocker, route53_client, sts_client,
+                                                         create_recordset_event):
+        """Test an event for records that are already correct costs no write and no wait."""
+        message_processing.process_message(copy.deepcopy(create_recordset_event), context)
+        batch_spy = mocker.spy(message_processing, "change_resource_record_sets_batch")
+        wait_spy = mocker.spy(change_poller, "poll_changes")
+
+        response = message_processing.process_message(copy.deepcopy(create_recordset_event), context)
+
+        assert response == {"test.api.test.io.": True}
+        assert batch_spy.call_count == 0
+        assert wait_spy.call_count == 0
+
+    def test_current_records_read_with_one_paginated_read(self, mocker, route53_client):
+        """Test all names of an event are read with a single list call."""
+        _create_records(route53_client, [_alias_change(f"test{i}.api.test.io.") for i in range(20)])
+        list_spy = mocker.spy(route53_client, "list_resource_record_sets")
+
+        current = recordset_diff.fetch_current_records(route53_client, os.environ["DEST_HOSTED_ZONE_ID"],
+                                                       [f"test{i}.api.test.io." for i in range(0, 20, 2)])
+
+        assert list_spy.call_count == 1
+        assert len(current) == 10
+
+    def test_deletes_of_absent_records_read_once(self, mocker, route53_client):
+        """Test a redelivered teardown whose records are already gone costs the one read and no write."""
+        _create_records(route53_client, [_alias_change(f"test{i}.api.test.io.") for i in range(3)])
+        list_spy = mocker.spy(route53_client, "list_resource_record_sets")
+        changes = [_alias_change(f"gone{i}.api.test.io.", action="DELETE") for i in range(5)]
+
+        minimal = recordset_diff.diff_changes(route53_client, {os.environ["DEST_HOSTED_ZONE_ID"]: changes})
+
+        assert minimal == {}
+        assert list_spy.call_count == 1
+
+    def test_sparse_names_skip_the_records_between(self, monkeypatch):
+        """Test the read jumps to the next wanted name instead of paging through the records in between."""
+        monkeypatch.setattr(recordset_diff, "LIST_PAGE_SIZE", "5")
+        route53 = FakeRoute53()
+        zone_id = route53.create_hosted_zone("api.test.io")
+        names = ["aaa.api.test.io.", "zzz.api.test.io."] + [f"m{i:02d}.api.test.io." for i in range(40)]
+        route53.put_record_sets(zone_id, [{
+            "Name": name,
+            "Type": "A",
+            "AliasTarget": {"HostedZoneId": "Z26RNL4JYFTOTI", "DNSName": "lb.amazonaws.com", "EvaluateTargetHealth": False},
+        } for name in names])
+
+        current = recordset_diff.fetch_current_records(route53, zone_id,
+                                                       ["zzz.api.test.io.", "m07.api.test.io", "aaa.api.test.io."])
+
+        assert sorted(name for name, *_ in current) == ["aaa.api.test.io", "m07.api.test.io", "zzz.api.test.io"]
+        # paging through the range would take 9 reads
+        assert len(route53.calls("ListResourceRecordSets")) == 3
+
+    def test_delete_built_from_prefetched_records(self, context, mocker, route53_client, sts_client,
+                                                  delete_recordset_event):
+        """Test a DELETE of a drifted record is built from the diff read without its own list call."""
+        delete_change = delete_recordset_event["detail"]["requestParameters"]["changeBatch"]["changes"][0]
+        alias_target = delete_change["resourceRecordSet"]["aliasTarget"]
+        _create_records(route53_client, [
+            _alias_change("test.api.test.io.", dns_name=alias_target["dNSName"],
+                          evaluate_target_health=not alias_target["evaluateTargetHealth"])
+        ])
+        list_spy = mocker.spy(message_processing, "list_change_recordset")
+
+        response = message_processing.process_message(delete_recordset_event, context)
+
+        assert response == {"test.api.test.io.": True}
+        assert list_spy.call_count == 0
+        records = route53_client.list_resource_record_sets(
+            HostedZoneId=os.environ["DEST_HOSTED_ZONE_ID"])["ResourceRecordSets"]
+        assert "test.api.test.io." not in [record["Name"] for record in records]
+
+    def test_minimal_change_set(self, route53_client):
+        """Test changes are reduced to the minimal CREATE/UPSERT/DELETE set."""
+        _create_records(route53_client, [
+            _alias_change("same.api.test.io."),
+            _alias_change("moved.api.test.io."),
+            _alias_change("drifted.api.test.io.", evaluate_target_health=True),
+        ])
+        changes = [
+            _alias_change("same.api.test.io.", action="UPSERT"),
+            _alias_change("moved.api.test.io.", dns_name="other-lb.amazonaws.com"),
+            _alias_change("new.api.test.io.", action="UPSERT"),
+            _alias_change("drifted.api.test.io.", action="DELETE"),
+            _alias_change("missing.api.test.io.", action="DELETE"),
+            _alias_change("replaced.api.test.io.", action="DELETE"),
+            _alias_change("replaced.api.test.io.", dns_name="other-lb.amazonaws.com"),
+        ]
+
+        minimal = recordset_diff.diff_changes(route53_client, {os.environ["DEST_HOSTED_ZONE_ID"]: changes})
+
+        assert [(change["Action"], change["ResourceRecordSet"]["Name"])
+                for change in minimal[os.environ["DEST_HOSTED_ZONE_ID"]]] == [
+                    ("UPSERT", "moved.api.test.io."),
+                    ("CREATE", "new.api.test.io."),
+                    ("DELETE", "drifted.api.test.io."),
+                    ("CREATE", "replaced.api.test.io."),
+                ]
+        assert changes[3]["ResourceRecordSet"]["AliasTarget"]["EvaluateTargetHealth"] is True
+
+    def test_sort_key_reverses_labels(self):
+        """Test record names sort the way Route53 lists them."""
+        assert recordset_diff.route53_sort_key("www.Example.com.") == "com.example.www."
+        assert sorted(["b.api.test.io.", "api.test.io.", "a.b.api.test.io.", "api-v2.test.io."],
+                      key=recordset_diff.route53_sort_key) == [
+                          "api-v2.test.io.", "api.test.io.", "b.api.test.io.", "a.b.api.test.io."
+                      ]
+
+    def test_hyphenated_siblings_read_in_route53_order(self):
+        """Test a name Route53 lists before the name it extends, api-v2 before api, is not skipped past."""
+        # the order ListResourceRecordSets documents, reversed labels compared with their trailing dot
+        listed = ["test.io.", "api-v2.test.io.", "api.test.io.", "a.api.test.io.", "www.test.io."]
+        records = [_alias_change(name)["ResourceRecordSet"] for name in listed]
+
+        def list_page(HostedZoneId, StartRecordName, MaxItems, StartRecordType=None, StartRecordIdentifier=None):
+            start = listed.index(StartRecordName if StartRecordName.endswith(".") else f"{StartRecordName}.")
+            response = {"ResourceRecordSets": records[start:start + 1], "IsTruncated": start + 1 < len(records)}
+            if response["IsTruncated"]:
+                response.update(NextRecordName=listed[start + 1], NextRecordType="A")
+            return response
+
+        current = recordset_diff.fetch_current_records(None, "Z1", ["api.test.io.", "api-v2.test.io."],
+                                                       list_page=list_page)
+
+        assert sorted(name for name, *_ in current) == ["api-v2.test.io", "api.test.io"]
+
+    def test_wildcard_listed_escaped_is_deleted(self):
+        """Test a DELETE of *.api.test.io matches the record Route53 lists as \\052.api.test.io."""
+        listed = _alias_change("\\052.api.test.io.")["ResourceRecordSet"]
+        current = {recordset_diff.record_change.record_key(listed): listed}
+
+        minimal = recordset_diff.diff_zone_changes([_alias_change("*.api.test.io.", action="DELETE")], current)
+
+        assert record_change.normalize_name("\\052.API.test.io.") == "*.api.test.io"
+        assert [(change["Action"], record_change.normalize_name(change["ResourceRecordSet"]["Name"]))
+                for change in minimal] == [("DELETE", "*.api.test.io")]
+
+    def test_misordered_listing_read_ends(self):
+        """Test a listing whose next page sorts before the name it was read from does not make the read loop."""
+        class BackwardsRoute53:
+            """Lists the start name, then points back at a name sorting before it."""
+            calls = 0
+
+            def list_resource_record_sets(self, HostedZoneId, StartRecordName, MaxItems, **kwargs):
+                self.calls += 1
+                if StartRecordName == "a.api.test.io.":
+                    return {"ResourceRecordSets": [], "IsTruncated": False}
+                return {"ResourceRecordSets": [_alias_change(StartRecordName)["ResourceRecordSet"]],
+                        "IsTruncated": True, "NextRecordName": "a.api.test.io.", "NextRecordType": "A"}
+
+        route53 = BackwardsRoute53()
+
+        current = recordset_diff.fetch_current_records(route53, "Z1", ["z.api.test.io."])
+
+        assert list(current) == [("z.api.test.io", "A", None)]
+        assert route53.calls == 2
+
+    def test_delete_missing_from_the_index_listed(self):
+        """Test a DELETE whose record the prefetched index misses lists it, deleting it despite a drifted health flag."""
+        route53 = FakeRoute53()
+        zone_id = route53.create_hosted_zone("api.test.io")
+        route53.put_record_sets(zone_id, [_alias_change("drifted.api.test.io.",
+                                                        evaluate_target_health=True)["ResourceRecordSet"]])
+
+        message_processing.modify_route53_change_recordset(
+            route53_client=route53,
+            change_action=message_processing.RecordSetChangeAction.delete,
+            recordset_name="drifted.api.test.io.",
+            recordset_type="A",
+            alias_target_hosted_zone_id="Z26RNL4JYFTOTI",
+            alias_target_dns_name="lb.amazonaws.com",
+            hosted_zone_id=zone_id,
+            current_records={},
+        )
+
+        assert route53.zones[zone_id] == {}
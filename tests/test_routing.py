@@ -0,0 +1,177 @@
+import copy
+import json
+import os
+import uuid
+
+import pytest
+
+import message_processing
+import routing
+
+
+class TestRouting:
+    """Test class for the suffix trie routing."""
+    def test_longest_suffix_wins(self):
+        """Test the most specific suffix routes a name and labels are matched whole."""
+        table = routing.RoutingTable({
+            "test.io": routing.Destination("ZONE_TEST"),
+            "api.test.io.": routing.Destination("ZONE_API", "arn:aws:iam::1:role/api"),
+        })
+        assert table.route("svc.api.test.io.") == routing.Destination("ZONE_API", "arn:aws:iam::1:role/api")
+        assert table.route("API.TEST.IO") == routing.Destination("ZONE_API", "arn:aws:iam::1:role/api")
+        assert table.route("myapi.test.io.") == routing.Destination("ZONE_TEST")
+        assert table.route("test.api.other.io.") is None
+        assert table.role_arn("ZONE_API") == "arn:aws:iam::1:role/api"
+
+    def test_empty_suffix_routes_everything(self):
+        """Test the fallback route without COMPANY_DOMAIN_FILTER matches every name."""
+        table = routing.RoutingTable({"": routing.Destination("ZONE_ALL"), "api.test.io": routing.Destination("ZONE")})
+        assert table.route("anything.example.com.") == routing.Destination("ZONE_ALL")
+        assert table.route("a.api.test.io.") == routing.Destination("ZONE")
+
+    def test_zone_routed_with_two_roles_is_rejected(self):
+        """Test one destination zone cannot be written with two different roles."""
+        with pytest.raises(ValueError):
+            routing.RoutingTable({
+                "a.io": routing.Destination("ZONE", "arn:aws:iam::1:role/a"),
+                "b.io": routing.Destination("ZONE", "arn:aws:iam::1:role/b"),
+            })
+
+    def test_changes_grouped_per_destination_zone(self, context, mocker, route53_client, sts_client,
+                                                  create_recordset_event):
+        """Test one event routed to two zones gets one batched write per zone."""
+        other_zone = route53_client.create_hosted_zone(
+            Name="other.io", CallerReference=str(uuid.uuid4()))["HostedZone"]["Id"].replace("/hostedzone/", "")
+        os.environ["DOMAIN_ROUTES"] = json.dumps({
+            "api.test.io": os.environ["DEST_HOSTED_ZONE_ID"],
+            "other.io": {
+                "hosted_zone_id": other_zone
+            },
+        })
+        event = copy.deepcopy(create_recordset_event)
+        changes = event["detail"]["requestParameters"]["changeBatch"]["changes"]
+        for name in ["b.api.test.io.", "a.other.io.", "b.other.io.", "not.routed.io."]:
+            change = copy.deepcopy(changes[0])
+            change["resourceRecordSet"]["name"] = name
+            changes.append(change)
+        batch_spy = mocker.spy(message_processing, "change_resource_record_sets_batch")
+        try:
+            response = message_processing.process_message(event, context)
+        finally:
+            os.environ.pop("DOMAIN_ROUTES")
+
+        assert response == {
+            "test.api.test.io.": True,
+            "b.api.test.io.": True,
+            "a.other.io.": True,
+            "b.other.io.": True,
+            "not.routed.io.": False,
+        }
+        assert sorted(call.kwargs["hosted_zone_id"] for call in batch_spy.call_args_list) == sorted(
+            [os.environ["DEST_HOSTED_ZONE_ID"], other_zone])
+
+    def test_fan_out_mirrors_to_every_destination(self, context, mocker, route53_client, sts_client,
+                                                  create_recordset_event):
+        """Test a route listing several destinations writes the change to each zone through its own role."""
+        dr_zone = route53_client.create_hosted_zone(
+            Name="api.test.io", CallerReference=str(uuid.uuid4()))["HostedZone"]["Id"].replace("/hostedzone/", "")
+        os.environ["DOMAIN_ROUTES"] = json.dumps({
+            "api.test.io": [os.environ["DEST_HOSTED_ZONE_ID"], {
+                "hosted_zone_id": dr_zone,
+                "role_arn": "arn:aws:iam::222222222222:role/dr"
+            }],
+        })
+        client_spy = mocker.spy(message_processing.sts, "get_route53_client")
+        try:
+            assert routing.get_routing_table().fan_out
+            response = message_processing.process_message(create_recordset_event, context)
+        finally:
+            os.environ.pop("DOMAIN_ROUTES")
+
+        assert response == {"test.api.test.io.": {os.environ["DEST_HOSTED_ZONE_ID"]: True, dr_zone: True}}
+        assert {call.kwargs["role_arn"] for call in client_spy.call_args_list} == {
+            None, "arn:aws:iam::222222222222:role/dr"
+        }
+        for hosted_zone_id in (os.environ["DEST_HOSTED_ZONE_ID"], dr_zone):
+            names = [
+                recordset["Name"] for recordset in route53_client.list_resource_record_sets(
+                    HostedZoneId=hosted_zone_id)["ResourceRecordSets"]
+            ]
+            assert "test.api.test.io." in names
+
+    def test_failed_destination_does_not_block_others(self, context, mocker, route53_client, sts_client,
+                                                      idempotency_table, create_recordset_event):
+        """Test a destination whose role cannot be assumed fails the invocation after the other is written."""
+        dr_zone = route53_client.create_hosted_zone(
+            Name="api.test.io", CallerReference=str(uuid.uuid4()))["HostedZone"]["Id"].replace("/hostedzone/", "")
+        os.environ["DOMAIN_ROUTES"] = json.dumps({
+            "api.test.io": [os.environ["DEST_HOSTED_ZONE_ID"], {
+                "hosted_zone_id": dr_zone,
+                "role_arn": "arn:aws:iam::222222222222:role/dr"
+            }],
+            "dr.api.test.io": {
+                "hosted_zone_id": dr_zone,
+                "role_arn": "arn:aws:iam::222222222222:role/dr"
+            },
+        })
+        get_client = message_processing.sts.get_route53_client
+
+        def get_route53_client(role_arn=None):
+            if role_arn is not None:
+                raise Exception("AccessDenied")
+            return get_client(role_arn=role_arn)
+
+        mocker.patch.object(message_processing.sts, "get_route53_client", side_effect=get_route53_client)
+        save_spy = mocker.spy(message_processing.idempotency, "save_status")
+        event = copy.deepcopy(create_recordset_event)
+        event_changes = event["detail"]["requestParameters"]["changeBatch"]["changes"]
+        event_changes[0]["resourceRecordSet"]["name"] = "f.api.test.io."
+        # routed to the failing destination only
+        event_changes.append(copy.deepcopy(event_changes[0]))
+        event_changes[1]["resourceRecordSet"]["name"] = "g.dr.api.test.io."
+        try:
+            with pytest.raises(Exception) as raised:
+                message_processing.process_message(event, context)
+        finally:
+            os.environ.pop("DOMAIN_ROUTES")
+
+        assert f"hosted zones ['{dr_zone}']" in str(raised.value)
+        assert str({
+            "f.api.test.io.": {os.environ["DEST_HOSTED_ZONE_ID"]: True, dr_zone: False},
+            "g.dr.api.test.io.": False,
+        }) in str(raised.value)
+        dest_records = route53_client.list_resource_record_sets(
+            HostedZoneId=os.environ["DEST_HOSTED_ZONE_ID"])["ResourceRecordSets"]
+        assert "f.api.test.io." in [record["Name"] for record in dest_records]
+        assert save_spy.call_count == 0
+
+    def test_fan_out_delete_reported_under_event_name(self, context, route53_client, sts_client,
+                                                      create_recordset_event):
+        """Test a mirrored DELETE is reported once under its CloudTrail name, not the name listed from the zone."""
+        dr_zone = route53_client.create_hosted_zone(
+            Name="api.test.io", CallerReference=str(uuid.uuid4()))["HostedZone"]["Id"].replace("/hostedzone/", "")
+        os.environ["DOMAIN_ROUTES"] = json.dumps({
+            "api.test.io": [os.environ["DEST_HOSTED_ZONE_ID"], {
+                "hosted_zone_id": dr_zone,
+                "role_arn": "arn:aws:iam::222222222222:role/dr"
+            }],
+        })
+        delete_event = copy.deepcopy(create_recordset_event)
+        delete_event["detail"]["eventID"] = "delete-event"
+        delete_event["detail"]["eventTime"] = "2022-10-31T18:08:37Z"
+        delete_change = delete_event["detail"]["requestParameters"]["changeBatch"]["changes"][0]
+        delete_change["action"] = "DELETE"
+        delete_change["resourceRecordSet"]["name"] = "Test.api.test.io"
+        try:
+            message_processing.process_message(create_recordset_event, context)
+            response = message_processing.process_message(delete_event, context)
+        finally:
+            os.environ.pop("DOMAIN_ROUTES")
+
+        assert response == {"Test.api.test.io": {os.environ["DEST_HOSTED_ZONE_ID"]: True, dr_zone: True}}
+        for hosted_zone_id in (os.environ["DEST_HOSTED_ZONE_ID"], dr_zone):
+            names = [
+                recordset["Name"] for recordset in route53_client.list_resource_record_sets(
+                    HostedZoneId=hosted_zone_id)["ResourceRecordSets"]
+            ]
+            assert "test.api.test.io." not in names
@@ -0,0 +1,83 @@
+import json
+
+import boto3
+import moto
+
+import _utils
+import message_processing
+import routing
+import runtime_config
+import sts
+
+
+def _write(path, document: dict):
+    path.write_text(json.dumps(document))
+
+
+class TestRuntimeConfig:
+    """Test class for the runtime configuration reloaded without a redeploy."""
+    def test_kill_switch_reloaded_after_ttl(self, monkeypatch, tmp_path):
+        """Test the halt flag and routes of the file are cached for the ttl, then picked up without a restart."""
+        config_path = tmp_path / "runtime-config.json"
+        _write(config_path, {"HALT_PROCESSING": "0"})
+        monkeypatch.setenv("RUNTIME_CONFIG_SOURCE", f"file:{config_path}")
+        monkeypatch.setenv("HALT_PROCESSING", "1")
+        monkeypatch.setattr(runtime_config, "RUNTIME_CONFIG_TTL_SECONDS", 3600)
+
+        assert not _utils.stop_processing()
+        _write(config_path, {"HALT_PROCESSING": 1, "DOMAIN_ROUTES": {"api.test.io": "ZRUNTIME"}})
+        assert not _utils.stop_processing()
+
+        monkeypatch.setattr(runtime_config, "RUNTIME_CONFIG_TTL_SECONDS", 0)
+        assert _utils.stop_processing()
+        assert routing.get_routing_table().route("a.api.test.io").hosted_zone_id == "ZRUNTIME"
+
+    def test_routing_table_rebuilt_only_on_reload(self, monkeypatch, mocker, tmp_path):
+        """Test the routes of the document are compiled once per reloaded document, not on every lookup."""
+        config_path = tmp_path / "runtime-config.json"
+        _write(config_path, {"DOMAIN_ROUTES": {"api.test.io": "ZFIRST"}})
+        monkeypatch.setenv("RUNTIME_CONFIG_SOURCE", f"file:{config_path}")
+        monkeypatch.setattr(runtime_config, "RUNTIME_CONFIG_TTL_SECONDS", 3600)
+        get_text_spy = mocker.spy(runtime_config, "get_text")
+
+        for _ in range(3):
+            assert routing.get_routing_table().route("a.api.test.io").hosted_zone_id == "ZFIRST"
+        assert get_text_spy.call_count == 3
+
+        _write(config_path, {"DOMAIN_ROUTES": {"api.test.io": "ZSECOND"}})
+        monkeypatch.setattr(runtime_config, "RUNTIME_CONFIG_TTL_SECONDS", 0)
+        assert routing.get_routing_table().route("a.api.test.io").hosted_zone_id == "ZSECOND"
+        assert get_text_spy.call_count == 6
+
+    def test_failed_reload_keeps_last_document(self, monkeypatch, tmp_path):
+        """Test a broken document keeps the last one it read and falls back to the environment for missing keys."""
+        config_path = tmp_path / "runtime-config.json"
+        _write(config_path, {"HALT_PROCESSING": "1"})
+        monkeypatch.setenv("RUNTIME_CONFIG_SOURCE", f"file:{config_path}")
+        monkeypatch.setenv("COMPANY_DOMAIN_FILTER", "env.test.io")
+        monkeypatch.setattr(runtime_config, "RUNTIME_CONFIG_TTL_SECONDS", 0)
+        assert _utils.stop_processing()
+
+        config_path.write_text("{not json")
+
+        assert _utils.stop_processing()
+        assert runtime_config.get("COMPANY_DOMAIN_FILTER") == "env.test.io"
+
+    def test_batch_limits_from_ssm(self, monkeypatch, mocker, aws_credentials):
+        """Test the ChangeBatch limits are read from an SSM parameter, with one SSM client for every reload."""
+        with moto.mock_ssm():
+            boto3.client("ssm", region_name="us-east-1").put_parameter(
+                Name="/route53-registration/runtime-config", Type="String",
+                Value=json.dumps({"ROUTE53_MAX_BATCH_RECORDS": 2}))
+            monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+            monkeypatch.setenv("RUNTIME_CONFIG_SOURCE", "ssm:/route53-registration/runtime-config")
+            changes = [
+                message_processing.build_alias_change("CREATE", f"test{i}.api.test.io.", "A", "Z26RNL4JYFTOTI",
+                                                      "lb.amazonaws.com") for i in range(5)
+            ]
+            client_spy = mocker.spy(sts.get_boto3_session(), "client")
+
+            assert [len(batch) for batch in message_processing.split_change_batch(changes)] == [2, 2, 1]
+            runtime_config.clear_cache()
+            assert runtime_config.get_int("ROUTE53_MAX_BATCH_RECORDS", 1000) == 2
+            assert client_spy.call_count == 1
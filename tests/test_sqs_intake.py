@@ -0,0 +1,150 @@
+import copy
+import json
+import os
+import uuid
+
+import message_processing
+from handler import sqs_handler
+
+from .conftest import sqs_event
+
+
+def _event_at(event: dict, action: str, event_time: str) -> dict:
+    event = copy.deepcopy(event)
+    event["detail"]["eventTime"] = event_time
+    event["detail"]["requestParameters"]["changeBatch"]["changes"][0]["action"] = action
+    return event
+
+
+class TestSqsIntake:
+    """Test class for the SQS buffered intake."""
+    def test_churn_on_same_record_coalesced_to_last_action(self, context, mocker, route53_client, sts_client,
+                                                           create_recordset_event):
+        """Test create, delete, create of one record within a batch results in a single write."""
+        batch_spy = mocker.spy(message_processing, "change_resource_record_sets_batch")
+        event = sqs_event(
+            _event_at(create_recordset_event, "DELETE", "2022-10-31T18:04:09Z"),
+            _event_at(create_recordset_event, "CREATE", "2022-10-31T18:04:10Z"),
+            _event_at(create_recordset_event, "CREATE", "2022-10-31T18:04:08Z"),
+        )
+
+        response = sqs_handler(event, context)
+
+        assert response == {"batchItemFailures": []}
+        assert batch_spy.call_count == 1
+        assert batch_spy.call_args.kwargs["changes"][0]["Action"] == message_processing.RecordSetChangeAction.create
+        records = route53_client.list_resource_record_sets(HostedZoneId=os.environ["DEST_HOSTED_ZONE_ID"])
+        assert [r["Name"] for r in records["ResourceRecordSets"] if r["Type"] == "A"] == ["test.api.test.io."]
+
+    def test_distinct_records_written_in_one_change_batch(self, context, mocker, route53_client, sts_client,
+                                                          create_recordset_event):
+        """Test changes to different records from many messages share a ChangeBatch."""
+        batch_spy = mocker.spy(message_processing, "change_resource_record_sets_batch")
+        events = []
+        for index in range(5):
+            event = copy.deepcopy(create_recordset_event)
+            event["detail"]["requestParameters"]["changeBatch"]["changes"][0]["resourceRecordSet"][
+                "name"] = f"test{index}.api.test.io."
+            events.append(event)
+
+        assert sqs_handler(sqs_event(*events), context) == {"batchItemFailures": []}
+        assert batch_spy.call_count == 1
+        assert len(batch_spy.call_args.kwargs["changes"]) == 5
+
+    def test_failed_messages_reported_as_partial_batch(self, context, mocker, route53_client, sts_client,
+                                                       create_recordset_event):
+        """Test only the unparsable message and the message of the failing record are redelivered."""
+        failing = copy.deepcopy(create_recordset_event)
+        failing["detail"]["requestParameters"]["changeBatch"]["changes"][0]["resourceRecordSet"][
+            "name"] = "failing.api.test.io."
+        event = sqs_event(create_recordset_event, failing)
+        event["Records"].append({"messageId": "message-broken", "body": "not json"})
+        real_modify = message_processing.modify_route53_change_recordset
+
+        def reject_failing(**kwargs):
+            if kwargs["recordset_name"] == "failing.api.test.io.":
+                raise route53_client.exceptions.InvalidChangeBatch(
+                    operation_name="change_resource_record_sets",
+                    error_response={"Error": {"Message": "[RRSet failing.api.test.io. is not permitted]"}},
+                )
+            return real_modify(**kwargs)
+
+        mocker.patch("message_processing.change_resource_record_sets_batch",
+                     side_effect=route53_client.exceptions.InvalidChangeBatch(
+                         operation_name="change_resource_record_sets",
+                         error_response={"Error": {
+                             "Message": "[RRSet failing.api.test.io. is not permitted]"
+                         }}))
+        mocker.patch("message_processing.modify_route53_change_recordset", side_effect=reject_failing)
+        mocker.patch("message_processing.change_resource_record_sets", return_value={"ChangeInfo": {"Id": "ok"}})
+
+        response = sqs_handler(event, context)
+
+        assert response == {
+            "batchItemFailures": [{
+                "itemIdentifier": "message-1"
+            }, {
+                "itemIdentifier": "message-broken"
+            }]
+        }
+
+    def test_failed_destination_reported_as_partial_batch(self, context, mocker, route53_client, sts_client,
+                                                          create_recordset_event):
+        """Test a destination failing to be read redelivers only its messages, the other destination is written."""
+        other_zone = route53_client.create_hosted_zone(
+            Name="other.api.test.io", CallerReference=str(uuid.uuid4()))["HostedZone"]["Id"].replace("/hostedzone/", "")
+        other = copy.deepcopy(create_recordset_event)
+        other["detail"]["requestParameters"]["changeBatch"]["changes"][0]["resourceRecordSet"][
+            "name"] = "test.other.api.test.io."
+        real_fetch = message_processing.recordset_diff.fetch_current_records
+
+        def fail_other_zone(route53_client, hosted_zone_id, names, **kwargs):
+            if hosted_zone_id == other_zone:
+                raise Exception("AccessDenied")
+            return real_fetch(route53_client, hosted_zone_id, names, **kwargs)
+
+        mocker.patch.object(message_processing.recordset_diff, "fetch_current_records", side_effect=fail_other_zone)
+        os.environ["DOMAIN_ROUTES"] = json.dumps({
+            "api.test.io": os.environ["DEST_HOSTED_ZONE_ID"],
+            "other.api.test.io": {"hosted_zone_id": other_zone, "role_arn": "arn:aws:iam::222222222222:role/other"},
+        })
+        try:
+            response = sqs_handler(sqs_event(create_recordset_event, other), context)
+        finally:
+            os.environ.pop("DOMAIN_ROUTES")
+
+        assert response == {"batchItemFailures": [{"itemIdentifier": "message-1"}]}
+        records = route53_client.list_resource_record_sets(HostedZoneId=os.environ["DEST_HOSTED_ZONE_ID"])
+        assert "test.api.test.io." in [r["Name"] for r in records["ResourceRecordSets"]]
+
+    def test_failed_secondary_zone_redelivered_until_written(self, context, mocker, route53_client, sts_client,
+                                                             create_recordset_event):
+        """Test a mirrored change whose secondary zone failed is not saved as completed, so its redelivery writes it."""
+        dr_zone = route53_client.create_hosted_zone(
+            Name="api.test.io", CallerReference=str(uuid.uuid4()))["HostedZone"]["Id"].replace("/hostedzone/", "")
+        real_fetch = message_processing.recordset_diff.fetch_current_records
+        failing_zones = {dr_zone}
+
+        def fail_dr_zone(route53_client, hosted_zone_id, names, **kwargs):
+            if hosted_zone_id in failing_zones:
+                raise Exception("AccessDenied")
+            return real_fetch(route53_client, hosted_zone_id, names, **kwargs)
+
+        mocker.patch.object(message_processing.recordset_diff, "fetch_current_records", side_effect=fail_dr_zone)
+        os.environ["DOMAIN_ROUTES"] = json.dumps({
+            "api.test.io": [os.environ["DEST_HOSTED_ZONE_ID"], {
+                "hosted_zone_id": dr_zone,
+                "role_arn": "arn:aws:iam::222222222222:role/dr"
+            }],
+        })
+        try:
+            first = sqs_handler(sqs_event(create_recordset_event), context)
+            failing_zones.clear()
+            redelivery = sqs_handler(sqs_event(create_recordset_event), context)
+        finally:
+            os.environ.pop("DOMAIN_ROUTES")
+
+        assert first == {"batchItemFailures": [{"itemIdentifier": "message-0"}]}
+        assert redelivery == {"batchItemFailures": []}
+        records = route53_client.list_resource_record_sets(HostedZoneId=dr_zone)
+        assert "test.api.test.io." in [r["Name"] for r in records["ResourceRecordSets"] if r["Type"] == "A"]
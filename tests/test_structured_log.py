@@ -0,0 +1,70 @@
+import copy
+import json
+import logging
+
+import message_processing
+import structured_log
+
+
+def _change_lines(caplog) -> list:
+    return [
+        json.loads(record.getMessage()) for record in caplog.records
+        if record.getMessage().startswith('{"message":"Processing change"')
+    ]
+
+
+class TestStructuredLog:
+    """Test class for the bounded structured logging."""
+    def test_one_compact_line_per_change(self, caplog, monkeypatch, create_recordset_event):
+        """Test every change logs one JSON line of its key fields and the unsampled event is not dumped."""
+        monkeypatch.setattr(structured_log, "LOG_EVENT_SAMPLE_RATE", 0.0)
+        event = copy.deepcopy(create_recordset_event)
+        changes = event["detail"]["requestParameters"]["changeBatch"]["changes"]
+        changes.append(copy.deepcopy(changes[0]))
+        changes[1]["resourceRecordSet"]["name"] = "other.example.com."
+
+        with caplog.at_level(logging.INFO):
+            message_processing.filter_event_changes(event, {})
+
+        lines = _change_lines(caplog)
+        assert [line["change_index"] for line in lines] == [0, 1]
+        assert lines[0]["event_id"] == event["detail"]["eventID"]
+        assert lines[1]["name"] == "other.example.com."
+        assert {"action", "type", "alias_target"} <= set(lines[0])
+        assert not any("requestParameters" in record.getMessage() for record in caplog.records)
+
+    def test_verbose_mode_dumps_event(self, caplog, monkeypatch, create_recordset_event):
+        """Test LOG_MODE=verbose keeps the full event dump of every change."""
+        monkeypatch.setenv("LOG_MODE", "verbose")
+
+        with caplog.at_level(logging.INFO):
+            message_processing.filter_event_changes(create_recordset_event, {})
+
+        assert not _change_lines(caplog)
+        assert any("requestParameters" in record.getMessage() for record in caplog.records)
+
+    def test_fields_and_events_capped(self, caplog, monkeypatch):
+        """Test long fields and sampled events are truncated to their caps."""
+        monkeypatch.setattr(structured_log, "LOG_MAX_FIELD_CHARS", 10)
+        monkeypatch.setattr(structured_log, "LOG_MAX_EVENT_CHARS", 50)
+        monkeypatch.setattr(structured_log, "LOG_EVENT_SAMPLE_RATE", 1.0)
+        logger = logging.getLogger("test_structured_log")
+
+        with caplog.at_level(logging.INFO, logger="test_structured_log"):
+            structured_log.info(logger, "Processing change", name="x" * 100)
+            structured_log.sample_event(logger, {"detail": "y" * 1000}, "TEST")
+
+        field_line, event_line = [record.getMessage() for record in caplog.records]
+        assert json.loads(field_line)["name"] == "x" * 10 + "...<90 more>"
+        assert len(event_line) < 200
+
+    def test_formatting_lazy(self, mocker):
+        """Test nothing is serialized when INFO is disabled."""
+        dumps = mocker.spy(structured_log.json, "dumps")
+        logger = logging.getLogger("test_structured_log_lazy")
+        logger.setLevel(logging.WARNING)
+
+        structured_log.info(logger, "Processing change", name="a.api.test.io.")
+        structured_log.log_failed_event(logger, {"detail": {}})
+
+        dumps.assert_not_called()
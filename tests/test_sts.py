@@ -0,0 +1,58 @@
+import datetime
+import threading
+
+from botocore.exceptions import ClientError
+
+import ratelimit
+import sts
+
+
+class TestSts:
+    """Test class for the assumed role session cache."""
+    def test_role_session_is_cached_across_invocations(self, context, sts_client, mocker):
+        """Test we only assume the role once for repeated calls."""
+        assume_role_spy = mocker.spy(sts, "_assume_role")
+        first = sts.get_sts_role_session()
+        second = sts.get_sts_role_session()
+        assert first == second
+        assert assume_role_spy.call_count == 1
+        assert sts.get_cache_stats() == {"hits": 1, "misses": 1, "refreshes": 0}
+
+    def test_route53_client_is_reused(self, context, sts_client):
+        """Test the same Route53 client is handed out while the credentials are valid."""
+        assert sts.get_route53_client() is sts.get_route53_client()
+
+    def test_role_session_refreshed_before_expiry(self, context, sts_client, mocker):
+        """Test credentials inside the refresh margin are assumed again."""
+        client = sts.get_route53_client()
+        expiration = sts._session_cache[context.context.os["environ"]["ASSUME_ROLE_ARN"]]["credentials"]["Expiration"]
+        mocker.patch("sts._utcnow",
+                     return_value=expiration - datetime.timedelta(seconds=sts.STS_REFRESH_MARGIN_SECONDS - 1))
+        assert sts.get_route53_client() is not client
+        assert sts.get_cache_stats()["refreshes"] == 1
+
+    def test_concurrent_callers_assume_role_once(self, context, sts_client, mocker):
+        """Test concurrent cold callers share a single assume role call."""
+        assume_role_spy = mocker.spy(sts, "_assume_role")
+        threads = [threading.Thread(target=sts.get_route53_client) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert assume_role_spy.call_count == 1
+        assert sts.get_cache_stats()["misses"] == 1
+
+    def test_clients_leave_retries_to_the_rate_limiter(self, context, sts_client, mocker):
+        """Test the clients make a single attempt and a throttled assume role is retried by the rate limiter."""
+        mocker.patch("ratelimit._sleep")
+        throttled = ClientError(error_response={"Error": {"Code": "Throttling", "Message": "Rate exceeded"}},
+                                operation_name="AssumeRole")
+        assumed = sts_client.assume_role(RoleArn=sts.get_adler_cross_account_iam(), RoleSessionName="test")
+        assume_role = mocker.patch.object(sts.get_sts_client(), "assume_role", side_effect=[throttled, assumed])
+
+        route53_client = sts.get_route53_client()
+
+        assert assume_role.call_count == 2
+        assert ratelimit.get_stats()["throttles"] == 1
+        for client in (route53_client, sts.get_sts_client()):
+            assert client.meta.config.retries == {"mode": "standard", "total_max_attempts": 1}